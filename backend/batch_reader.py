@@ -0,0 +1,167 @@
+"""
+Lecturas masivas adaptativas (`read` por ids) contra Odoo.
+
+- El tamaño de lote se ajusta con lo observado en cada respuesta: apunta a
+  ~BATCH_TARGET_SECONDS por llamada y a no más de BATCH_MAX_BYTES por
+  respuesta, y se recuerda por modelo entre sincronizaciones.
+- Un lote que falla (error de Odoo, timeout o error de red) se parte en dos y
+  se reintenta con backoff exponencial; un id suelto se reintenta hasta
+  BATCH_MAX_ATTEMPTS veces.
+- Los ids que finalmente no se pudieron leer se devuelven aparte para que el
+  llamador decida (p. ej. usar la copia del maestro local) en vez de que
+  desaparezcan en silencio del snapshot.
+
+Para search_read sin límite, stream_search_read pagina por id (keyset) en
+varios rangos de ids en paralelo y entrega cada página a un callback, sin
+acumular el resultado completo en memoria.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+BATCH_MIN, BATCH_MAX = 25, 2000
+BATCH_TARGET_SECONDS = 2.0
+BATCH_MAX_BYTES = 4_000_000
+BATCH_MAX_ATTEMPTS = 4
+BACKOFF_BASE, BACKOFF_MAX = 0.5, 8.0
+# Consecutive failures (without any success in between) before giving up on the whole read
+GIVE_UP_AFTER = 8
+
+_batch_sizes = {}  # model -> learned batch size
+
+
+def batch_size(model, default=500):
+    return _batch_sizes.get(model, default)
+
+
+def _next_size(size, rows, seconds, nbytes):
+    """Nuevo tamaño a partir de un lote exitoso: el más restrictivo entre tiempo y bytes, sin más que duplicar."""
+    if not rows: return size
+    by_time = rows * BATCH_TARGET_SECONDS / max(seconds, 0.05)
+    by_bytes = rows * BATCH_MAX_BYTES / max(nbytes, 1)
+    target = min(by_time, by_bytes, size * 2)
+    return int(max(BATCH_MIN, min(BATCH_MAX, (size + target) / 2)))
+
+
+async def read_batched(client, model, ids, fields, concurrency=4, default_size=500):
+    """
+    Lee `ids` de `model` en lotes adaptativos con `concurrency` lecturas en vuelo.
+
+    Devuelve (records, failed_ids).
+    """
+    ids = list(ids)
+    if not ids: return [], []
+    state = {"size": batch_size(model, default_size), "pos": 0, "consecutive_failures": 0, "calls": 0, "splits": 0}
+    retry = deque()  # (ids, attempt)
+    records, failed = [], []
+
+    def next_chunk():
+        if retry: return retry.popleft()
+        if state["pos"] >= len(ids): return None
+        chunk = ids[state["pos"]:state["pos"] + state["size"]]
+        state["pos"] += len(chunk)
+        return chunk, 0
+
+    async def worker():
+        while True:
+            if state["consecutive_failures"] >= GIVE_UP_AFTER: return
+            item = next_chunk()
+            if item is None: return
+            chunk, attempt = item
+            started = time.perf_counter()
+            try:
+                res, nbytes = await client.call_kw(model, "read", [chunk], {"fields": fields}, with_size=True)
+                error = None if res is not None else "odoo error"
+            except Exception as e:
+                res, nbytes, error = None, 0, f"{type(e).__name__}: {e}"
+            state["calls"] += 1
+
+            if error is None:
+                state["consecutive_failures"] = 0
+                records.extend(res)
+                state["size"] = _next_size(state["size"], len(chunk), time.perf_counter() - started, nbytes)
+                continue
+
+            state["consecutive_failures"] += 1
+            state["size"] = max(BATCH_MIN, state["size"] // 2)
+            if len(chunk) == 1 and attempt + 1 >= BATCH_MAX_ATTEMPTS:
+                logger.warning(f"Batch reader: giving up on {model} id {chunk[0]} after {attempt + 1} attempts ({error})")
+                failed.extend(chunk)
+                continue
+            await asyncio.sleep(min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5))
+            if len(chunk) > 1:
+                state["splits"] += 1
+                half = len(chunk) // 2
+                retry.append((chunk[:half], attempt + 1))
+                retry.append((chunk[half:], attempt + 1))
+            else:
+                retry.append((chunk, attempt + 1))
+
+    await asyncio.gather(*[worker() for _ in range(max(1, concurrency))])
+
+    if state["consecutive_failures"] >= GIVE_UP_AFTER:
+        # Odoo is not answering at all: everything still pending is reported as failed
+        failed.extend(i for chunk, _ in retry for i in chunk)
+        failed.extend(ids[state["pos"]:])
+        logger.error(f"Batch reader: {model} aborted after {GIVE_UP_AFTER} consecutive failures")
+    _batch_sizes[model] = state["size"]
+    if failed or state["splits"]:
+        logger.warning(f"Batch reader: {model} read {len(records)}/{len(ids)} in {state['calls']} calls, "
+                       f"{state['splits']} splits, {len(failed)} ids given up")
+    return records, failed
+
+
+async def _call_with_retry(client, model, method, args, kwargs):
+    for attempt in range(BATCH_MAX_ATTEMPTS):
+        try:
+            res = await client.call_kw(model, method, args, kwargs)
+            if res is not None: return res
+        except Exception as e:
+            logger.warning(f"{model}.{method} failed ({type(e).__name__}: {e}), attempt {attempt + 1}/{BATCH_MAX_ATTEMPTS}")
+        if attempt + 1 < BATCH_MAX_ATTEMPTS:
+            await asyncio.sleep(min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5))
+    return None
+
+
+async def stream_search_read(client, model, domain, fields, on_page, page_size=2000, partitions=4):
+    """
+    search_read completo de `domain` paginado por id: [('id', '>', último)] ordenado por id.
+
+    El rango de ids [min, max] se reparte en `partitions` tramos que se paginan
+    en paralelo; cada página se entrega a `on_page(rows)` apenas llega.
+    Devuelve (filas, completo); completo es False si alguna página agotó los reintentos.
+    """
+    first, last = await asyncio.gather(
+        _call_with_retry(client, model, "search", [domain], {"limit": 1, "order": "id asc"}),
+        _call_with_retry(client, model, "search", [domain], {"limit": 1, "order": "id desc"})
+    )
+    if first is None or last is None: return 0, False
+    if not first: return 0, True
+    lo, hi = first[0], last[0]
+    step = max(1, (hi - lo + partitions) // partitions)
+    bounds = [(a, min(hi, a + step - 1)) for a in range(lo, hi + 1, step)]
+    state = {"rows": 0, "complete": True}
+    fields = list(fields) if "id" in fields else list(fields) + ["id"]
+
+    async def walk(a, b):
+        cursor = a - 1
+        while cursor < b:
+            page = await _call_with_retry(client, model, "search_read", [domain + [('id', '>', cursor), ('id', '<=', b)]],
+                                          {"fields": fields, "limit": page_size, "order": "id asc"})
+            if page is None:
+                logger.error(f"Keyset stream: {model} ids ({cursor}, {b}] could not be read")
+                state["complete"] = False
+                return
+            if not page: return
+            on_page(page)
+            state["rows"] += len(page)
+            if len(page) < page_size: return
+            cursor = page[-1]["id"]
+
+    await asyncio.gather(*[walk(a, b) for a, b in bounds])
+    return state["rows"], state["complete"]
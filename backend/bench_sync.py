@@ -0,0 +1,92 @@
+"""
+Benchmark de extremo a extremo de fetch_active_products_data contra el Odoo falso.
+
+    python bench_sync.py --spawn --products 50000 --latency 40 --runs 3 --touch 200
+
+--spawn levanta fake_odoo.py en un subproceso (los argumentos desconocidos se
+le pasan tal cual); sin --spawn usa el servidor de --url. La primera corrida es
+completa y las siguientes incrementales; el caché, el maestro y el libro de
+ventas se escriben en un directorio temporal para no pisar los reales.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def wait_ready(url, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/fake/stats", timeout=5) as r:
+                return json.loads(r.read())
+        except OSError:
+            time.sleep(0.5)
+    raise SystemExit(f"Fake Odoo not ready at {url} after {timeout}s")
+
+
+def touch(url, count):
+    req = urllib.request.Request(f"{url}/fake/touch?model=product.product&count={count}", method="POST")
+    with urllib.request.urlopen(req, timeout=30) as r:
+        return json.loads(r.read())["touched"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Odoo sync against fake_odoo.py")
+    parser.add_argument("--url", default="http://127.0.0.1:8069")
+    parser.add_argument("--spawn", action="store_true", help="start fake_odoo.py with the remaining arguments")
+    parser.add_argument("--runs", type=int, default=3, help="1 full sync + N-1 incremental syncs")
+    parser.add_argument("--touch", type=int, default=0, help="products edited in Odoo before each incremental sync")
+    parser.add_argument("--ready-timeout", type=float, default=600)
+    args, fake_args = parser.parse_known_args()
+
+    proc = None
+    if args.spawn:
+        port = args.url.rsplit(":", 1)[-1].strip("/")
+        proc = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, "fake_odoo.py"), "--port", port] + fake_args)
+    try:
+        info = wait_ready(args.url, args.ready_timeout)
+        print(f"Fake Odoo ({info['mode']}): {json.dumps(info.get('records'))}")
+
+        # main.py reads the connection settings at import time
+        os.environ.update({"ODOO_URL": args.url, "ODOO_DB": "fake", "ODOO_USER": "bench", "ODOO_PASS": "bench"})
+        sys.path.insert(0, BASE_DIR)
+        import main as app_main
+        import sync_metrics
+
+        workdir = tempfile.mkdtemp(prefix="stockpro_bench_")
+        app_main.CACHE_FILE = os.path.join(workdir, "last_sync_cache.json")
+        app_main.PRODUCT_MASTER_DB = os.path.join(workdir, "last_sync_master.db")
+        app_main.SALES_LEDGER_DB = os.path.join(workdir, "last_sync_ledger.db")
+        app_main.topology = app_main.TopologyRegistry(os.path.join(workdir, "last_sync_topology.json"))
+        app_main.snapshots = app_main.SnapshotStore(os.path.join(workdir, "snapshots"), legacy_path=app_main.CACHE_FILE)
+
+        for run in range(args.runs):
+            if run and args.touch: touch(args.url, args.touch)
+            t0 = time.perf_counter()
+            data = app_main.fetch_active_products_data(full=(run == 0))
+            elapsed = time.perf_counter() - t0
+            rec = sync_metrics.history(1)[-1]
+            calls = rec["odoo_calls"]
+            print(f"\nRun {run + 1} ({rec['mode']}, {rec['status']}): {elapsed:.2f}s, {len(data['products']) if data else 0} products, "
+                  f"{sum(c['count'] for c in calls.values())} Odoo calls, {sum(c['bytes'] for c in calls.values()) / 1e6:.1f} MB")
+            for name, t in sorted(rec["phases"].items(), key=lambda kv: kv[1]["start"]):
+                print(f"  {name:<16} start={t['start']:>7.2f}s duration={t['duration']:>7.2f}s")
+            print(f"  critical path: {' -> '.join(rec['critical_path'])}")
+            for name, c in sorted(calls.items(), key=lambda kv: -kv[1]["seconds"])[:8]:
+                print(f"  {name:<36} calls={c['count']:<5} rows={c['rows']:<8} {c['seconds']:.2f}s")
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Circuit breaker para las llamadas a Odoo.
+
+Registra el resultado y la latencia de cada llamada en una ventana móvil. El
+circuito se abre si en la ventana hay al menos `min_calls` llamadas y la
+proporción de errores (o de llamadas lentas) supera `failure_rate`, o si
+fallan `max_consecutive` llamadas seguidas (Odoo se cae justo después de una
+sincronización que llenó la ventana de éxitos). Abierto, durante `cooldown`
+segundos las llamadas fallan al instante con CircuitOpenError en lugar de
+esperar el timeout, y los endpoints sirven lo último que tenían.
+
+Pasado el cooldown el circuito queda semiabierto: una sola llamada de prueba
+pasa; si sale bien se cierra, si falla se vuelve a abrir con el doble de
+cooldown (hasta `max_cooldown`). check()/allow() devuelven un ticket que la
+llamada pasa a record(): en semiabierto sólo cuenta el resultado de la prueba,
+no el de llamadas que salieron antes de abrirse el circuito y terminan tarde.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} circuit open (retry in {retry_after:.0f}s)")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name, window=60.0, min_calls=5, failure_rate=0.5, max_consecutive=5, slow_call_seconds=30.0,
+                 cooldown=30.0, max_cooldown=300.0, probe_timeout=None):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.max_consecutive = max_consecutive
+        self.slow_call_seconds = slow_call_seconds
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        # A probe that never reports back (cancelled task) frees the slot after this long
+        self.probe_timeout = probe_timeout or slow_call_seconds * 2
+        self._calls = deque()  # (monotonic ts, ok, slow)
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.cooldown = cooldown
+        self.opened_at = None
+        self._probe, self._probe_started = None, None
+        self.last_failure = None
+        self.consecutive = 0
+        self.trips = 0
+
+    def allow(self):
+        """Ticket para record() si la llamada puede salir (en semiabierto sólo la de prueba), o None."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == CLOSED: return True
+            if self.state == OPEN:
+                if now - self.opened_at < self.cooldown: return None
+                self.state = HALF_OPEN
+                logger.info(f"Circuit {self.name}: half-open, sending a probe")
+            if self._probe_started is not None and now - self._probe_started < self.probe_timeout: return None
+            self._probe, self._probe_started = object(), now
+            return self._probe
+
+    def check(self):
+        """Como allow(), pero lanza CircuitOpenError."""
+        ticket = self.allow()
+        if ticket is None:
+            raise CircuitOpenError(self.name, self.retry_after())
+        return ticket
+
+    def retry_after(self):
+        if self.state != OPEN: return 0.0
+        return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def record(self, ok, duration, error=None, ticket=None, slow_after=None):
+        """
+        Resultado de una llamada: `ok` False para errores de transporte / servidor caído.
+        `ticket` es lo que devolvió check()/allow() para esa llamada; `slow_after`
+        reemplaza a `slow_call_seconds` para llamadas a las que se les permite tardar más.
+        """
+        slow = duration >= (slow_after or self.slow_call_seconds)
+        with self._lock:
+            now = time.monotonic()
+            # Half-open: only the probe decides; late results of calls sent before the circuit opened are ignored
+            if self.state == HALF_OPEN and (ticket is None or ticket is not self._probe): return
+            if not ok: self.last_failure = error
+            self.consecutive = 0 if ok else self.consecutive + 1
+            if self.state == HALF_OPEN:
+                self._probe, self._probe_started = None, None
+                if ok and not slow:
+                    self.state, self.cooldown, self._calls = CLOSED, self.base_cooldown, deque()
+                    logger.info(f"Circuit {self.name}: probe succeeded, closed")
+                else:
+                    self._open(now, min(self.cooldown * 2, self.max_cooldown))
+                return
+            self._calls.append((now, ok, slow))
+            while self._calls and now - self._calls[0][0] > self.window:
+                self._calls.popleft()
+            if self.state != CLOSED: return
+            if self.consecutive >= self.max_consecutive:
+                self._open(now, self.base_cooldown)
+                return
+            if len(self._calls) < self.min_calls: return
+            failures = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+            slow_calls = sum(1 for _, _, call_slow in self._calls if call_slow)
+            if max(failures, slow_calls) / len(self._calls) >= self.failure_rate:
+                self._open(now, self.base_cooldown)
+
+    def _open(self, now, cooldown):
+        self.state, self.opened_at, self.cooldown = OPEN, now, cooldown
+        self.trips += 1
+        logger.warning(f"Circuit {self.name}: open for {cooldown:.0f}s (last failure: {self.last_failure})")
+
+    def status(self):
+        with self._lock:
+            calls = len(self._calls)
+            failures = sum(1 for _, ok, _ in self._calls if not ok)
+            return {"state": self.state, "retry_after": round(self.retry_after(), 1), "window_calls": calls,
+                    "window_failures": failures, "trips": self.trips, "last_failure": self.last_failure}
@@ -0,0 +1,256 @@
+"""
+Codificación columnar binaria del snapshot de productos (alternativa al JSON).
+
+El JSON repite en cada fila las mismas claves y los mismos ids de almacén como
+texto; acá cada campo de producto es una columna y los mapas por almacén son
+matrices densas productos x almacenes. Se lee sin parsear: en Python con mmap
++ memoryview.cast, en el navegador con DataView / TypedArray sobre el mismo
+ArrayBuffer (ver frontend/src/columnar.ts).
+
+Layout (todo little-endian):
+
+    0   8 bytes   magic b"SPCOL1\\0\\0"
+    8   u32       largo del encabezado JSON (H)
+    12  H bytes   encabezado JSON UTF-8, con espacios de relleno hasta múltiplo de 8
+    ..            sección de datos: buffers alineados a 8 bytes
+
+Encabezado:
+
+    {"format": "stockpro-columnar", "layout": 1, "rows": N,
+     "warehouses": ["1", "2", ...],          # eje de columnas de las matrices (W)
+     "fields": {...},                        # campos de primer nivel salvo "products"
+     "columns": [{"name": ..., "kind": ..., <buffers>}, ...]}
+
+Cada buffer es {"dtype": "f64"|"i32"|"u8"|"u16"|"u32", "offset": <desde el inicio
+de la sección de datos>, "count": <elementos>}. Tipos de columna:
+
+- f64:  "values" (N); "present" (u8, N) sólo si hay nulos
+- i32:  "values" (N)
+- dict: "codes" (N) índices en "dictionary" (lista JSON del encabezado; puede incluir null)
+- dict_list: "offsets" (u32, N+1) y "codes"; fila i = codes[offsets[i]:offsets[i+1]]
+- matrix: "values" (f64, N*W, fila por producto) y "present" (u8, N*W): una
+  celda se decodifica si la clave existía, aunque su valor sea 0 (sin
+  "present", archivos anteriores: sólo las celdas distintas de 0)
+- struct_matrix: "present" (u8, N*W) y "fields": {subcampo: columna f64 o dict
+  de N*W elementos}; p. ej. abc_by_wh -> category, rotation, revenue, val_rot, val_rev
+- json: "offsets" (u32, N+1) y "data" (u8): JSON UTF-8 de cada fila (pending_orders)
+"""
+
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+MAGIC = b"SPCOL1\0\0"
+MEDIA_TYPE = "application/x-stockpro-columnar"
+_TYPECODES = {"f64": "d", "i32": "i", "u8": "B", "u16": "H", "u32": "I"}
+_WIDTHS = {"f64": 8, "i32": 4, "u8": 1, "u16": 2, "u32": 4}
+
+
+def _is_number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def _code_dtype(size):
+    return "u8" if size <= 0xFF else ("u16" if size <= 0xFFFF else "u32")
+
+
+def _wh_sort_key(wh):
+    return (0, int(wh)) if str(wh).isdigit() else (1, str(wh))
+
+
+def _kind(values):
+    present = [v for v in values if v is not None]
+    if not present: return "json"
+    if all(_is_number(v) for v in present):
+        if len(present) == len(values) and all(isinstance(v, int) and -2**31 <= v < 2**31 for v in present): return "i32"
+        return "f64"
+    if all(isinstance(v, str) for v in values): return "dict"
+    if all(isinstance(v, list) and all(isinstance(x, str) for x in v) for v in values): return "dict_list"
+    if all(isinstance(v, dict) for v in values):
+        inner = [x for v in values for x in v.values()]
+        if all(_is_number(x) for x in inner): return "matrix"
+        if all(isinstance(x, dict) and all(_is_number(y) or isinstance(y, str) for y in x.values()) for x in inner): return "struct_matrix"
+    return "json"
+
+
+class _Writer:
+    def __init__(self):
+        self.chunks, self.size = [], 0
+
+    def add(self, dtype, values):
+        """Agrega un buffer alineado a 8 bytes y devuelve su referencia para el encabezado."""
+        if dtype == "u8":
+            data = bytes(values)
+        else:
+            arr = array(_TYPECODES[dtype], values)
+            if sys.byteorder != "little": arr.byteswap()
+            data = arr.tobytes()
+        ref = {"dtype": dtype, "offset": self.size, "count": len(values)}
+        pad = (-len(data)) % 8
+        self.chunks.append(data + b"\0" * pad)
+        self.size += len(data) + pad
+        return ref
+
+    def add_codes(self, values):
+        dictionary, codes = {}, []
+        for v in values:
+            codes.append(dictionary.setdefault(v, len(dictionary)))
+        return self.add(_code_dtype(len(dictionary)), codes), list(dictionary)
+
+
+def encode(data):
+    """Bytes del snapshot `data` ({..., "products": [...]}) en el layout columnar."""
+    products = data.get("products", [])
+    n = len(products)
+    names = []
+    for p in products:
+        for k in p:
+            if k not in names: names.append(k)
+    by_name = {name: [p.get(name) for p in products] for name in names}
+    kinds = {name: _kind(values) for name, values in by_name.items()}
+    warehouses = sorted({str(wh) for name, values in by_name.items() if kinds[name] in ("matrix", "struct_matrix")
+                         for v in values for wh in v}, key=_wh_sort_key)
+    wh_pos = {wh: j for j, wh in enumerate(warehouses)}
+    w = len(warehouses)
+
+    out, columns = _Writer(), []
+    for name in names:
+        values, kind = by_name[name], kinds[name]
+        col = {"name": name, "kind": kind}
+        if kind == "i32":
+            col["values"] = out.add("i32", values)
+        elif kind == "f64":
+            col["values"] = out.add("f64", [float(v) if v is not None else 0.0 for v in values])
+            if any(v is None for v in values):
+                col["present"] = out.add("u8", [0 if v is None else 1 for v in values])
+        elif kind == "dict":
+            col["codes"], col["dictionary"] = out.add_codes(values)
+        elif kind == "dict_list":
+            offsets, flat = [0], []
+            for v in values:
+                flat.extend(v)
+                offsets.append(len(flat))
+            col["offsets"] = out.add("u32", offsets)
+            col["codes"], col["dictionary"] = out.add_codes(flat)
+        elif kind == "matrix":
+            dense, present = [0.0] * (n * w), [0] * (n * w)
+            for i, v in enumerate(values):
+                for wh, x in v.items():
+                    cell = i * w + wh_pos[str(wh)]
+                    dense[cell], present[cell] = float(x), 1
+            col["values"] = out.add("f64", dense)
+            col["present"] = out.add("u8", present)
+        elif kind == "struct_matrix":
+            present = [0] * (n * w)
+            subfields = {}
+            for i, v in enumerate(values):
+                for wh, entry in v.items():
+                    cell = i * w + wh_pos[str(wh)]
+                    present[cell] = 1
+                    for sub, x in entry.items():
+                        subfields.setdefault(sub, {})[cell] = x
+            col["present"] = out.add("u8", present)
+            col["fields"] = {}
+            for sub, cells in subfields.items():
+                if all(_is_number(x) for x in cells.values()):
+                    col["fields"][sub] = {"kind": "f64", "values": out.add("f64", [float(cells.get(c, 0.0)) for c in range(n * w)])}
+                else:
+                    codes, dictionary = out.add_codes([cells.get(c) for c in range(n * w)])
+                    col["fields"][sub] = {"kind": "dict", "codes": codes, "dictionary": dictionary}
+        else:
+            offsets, blob = [0], bytearray()
+            for v in values:
+                blob += json.dumps(v, separators=(",", ":")).encode("utf-8")
+                offsets.append(len(blob))
+            col["offsets"] = out.add("u32", offsets)
+            col["data"] = out.add("u8", blob)
+        columns.append(col)
+
+    header = json.dumps({"format": "stockpro-columnar", "layout": 1, "rows": n, "warehouses": warehouses,
+                         "fields": {k: v for k, v in data.items() if k != "products"}, "columns": columns}).encode("utf-8")
+    header += b" " * ((-(len(MAGIC) + 4 + len(header))) % 8)
+    return b"".join([MAGIC, struct.pack("<I", len(header)), header] + out.chunks)
+
+
+class ColumnarSnapshot:
+    """
+    Lector del layout columnar sobre bytes o un archivo mapeado en memoria:
+    las columnas numéricas son memoryviews sobre el mismo buffer, sin copias.
+    """
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        view = memoryview(buffer)
+        if bytes(view[:8]) != MAGIC:
+            raise ValueError("not a stockpro columnar snapshot")
+        (header_len,) = struct.unpack_from("<I", view, 8)
+        self.header = json.loads(bytes(view[12:12 + header_len]))
+        self._data = view[12 + header_len:]
+        self.rows = self.header["rows"]
+        self.warehouses = self.header["warehouses"]
+        self.fields = self.header["fields"]
+        self.columns = {c["name"]: c for c in self.header["columns"]}
+
+    @classmethod
+    def open(cls, path):
+        """Mapea el archivo (sólo lectura); el mmap vive mientras viva el objeto."""
+        with open(path, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def array(self, ref, shape=None):
+        """memoryview tipado de un buffer (native little-endian), opcionalmente con forma."""
+        raw = self._data[ref["offset"]:ref["offset"] + ref["count"] * _WIDTHS[ref["dtype"]]]
+        if ref["dtype"] == "u8" and shape is None: return raw
+        return raw.cast(_TYPECODES[ref["dtype"]], shape) if shape else raw.cast(_TYPECODES[ref["dtype"]])
+
+    def column(self, name):
+        """memoryview de una columna numérica (f64 / i32), o (codes, dictionary) de una dict."""
+        col = self.columns[name]
+        if col["kind"] in ("f64", "i32"): return self.array(col["values"])
+        if col["kind"] == "dict": return self.array(col["codes"]), col["dictionary"]
+        raise TypeError(f"column {name} is {col['kind']}")
+
+    def matrix(self, name, field=None):
+        """memoryview N x W de una columna matrix (o de un subcampo de struct_matrix)."""
+        col = self.columns[name]
+        ref = col["values"] if field is None else col["fields"][field].get("values") or col["fields"][field]["codes"]
+        return self.array(ref, [self.rows, len(self.warehouses)]) if self.rows and self.warehouses else self.array(ref)
+
+    def _decoder(self, col):
+        """Función fila -> valor JSON equivalente al snapshot original."""
+        kind = col["kind"]
+        w, whs = len(self.warehouses), self.warehouses
+        if kind in ("f64", "i32"):
+            values = self.array(col["values"])
+            present = self.array(col["present"]) if "present" in col else None
+            return lambda i: None if present is not None and not present[i] else values[i]
+        if kind == "dict":
+            codes, dictionary = self.array(col["codes"]), col["dictionary"]
+            return lambda i: dictionary[codes[i]]
+        if kind == "dict_list":
+            offsets, codes, dictionary = self.array(col["offsets"]), self.array(col["codes"]), col["dictionary"]
+            return lambda i: [dictionary[c] for c in codes[offsets[i]:offsets[i + 1]]]
+        if kind == "matrix":
+            values = self.array(col["values"])
+            present = self.array(col["present"]) if "present" in col else values
+            return lambda i: {whs[j]: values[i * w + j] for j in range(w) if present[i * w + j]}
+        if kind == "struct_matrix":
+            present = self.array(col["present"])
+            subs = {sub: (self.array(f["values"]), None) if f["kind"] == "f64" else (self.array(f["codes"]), f["dictionary"])
+                    for sub, f in col["fields"].items()}
+
+            def cell(c):
+                return {sub: (arr[c] if dictionary is None else dictionary[arr[c]]) for sub, (arr, dictionary) in subs.items()}
+            return lambda i: {whs[j]: cell(i * w + j) for j in range(w) if present[i * w + j]}
+        offsets, blob = self.array(col["offsets"]), self.array(col["data"])
+        return lambda i: json.loads(bytes(blob[offsets[i]:offsets[i + 1]]))
+
+    def products(self):
+        """Reconstruye la lista de productos (para código que todavía espera dicts)."""
+        decoders = [(name, self._decoder(col)) for name, col in self.columns.items()]
+        return [{name: decode(i) for name, decode in decoders} for i in range(self.rows)]
+
+    def to_dict(self):
+        return dict(self.fields, products=self.products())
@@ -0,0 +1,718 @@
+"""
+Servidor Odoo falso para desarrollo y benchmarks sin conexión.
+
+Implementa /web/session/authenticate y /web/dataset/call_kw (JSON-RPC, como
+main.py) y /xmlrpc/2/common + /xmlrpc/2/object (XML-RPC, como los scripts
+check_*/debug_*) sobre tres fuentes de datos:
+
+- synthetic: catálogo generado (10k-200k productos) con almacenes, ubicaciones,
+  stock, movimientos, ventas POS y compras coherentes entre sí.
+- record:    reenvía cada llamada a un Odoo real y guarda las respuestas.
+- replay:    responde con lo grabado; las fechas de los dominios se comparan
+             relativas al día de la grabación, así los dominios "últimos N días"
+             siguen coincidiendo días después.
+
+Latencia (fija + jitter + por fila), workers concurrentes y tasa de errores
+son configurables para reproducir un Odoo lento o inestable.
+
+Uso:
+    python fake_odoo.py --products 50000 --latency 40 --port 8069
+    python fake_odoo.py --mode record --fixtures fixtures/ati   (usa ODOO_URL/ODOO_DB/... del .env)
+    python fake_odoo.py --mode replay --fixtures fixtures/ati
+
+y luego ODOO_URL=http://127.0.0.1:8069 para main.py o bench_sync.py.
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import time
+import xmlrpc.client
+from datetime import datetime, timedelta
+
+from fastapi import FastAPI, Request, Response
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("fake_odoo")
+
+DT_FMT = '%Y-%m-%d %H:%M:%S'
+
+CONFIG = {
+    "mode": "synthetic", "products": 10000, "warehouses": 6, "days": 90, "seed": 42,
+    "latency_ms": 0.0, "jitter_ms": 0.0, "per_row_ms": 0.0, "workers": 8, "error_rate": 0.0,
+    "related_groupby": True, "fixtures": None, "replay_miss": "error",
+}
+
+# ---------------------------------------------------------------------------
+# Esquema: tipo de cada campo relacional (los demás son escalares)
+# ---------------------------------------------------------------------------
+
+SCHEMA = {
+    "res.company": {},
+    "res.partner": {"company_id": ("m2o", "res.company")},
+    "stock.warehouse": {"lot_stock_id": ("m2o", "stock.location"), "company_id": ("m2o", "res.company")},
+    "stock.location": {"warehouse_id": ("m2o", "stock.warehouse"), "location_id": ("m2o", "stock.location")},
+    "stock.picking.type": {"warehouse_id": ("m2o", "stock.warehouse"), "default_location_src_id": ("m2o", "stock.location"),
+                           "default_location_dest_id": ("m2o", "stock.location")},
+    "product.category": {},
+    "product.brand": {},
+    "product.tag": {},
+    "product.template": {},
+    "product.product": {"product_tmpl_id": ("m2o", "product.template"), "categ_id": ("m2o", "product.category"),
+                        "brand_id": ("m2o", "product.brand"), "seller_ids": ("x2m", "product.supplierinfo"),
+                        "product_tag_ids": ("x2m", "product.tag"), "additional_product_tag_ids": ("x2m", "product.tag")},
+    "product.supplierinfo": {"partner_id": ("m2o", "res.partner"), "product_id": ("m2o", "product.product"),
+                             "product_tmpl_id": ("m2o", "product.template")},
+    "stock.quant": {"product_id": ("m2o", "product.product"), "location_id": ("m2o", "stock.location")},
+    # stock.move y stock.move.line comparten registros (un movimiento = una línea)
+    "stock.move.line": {"product_id": ("m2o", "product.product"), "location_id": ("m2o", "stock.location"),
+                        "location_dest_id": ("m2o", "stock.location"), "picking_type_id": ("m2o", "stock.picking.type")},
+    "pos.order": {"picking_type_id": ("m2o", "stock.picking.type"), "company_id": ("m2o", "res.company")},
+    "pos.order.line": {"order_id": ("m2o", "pos.order"), "product_id": ("m2o", "product.product")},
+    "purchase.order": {"partner_id": ("m2o", "res.partner"), "picking_type_id": ("m2o", "stock.picking.type"),
+                       "company_id": ("m2o", "res.company"), "order_line": ("x2m", "purchase.order.line")},
+    "purchase.order.line": {"order_id": ("m2o", "purchase.order"), "product_id": ("m2o", "product.product"),
+                            "partner_id": ("m2o", "res.partner")},
+}
+SCHEMA["stock.move"] = SCHEMA["stock.move.line"]
+
+# Rutas con índice ordenado (rangos de fechas) por modelo
+RANGE_INDEXES = {
+    "stock.move.line": ["date"],
+    "pos.order.line": ["order_id.date_order"],
+    "purchase.order.line": ["order_id.create_date"],
+    "purchase.order": ["create_date"],
+}
+RANGE_INDEXES["stock.move"] = RANGE_INDEXES["stock.move.line"]
+
+
+class ModelStore:
+    def __init__(self, name):
+        self.name = name
+        self.records = {}  # id -> dict
+        self._range = {}  # path -> (sorted keys, ids in the same order)
+        self._by_product = None  # product_id -> [ids]
+
+    def add(self, rec):
+        self.records[rec["id"]] = rec
+        return rec
+
+    def build_indexes(self, db):
+        for path in RANGE_INDEXES.get(self.name, []):
+            pairs = sorted((v, rid) for rid, rec in self.records.items() if (v := db.resolve(self.name, rec, path)))
+            self._range[path] = ([p[0] for p in pairs], [p[1] for p in pairs])
+        if "product_id" in SCHEMA.get(self.name, {}):
+            self._by_product = {}
+            for rid, rec in self.records.items():
+                self._by_product.setdefault(rec.get("product_id"), []).append(rid)
+
+    def candidates(self, domain):
+        """Ids a evaluar: si el dominio es un AND puro, se acota con los índices disponibles."""
+        if any(isinstance(t, str) for t in domain):
+            return self.records.keys()
+        best = None
+        for leaf in domain:
+            path, op, value = leaf
+            ids = None
+            if path == "product_id" and op == "=" and self._by_product is not None:
+                ids = self._by_product.get(value, [])
+            elif path == "product_id" and op == "in" and self._by_product is not None:
+                ids = [rid for v in value for rid in self._by_product.get(v, [])]
+            elif path in self._range and op in (">=", ">", "<", "<="):
+                keys, rids = self._range[path]
+                if op == ">=": ids = rids[bisect.bisect_left(keys, value):]
+                elif op == ">": ids = rids[bisect.bisect_right(keys, value):]
+                elif op == "<": ids = rids[:bisect.bisect_left(keys, value)]
+                else: ids = rids[:bisect.bisect_right(keys, value)]
+            if ids is not None and (best is None or len(ids) < len(best)):
+                best = ids
+        return self.records.keys() if best is None else best
+
+
+class FakeDB:
+    def __init__(self):
+        self.models = {name: ModelStore(name) for name in SCHEMA}
+        self.models["stock.move"] = self.models["stock.move.line"]
+
+    def store(self, model):
+        if model not in self.models:
+            raise OdooError(f"Object {model} doesn't exist", "builtins.KeyError")
+        return self.models[model]
+
+    def display_name(self, model, rid):
+        rec = self.models[model].records.get(rid)
+        if not rec: return ""
+        return rec.get("display_name") or rec.get("complete_name") or rec.get("name") or f"{model},{rid}"
+
+    def resolve(self, model, rec, path):
+        """Valor de una ruta con puntos ('order_id.picking_type_id.warehouse_id'); many2one devuelve el id."""
+        for i, field in enumerate(path.split(".")):
+            value = rec.get(field, False)
+            kind = SCHEMA.get(model, {}).get(field)
+            if i == path.count("."):
+                return value
+            if not kind or not value: return False
+            model = kind[1]
+            rec = self.models[model].records.get(value)
+            if rec is None: return False
+        return False
+
+    # -- dominio ------------------------------------------------------------
+
+    def _leaf(self, model, rec, leaf):
+        path, op, value = leaf
+        if path == "id":
+            got = rec["id"]
+        else:
+            got = self.resolve(model, rec, path)
+        # ilike/like sobre many2one compara con el nombre mostrado
+        if op in ("ilike", "like", "not ilike", "=ilike") and isinstance(got, int) and not isinstance(got, bool):
+            field_model = model
+            for field in path.split(".")[:-1]:
+                field_model = SCHEMA[field_model][field][1]
+            kind = SCHEMA.get(field_model, {}).get(path.split(".")[-1])
+            if kind: got = self.display_name(kind[1], got)
+        if isinstance(got, list):  # x2many: cierto si algún id cumple
+            if op in ("=", "in"):
+                vals = value if isinstance(value, (list, tuple)) else [value]
+                return bool(set(got) & set(vals)) if vals and vals != [False] else not got
+            if op in ("!=", "not in"):
+                vals = value if isinstance(value, (list, tuple)) else [value]
+                return not (set(got) & set(vals))
+        if op == "=": return got == value or (value is False and got in (None, False))
+        if op == "!=": return not (got == value or (value is False and got in (None, False)))
+        if op in ("in", "child_of"): return got in (value if isinstance(value, (list, tuple)) else [value])
+        if op == "not in": return got not in value
+        if got in (None, False) and op in ("<", "<=", ">", ">="): return False
+        if op == "<": return got < value
+        if op == "<=": return got <= value
+        if op == ">": return got > value
+        if op == ">=": return got >= value
+        text = str(got or "")
+        if op == "ilike": return str(value).lower() in text.lower()
+        if op == "not ilike": return str(value).lower() not in text.lower()
+        if op == "like": return str(value) in text
+        if op == "=ilike": return text.lower() == str(value).lower()
+        raise OdooError(f"Invalid operator {op!r}", "builtins.ValueError")
+
+    def match(self, model, rec, domain):
+        # Notación polaca de Odoo: '&' implícito entre hojas, '|' y '!' explícitos
+        stack = []
+        for item in reversed(domain):
+            if item == "&": stack.append(stack.pop() and stack.pop())
+            elif item == "|":
+                a, b = stack.pop(), stack.pop(); stack.append(a or b)
+            elif item == "!": stack.append(not stack.pop())
+            else: stack.append(self._leaf(model, rec, item))
+        return all(stack)
+
+    def search(self, model, domain, context=None, offset=0, limit=None, order=None):
+        store = self.store(model)
+        domain = [tuple(t) if isinstance(t, list) else t for t in (domain or [])]
+        if (context or {}).get("active_test", True) and not any(isinstance(t, tuple) and t[0] == "active" for t in domain):
+            if model in ("product.product", "res.partner", "stock.location", "stock.warehouse"):
+                domain = domain + [("active", "!=", False)]
+        recs = [store.records[rid] for rid in store.candidates(domain) if self.match(model, store.records[rid], domain)]
+        for part in reversed([p.strip() for p in (order or "id").split(",") if p.strip()]):
+            field, _, direction = part.partition(" ")
+            recs.sort(key=lambda r: (r.get(field) is None or r.get(field) is False, r.get(field) or 0), reverse=direction.lower() == "desc")
+        return recs[offset:offset + limit if limit else None]
+
+    # -- lectura ------------------------------------------------------------
+
+    def serialize(self, model, rec, fields):
+        out = {"id": rec["id"]}
+        for f in fields or [k for k in rec if k != "active"]:
+            if f == "id": continue
+            kind = SCHEMA.get(model, {}).get(f)
+            value = rec.get(f, False)
+            if f == "display_name" and not value:
+                value = self.display_name(model, rec["id"])
+            elif kind and kind[0] == "m2o":
+                value = [value, self.display_name(kind[1], value)] if value else False
+            elif kind and kind[0] == "x2m":
+                value = list(value or [])
+            out[f] = value
+        return out
+
+    def read_group(self, model, domain, fields, groupby, lazy=True, context=None, offset=0, limit=None, orderby=None):
+        groupby = [groupby] if isinstance(groupby, str) else list(groupby or [])
+        if lazy is not False and len(groupby) > 1:
+            groupby = groupby[:1]
+        measures = []
+        for f in fields or []:
+            name, _, agg = f.partition(":")
+            if name not in groupby and name != "id" and "." not in name:
+                measures.append((name, agg or "sum"))
+        for g in groupby:
+            if "." in g.split(":")[0] and not CONFIG["related_groupby"]:
+                raise OdooError(f"Invalid field {g!r} on model {model!r}", "builtins.ValueError")
+
+        groups = {}
+        for rec in self.search(model, domain, context):
+            key = tuple(self._group_key(model, rec, g) for g in groupby)
+            acc = groups.get(key)
+            if acc is None:
+                acc = groups[key] = {"__count": 0, **{m: (None if agg in ("max", "min") else 0) for m, agg in measures}}
+            acc["__count"] += 1
+            for m, agg in measures:
+                v = rec.get(m)
+                if agg in ("max", "min"):
+                    if v in (None, False): continue
+                    acc[m] = v if acc[m] is None else (max(acc[m], v) if agg == "max" else min(acc[m], v))
+                else: acc[m] += v or 0
+        out = []
+        for key, acc in groups.items():
+            row = {}
+            for g, k in zip(groupby, key): row[g] = self._group_label(model, g, k)
+            if lazy is not False and groupby: row[f"{groupby[0]}_count"] = acc["__count"]
+            else: row["__count"] = acc["__count"]
+            row.update({m: acc[m] for m, _ in measures})
+            out.append(row)
+        return out[offset:offset + limit if limit else None]
+
+    def _group_key(self, model, rec, g):
+        path, _, interval = g.partition(":")
+        value = self.resolve(model, rec, path)
+        if interval and value:
+            d = datetime.strptime(value[:10], '%Y-%m-%d')
+            return d.strftime({"day": "%d %b %Y", "week": "W%W %Y", "month": "%B %Y", "year": "%Y"}.get(interval, "%B %Y"))
+        return tuple(value) if isinstance(value, list) else value
+
+    def _group_label(self, model, g, value):
+        path = g.partition(":")[0]
+        field_model = model
+        for field in path.split(".")[:-1]:
+            field_model = SCHEMA[field_model][field][1]
+        kind = SCHEMA.get(field_model, {}).get(path.split(".")[-1])
+        if kind and kind[0] == "m2o":
+            return [value, self.display_name(kind[1], value)] if value else False
+        return list(value) if isinstance(value, tuple) else value
+
+    # -- escritura mínima (para simular cambios entre sincronizaciones) ------
+
+    def touch(self, model, count, rng):
+        store = self.store(model)
+        ids = rng.sample(list(store.records), min(count, len(store.records)))
+        now = datetime.utcnow().strftime(DT_FMT)
+        for rid in ids: store.records[rid]["write_date"] = now
+        return ids
+
+
+class OdooError(Exception):
+    def __init__(self, message, name="odoo.exceptions.UserError", code=200):
+        super().__init__(message)
+        self.name, self.code = name, code
+
+
+# ---------------------------------------------------------------------------
+# Datos sintéticos
+# ---------------------------------------------------------------------------
+
+WAREHOUSE_NAMES = ["CENTRAL", "ACHUMANI", "CALACOTO", "SOPOCACHI", "MIRAFLORES", "OBRAJES", "EL ALTO", "IRPAVI",
+                   "SAN MIGUEL", "COTA COTA", "MALLASA", "VILLA FATIMA"]
+
+
+def build_synthetic(products, warehouses, days, seed):
+    """Genera un Odoo coherente: almacenes, ubicaciones, catálogo, stock, ventas de `days` días y compras."""
+    rng = random.Random(seed)
+    db = FakeDB()
+    M = db.models
+    now = datetime.utcnow().replace(microsecond=0)
+    ts = lambda d: d.strftime(DT_FMT)
+
+    M["res.company"].add({"id": 1, "name": "Andys SRL"})
+    M["res.company"].add({"id": 2, "name": "Expandia SRL"})
+
+    # Ubicaciones genéricas
+    next_loc = iter(range(1, 10 ** 6))
+    customer = M["stock.location"].add({"id": next(next_loc), "name": "Customers", "complete_name": "Partners/Customers", "usage": "customer", "warehouse_id": False, "active": True})
+    vendor = M["stock.location"].add({"id": next(next_loc), "name": "Vendors", "complete_name": "Partners/Vendors", "usage": "supplier", "warehouse_id": False, "active": True})
+
+    whs = []
+    next_pt = iter(range(1, 10 ** 6))
+    for i in range(warehouses):
+        name = WAREHOUSE_NAMES[i] if i < len(WAREHOUSE_NAMES) else f"SUCURSAL {i + 1}"
+        code = (name.replace(" ", "")[:3] + str(i + 1)) if i >= len(WAREHOUSE_NAMES) else name.replace(" ", "")[:4]
+        wh_id = i + 1
+        view = M["stock.location"].add({"id": next(next_loc), "name": code, "complete_name": code, "usage": "view", "warehouse_id": wh_id, "active": True})
+        stock = M["stock.location"].add({"id": next(next_loc), "name": "Existencias", "complete_name": f"{code}/Existencias", "usage": "internal",
+                                         "warehouse_id": wh_id, "location_id": view["id"], "active": True})
+        shelf = M["stock.location"].add({"id": next(next_loc), "name": "Depósito", "complete_name": f"{code}/Existencias/Depósito", "usage": "internal",
+                                         "warehouse_id": wh_id, "location_id": stock["id"], "active": True})
+        M["stock.warehouse"].add({"id": wh_id, "name": f"ANDYS {name}", "code": code, "lot_stock_id": stock["id"], "company_id": 1, "active": True})
+        pts = {}
+        for kind, label in (("incoming", "Recepciones"), ("outgoing", "Órdenes de entrega"), ("pos", "PoS Orders")):
+            pt = M["stock.picking.type"].add({"id": next(next_pt), "name": f"{name.title()}: {label}", "code": kind if kind != "pos" else "outgoing",
+                                              "warehouse_id": wh_id, "default_location_src_id": vendor["id"] if kind == "incoming" else stock["id"],
+                                              "default_location_dest_id": stock["id"] if kind == "incoming" else customer["id"]})
+            pts[kind] = pt["id"]
+        whs.append({"id": wh_id, "code": code, "locs": [stock["id"], shelf["id"]], "pts": pts, "weight": rng.uniform(0.3, 1.5)})
+
+    n_categ, n_brand, n_tag = 60, max(20, products // 200), 25
+    for i in range(1, n_categ + 1):
+        M["product.category"].add({"id": i, "name": f"All products / Categoría {i}", "complete_name": f"All products / Categoría {i}"})
+    for i in range(1, n_brand + 1):
+        M["product.brand"].add({"id": i, "name": f"MARCA {i}"})
+    for i in range(1, n_tag + 1):
+        M["product.tag"].add({"id": i, "name": f"Etiqueta {i}"})
+
+    n_partners = max(50, products // 40)
+    for i in range(1, n_partners + 1):
+        name = f"PROVEEDOR {i} SRL" if i > 3 else f"ANDYS STORE {i} SRL"
+        M["res.partner"].add({"id": i, "name": name, "company_id": False, "supplier_rank": 1, "active": True,
+                              "write_date": ts(now - timedelta(days=rng.randint(1, 700)))})
+
+    wh_weights = [w["weight"] for w in whs]
+    next_si, next_quant, next_move = 1, 1, 1
+    pos_orders = {}  # (wh_id, day) -> order id
+    start_day = (now - timedelta(days=days)).replace(hour=0, minute=0, second=0)
+    for pid in range(1, products + 1):
+        sellers = []
+        for _ in range(rng.choice((1, 1, 1, 2))):
+            M["product.supplierinfo"].add({"id": next_si, "partner_id": rng.randint(1, n_partners), "product_id": pid, "product_tmpl_id": pid, "price": 0,
+                                           "write_date": ts(now - timedelta(days=rng.randint(1, 700)))})
+            sellers.append(next_si); next_si += 1
+        price = round(rng.lognormvariate(2.5, 0.9), 2)
+        # One variant per template, same id
+        M["product.template"].add({"id": pid, "name": f"Producto {pid}", "active": True,
+                                   "write_date": ts(now - timedelta(days=rng.randint(1, 700)))})
+        M["product.product"].add({
+            "id": pid, "product_tmpl_id": pid, "display_name": f"[P{pid:06d}] Producto {pid}", "name": f"Producto {pid}", "default_code": f"P{pid:06d}",
+            "barcode": f"77{pid:011d}", "seller_ids": sellers, "standard_price": round(price * 0.7, 2), "list_price": price,
+            "type": rng.choice(("consu", "product", "product")), "categ_id": rng.randint(1, n_categ), "brand_id": rng.randint(1, n_brand),
+            "product_tag_ids": rng.sample(range(1, n_tag + 1), rng.randint(0, 2)), "additional_product_tag_ids": [],
+            "active": rng.random() > 0.02, "write_date": ts(now - timedelta(days=rng.randint(1, 700), seconds=rng.randint(0, 86400)))
+        })
+
+        # Stock en ~70% de los productos, en 1..N almacenes
+        if rng.random() < 0.7:
+            for wh in rng.sample(whs, rng.randint(1, len(whs))):
+                M["stock.quant"].add({"id": next_quant, "product_id": pid, "location_id": rng.choice(wh["locs"]),
+                                      "quantity": float(rng.randint(-3, 120))})
+                next_quant += 1
+
+        # Ventas en ~40% de los productos: popularidad con cola larga
+        if rng.random() < 0.4:
+            rate = min(0.9, rng.paretovariate(1.6) * 0.05)
+            sold_in = rng.choices(whs, weights=wh_weights, k=rng.randint(1, min(3, len(whs))))
+            for day in range(days + 1):
+                if rng.random() > rate: continue
+                wh = rng.choice(sold_in)
+                when = start_day + timedelta(days=day, seconds=rng.randint(8 * 3600, 21 * 3600))
+                if when > now: continue
+                qty = float(rng.randint(1, 6))
+                M["stock.move.line"].add({
+                    "id": next_move, "product_id": pid, "location_id": wh["locs"][0], "location_dest_id": customer["id"],
+                    "picking_type_id": wh["pts"]["pos"], "date": ts(when), "state": "done", "reference": f"{wh['code']}/POS/{next_move:07d}",
+                    "quantity": qty, "qty_done": qty, "product_uom_qty": qty
+                })
+                next_move += 1
+                key = (wh["id"], day)
+                if key not in pos_orders:
+                    oid = len(pos_orders) + 1
+                    pos_orders[key] = oid
+                    M["pos.order"].add({"id": oid, "name": f"{wh['code']}/{oid:06d}", "date_order": ts(start_day + timedelta(days=day, hours=12)),
+                                        "picking_type_id": wh["pts"]["pos"], "company_id": 1, "state": "done"})
+                M["pos.order.line"].add({"id": next_move, "order_id": pos_orders[key], "product_id": pid, "qty": qty,
+                                         "price_subtotal_incl": round(qty * price * 1.13, 2)})
+
+    # Compras de los últimos 45 días
+    n_po = max(20, products // 50)
+    next_pol = 1
+    states = ["draft", "draft", "sent", "to approve", "purchase", "purchase", "purchase", "done", "cancel"]
+    for oid in range(1, n_po + 1):
+        created = now - timedelta(days=rng.randint(0, 45), seconds=rng.randint(0, 86400))
+        state, wh, company = rng.choice(states), rng.choice(whs), rng.choice((1, 1, 1, 2))
+        line_ids = []
+        for _ in range(rng.randint(3, 30)):
+            qty = float(rng.randint(6, 240))
+            received = qty if state == "done" else (float(rng.randint(0, int(qty))) if state == "purchase" and rng.random() < 0.3 else 0.0)
+            M["purchase.order.line"].add({"id": next_pol, "order_id": oid, "product_id": rng.randint(1, products), "product_qty": qty,
+                                          "qty_received": received, "state": state, "date_planned": ts(created + timedelta(days=rng.randint(2, 20))),
+                                          "partner_id": False})
+            line_ids.append(next_pol); next_pol += 1
+        partner = rng.randint(1, n_partners)
+        for lid in line_ids: M["purchase.order.line"].records[lid]["partner_id"] = partner
+        M["purchase.order"].add({"id": oid, "name": f"P{oid:05d}", "partner_id": partner, "state": state, "date_order": ts(created),
+                                 "date_approve": ts(created + timedelta(hours=3)) if state in ("purchase", "done") else False,
+                                 "create_date": ts(created), "company_id": company, "picking_type_id": wh["pts"]["incoming"], "order_line": line_ids})
+
+    for store in set(db.models.values()): store.build_indexes(db)
+    logger.info("Synthetic Odoo: " + ", ".join(f"{name}={len(s.records)}" for name, s in db.models.items() if s.records and name != "stock.move"))
+    return db
+
+
+def execute(db, model, method, args, kwargs):
+    """Despacha un call_kw/execute_kw sobre la base falsa."""
+    args, kwargs = list(args or []), dict(kwargs or {})
+    context = kwargs.pop("context", {}) or {}
+    if method == "search_read":
+        domain = args[0] if args else kwargs.get("domain", [])
+        fields = args[1] if len(args) > 1 else kwargs.get("fields")
+        recs = db.search(model, domain, context, kwargs.get("offset", 0), kwargs.get("limit"), kwargs.get("order"))
+        return [db.serialize(model, r, fields) for r in recs]
+    if method == "search":
+        domain = args[0] if args else kwargs.get("domain", [])
+        return [r["id"] for r in db.search(model, domain, context, kwargs.get("offset", 0), kwargs.get("limit"), kwargs.get("order"))]
+    if method == "search_count":
+        return len(db.search(model, args[0] if args else kwargs.get("domain", []), context))
+    if method == "read":
+        ids = args[0] if args else kwargs.get("ids", [])
+        ids = [ids] if isinstance(ids, int) else ids
+        fields = args[1] if len(args) > 1 else kwargs.get("fields")
+        store = db.store(model)
+        return [db.serialize(model, store.records[i], fields) for i in ids if i in store.records]
+    if method == "read_group":
+        domain = args[0] if args else kwargs.get("domain", [])
+        fields = args[1] if len(args) > 1 else kwargs.get("fields", [])
+        groupby = args[2] if len(args) > 2 else kwargs.get("groupby", [])
+        return db.read_group(model, domain, fields, groupby, kwargs.get("lazy", True), context,
+                             kwargs.get("offset", 0), kwargs.get("limit"), kwargs.get("orderby"))
+    if method == "fields_get":
+        store = db.store(model)
+        sample = next(iter(store.records.values()), {})
+        return {f: {"type": SCHEMA[model][f][0] if f in SCHEMA[model] else type(v).__name__, "string": f} for f, v in sample.items()}
+    if method == "name_get":
+        return [[i, db.display_name(model, i)] for i in (args[0] if args else [])]
+    raise OdooError(f"Method {method!r} is not supported by the fake Odoo server", "builtins.AttributeError")
+
+
+# ---------------------------------------------------------------------------
+# Grabación / reproducción
+# ---------------------------------------------------------------------------
+
+_DATE_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})((?: \d{2}:\d{2}:\d{2})?)$")
+
+
+def _relative_dates(value, base_day):
+    """Reemplaza fechas absolutas por desplazamientos en días respecto a `base_day` ('@-30 00:00:00')."""
+    if isinstance(value, str):
+        m = _DATE_RE.match(value)
+        if m:
+            days = (datetime.strptime(m.group(1), '%Y-%m-%d').date() - base_day).days
+            return f"@{days}{m.group(2)}"
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_relative_dates(v, base_day) for v in value]
+    if isinstance(value, dict):
+        return {k: _relative_dates(v, base_day) for k, v in value.items()}
+    return value
+
+
+def fixture_key(model, method, args, kwargs, base_day):
+    payload = [model, method, _relative_dates(args or [], base_day), _relative_dates(kwargs or {}, base_day)]
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class FixtureStore:
+    """fixtures.jsonl: una llamada por línea {key, model, method, args, kwargs, result, recorded_at}."""
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, "fixtures.jsonl")
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    if line.strip():
+                        e = json.loads(line)
+                        self.entries[e["key"]] = e
+        logger.info(f"Fixtures: {len(self.entries)} recorded calls in {self.path}")
+
+    def lookup(self, model, method, args, kwargs):
+        # Las fechas se toman relativas a hoy, como si hoy fuera el día de la grabación
+        return self.entries.get(fixture_key(model, method, args, kwargs, datetime.now().date()))
+
+    def save(self, model, method, args, kwargs, result):
+        os.makedirs(self.directory, exist_ok=True)
+        e = {"key": fixture_key(model, method, args, kwargs, datetime.now().date()), "model": model, "method": method,
+             "args": args, "kwargs": kwargs, "result": result, "recorded_at": datetime.now().isoformat()}
+        self.entries[e["key"]] = e
+        with open(self.path, "a") as f: f.write(json.dumps(e) + "\n")
+
+
+class Upstream:
+    """Sesión JSON-RPC contra el Odoo real para el modo record."""
+    def __init__(self):
+        import httpx
+        self.url = os.environ.get("ODOO_URL", "").rstrip("/")
+        self.client = httpx.AsyncClient(timeout=300)
+        self._authenticated = False
+
+    async def call_kw(self, model, method, args, kwargs):
+        if not self._authenticated:
+            r = await self.client.post(f"{self.url}/web/session/authenticate", json={"jsonrpc": "2.0", "params": {
+                "db": os.environ.get("ODOO_DB"), "login": os.environ.get("ODOO_USER"), "password": os.environ.get("ODOO_PASS")}})
+            if r.json().get("error"): raise OdooError("Upstream authentication failed", "odoo.exceptions.AccessDenied")
+            self._authenticated = True
+        r = await self.client.post(f"{self.url}/web/dataset/call_kw", json={"jsonrpc": "2.0", "method": "call", "params": {
+            "model": model, "method": method, "args": args, "kwargs": kwargs}})
+        data = r.json()
+        if data.get("error"):
+            err = data["error"]
+            raise OdooError(err.get("data", {}).get("message") or err.get("message"), err.get("data", {}).get("name", "odoo.exceptions.UserError"), err.get("code", 200))
+        return data.get("result")
+
+
+# ---------------------------------------------------------------------------
+# Servidor
+# ---------------------------------------------------------------------------
+
+app = FastAPI()
+_state = {"db": None, "fixtures": None, "upstream": None, "semaphore": None, "rng": random.Random(), "calls": {}}
+
+
+async def dispatch(model, method, args, kwargs):
+    """Aplica latencia, límite de workers y errores simulados, y resuelve la llamada según el modo."""
+    key = f"{model}.{method}"
+    _state["calls"][key] = _state["calls"].get(key, 0) + 1
+    async with _state["semaphore"]:
+        rng = _state["rng"]
+        if CONFIG["error_rate"] and rng.random() < CONFIG["error_rate"]:
+            await asyncio.sleep(CONFIG["latency_ms"] / 1000)
+            raise OdooError("Simulated server error", "fake_odoo.SimulatedError")
+        mode = CONFIG["mode"]
+        if mode == "replay":
+            entry = _state["fixtures"].lookup(model, method, args, kwargs)
+            if entry is None:
+                logger.warning(f"Replay miss: {model}.{method} {json.dumps(args)[:200]}")
+                if CONFIG["replay_miss"] == "error": raise OdooError(f"No fixture recorded for {model}.{method}", "fake_odoo.ReplayMiss")
+                result = []
+            else:
+                result = entry["result"]
+        elif mode == "record":
+            result = await _state["upstream"].call_kw(model, method, args, kwargs)
+            _state["fixtures"].save(model, method, args, kwargs, result)
+        else:
+            result = await asyncio.to_thread(execute, _state["db"], model, method, args, kwargs)
+        rows = len(result) if isinstance(result, list) else 1
+        delay = CONFIG["latency_ms"] + rng.uniform(0, CONFIG["jitter_ms"]) + rows * CONFIG["per_row_ms"]
+        if delay > 0 and mode != "record": await asyncio.sleep(delay / 1000)
+        return result
+
+
+def _jsonrpc_error(req_id, e):
+    return {"jsonrpc": "2.0", "id": req_id, "error": {"code": e.code, "message": "Odoo Server Error",
+                                                      "data": {"name": e.name, "message": str(e), "arguments": [str(e)]}}}
+
+
+@app.on_event("startup")
+async def startup():
+    mode = CONFIG["mode"]
+    _state["rng"] = random.Random(CONFIG["seed"])
+    _state["semaphore"] = asyncio.Semaphore(CONFIG["workers"])
+    if mode == "synthetic":
+        t0 = time.perf_counter()
+        _state["db"] = await asyncio.to_thread(build_synthetic, CONFIG["products"], CONFIG["warehouses"], CONFIG["days"], CONFIG["seed"])
+        logger.info(f"Synthetic dataset ready in {time.perf_counter() - t0:.1f}s")
+    else:
+        if not CONFIG["fixtures"]: raise SystemExit("--fixtures is required in record/replay mode")
+        _state["fixtures"] = FixtureStore(CONFIG["fixtures"])
+        if mode == "record": _state["upstream"] = Upstream()
+
+
+@app.post("/web/session/authenticate")
+async def authenticate(request: Request):
+    body = await request.json()
+    params = body.get("params", {})
+    result = {"uid": 2, "db": params.get("db"), "username": params.get("login"), "user_context": {"lang": "es_BO", "tz": "America/La_Paz"}}
+    response = Response(content=json.dumps({"jsonrpc": "2.0", "id": body.get("id"), "result": result}), media_type="application/json")
+    response.set_cookie("session_id", hashlib.sha1(os.urandom(16)).hexdigest())
+    return response
+
+
+@app.post("/web/dataset/call_kw")
+@app.post("/web/dataset/call_kw/{path:path}")
+async def call_kw(request: Request):
+    body = await request.json()
+    params = body.get("params", {})
+    try:
+        result = await dispatch(params.get("model"), params.get("method"), params.get("args", []), params.get("kwargs", {}))
+        content = {"jsonrpc": "2.0", "id": body.get("id"), "result": result}
+    except OdooError as e:
+        content = _jsonrpc_error(body.get("id"), e)
+    return Response(content=json.dumps(content), media_type="application/json")
+
+
+@app.post("/xmlrpc/2/common")
+async def xmlrpc_common(request: Request):
+    params, method = xmlrpc.client.loads(await request.body())
+    if method == "version":
+        result = {"server_version": "17.0", "server_version_info": [17, 0, 0, "final", 0, ""], "protocol_version": 1}
+    else:  # authenticate / login
+        result = 2
+    return Response(content=xmlrpc.client.dumps((result,), methodresponse=True, allow_none=True), media_type="text/xml")
+
+
+@app.post("/xmlrpc/2/object")
+async def xmlrpc_object(request: Request):
+    params, method = xmlrpc.client.loads(await request.body())
+    try:
+        # execute_kw(db, uid, password, model, method, args, kwargs)
+        _, _, _, model, meth, *rest = params
+        result = await dispatch(model, meth, rest[0] if rest else [], rest[1] if len(rest) > 1 else {})
+        payload = xmlrpc.client.dumps((result,), methodresponse=True, allow_none=True)
+    except OdooError as e:
+        payload = xmlrpc.client.dumps(xmlrpc.client.Fault(1, f"{e.name}: {e}"), methodresponse=True, allow_none=True)
+    return Response(content=payload, media_type="text/xml")
+
+
+@app.get("/fake/stats")
+async def stats():
+    db = _state["db"]
+    return {"mode": CONFIG["mode"], "config": CONFIG, "calls": _state["calls"],
+            "records": {name: len(s.records) for name, s in db.models.items()} if db else None,
+            "fixtures": len(_state["fixtures"].entries) if _state["fixtures"] else None}
+
+
+@app.post("/fake/touch")
+async def touch(model: str = "product.product", count: int = 100):
+    """Actualiza write_date de `count` registros al azar (simula ediciones entre dos sincronizaciones incrementales)."""
+    if not _state["db"]: return {"touched": 0}
+    try:
+        ids = _state["db"].touch(model, count, _state["rng"])
+    except OdooError as e:
+        return Response(content=json.dumps({"error": str(e)}), status_code=404, media_type="application/json")
+    return {"touched": len(ids)}
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Fake Odoo JSON-RPC/XML-RPC server")
+    p.add_argument("--mode", choices=["synthetic", "record", "replay"], default="synthetic")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8069)
+    p.add_argument("--products", type=int, default=CONFIG["products"], help="synthetic catalogue size (10k-200k)")
+    p.add_argument("--warehouses", type=int, default=CONFIG["warehouses"])
+    p.add_argument("--days", type=int, default=CONFIG["days"], help="days of synthetic sales history")
+    p.add_argument("--seed", type=int, default=CONFIG["seed"])
+    p.add_argument("--latency", type=float, default=0.0, help="fixed latency per call (ms)")
+    p.add_argument("--jitter", type=float, default=0.0, help="extra random latency per call, 0..N ms")
+    p.add_argument("--per-row", type=float, default=0.0, help="extra latency per returned row (ms)")
+    p.add_argument("--workers", type=int, default=CONFIG["workers"], help="calls served concurrently (Odoo workers)")
+    p.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with a server error")
+    p.add_argument("--no-related-groupby", action="store_true", help="reject read_group on related paths (older Odoo)")
+    p.add_argument("--fixtures", help="fixtures directory for record/replay")
+    p.add_argument("--replay-miss", choices=["error", "empty"], default="error")
+    return p.parse_args(argv)
+
+
+def configure(args):
+    CONFIG.update({
+        "mode": args.mode, "products": args.products, "warehouses": args.warehouses, "days": args.days, "seed": args.seed,
+        "latency_ms": args.latency, "jitter_ms": args.jitter, "per_row_ms": args.per_row, "workers": args.workers,
+        "error_rate": args.error_rate, "related_groupby": not args.no_related_groupby, "fixtures": args.fixtures,
+        "replay_miss": args.replay_miss,
+    })
+
+
+if __name__ == "__main__":
+    import uvicorn
+    args = parse_args()
+    configure(args)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -1,18 +1,34 @@
-from fastapi import FastAPI, Query, BackgroundTasks, Response, Request
+from fastapi import FastAPI, Query, Response, Request
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 import requests
+import httpx
 import json
 import logging
 import os
 import re
 from datetime import datetime, timedelta
 import math
-import concurrent.futures
-import gzip
 import asyncio
 import time
+import threading
 import openai
+import columnar
+from batch_reader import read_batched, stream_search_read
+from circuit_breaker import CircuitBreaker
+from movements_cache import MovementsCache
+from product_master import ProductMasterStore
+from product_query import ProductIndex, ProductQueryCache, project_warehouse, slim_rows
+from query_planner import group_day, read_group_by_warehouse, related_groupby_rejected
+from sales_ledger import SalesLedger, UNASSIGNED_WH
+from search_index import SearchIndexCache
+from snapshot_store import SnapshotStore
+from sync_coordinator import SyncCoordinator
+from sync_events import SyncEventBus
+from sync_graph import SyncGraph
+from topology import TopologyRegistry
+import sync_metrics
 
 # Load environment variables from .env file if it exists
 try:
@@ -67,25 +83,67 @@ else:
 
 
 
-# Global variables to serve as In-Memory Cache
-_data_cache = None
-_cache_last_modified = 0
-
 # Odoo Configuration (from environment variables)
 ODOO_URL = os.environ.get("ODOO_URL", "https://your-odoo-instance.com")
 ODOO_DB = os.environ.get("ODOO_DB", "your_database")
 ODOO_USER = os.environ.get("ODOO_USER", "your_user@example.com")
 ODOO_PASS = os.environ.get("ODOO_PASS", "your_password")
+# Max simultaneous JSON-RPC calls to Odoo (shared by sync and endpoints) and per-call timeout (s)
+ODOO_MAX_CONCURRENCY = int(os.environ.get("ODOO_MAX_CONCURRENCY", "15"))
+ODOO_TIMEOUT = float(os.environ.get("ODOO_TIMEOUT", "120"))
+# Responses larger than this (bytes) are decoded in a worker thread instead of on the event loop
+ODOO_THREAD_DECODE_BYTES = 256_000
+# Per-call timeout of interactive endpoints (movements): their latency stays bounded when Odoo hangs
+ODOO_INTERACTIVE_TIMEOUT = float(os.environ.get("ODOO_INTERACTIVE_TIMEOUT", "15"))
+# Of ODOO_MAX_CONCURRENCY, slots reserved for interactive calls so they never queue behind the sync
+ODOO_INTERACTIVE_SLOTS = int(os.environ.get("ODOO_INTERACTIVE_SLOTS", "3"))
+# Movements answers are reused for this long (and never across snapshot versions)
+MOVEMENTS_CACHE_TTL = float(os.environ.get("MOVEMENTS_CACHE_TTL", "300"))
+# Circuit breaker: opens when this share of the calls in the last minute failed or were slow (interactive
+# calls and login after ODOO_BREAKER_SLOW_SECONDS, sync calls only at ODOO_TIMEOUT); while open, calls fail
+# at once and endpoints serve what they already have
+ODOO_BREAKER_FAILURE_RATE = float(os.environ.get("ODOO_BREAKER_FAILURE_RATE", "0.5"))
+ODOO_BREAKER_SLOW_SECONDS = float(os.environ.get("ODOO_BREAKER_SLOW_SECONDS", "10"))
+ODOO_BREAKER_COOLDOWN = float(os.environ.get("ODOO_BREAKER_COOLDOWN", "30"))
 
 # OpenAI Configuration
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "your-fallback-key-here")
 openai_client = openai.OpenAI(api_key=OPENAI_API_KEY)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-CACHE_FILE = os.path.join(BASE_DIR, "last_sync_cache.json")
+CACHE_FILE = os.path.join(BASE_DIR, "last_sync_cache.json")  # hard link to the current snapshot, for scripts
+SNAPSHOT_DIR = os.path.join(BASE_DIR, "snapshots")
 USER_DATA_FILE = os.path.join(BASE_DIR, "users_data.json")
-_is_syncing = False
+PRODUCT_MASTER_DB = os.path.join(BASE_DIR, "last_sync_master.db")
+SALES_LEDGER_DB = os.path.join(BASE_DIR, "last_sync_ledger.db")
+TOPOLOGY_FILE = os.path.join(BASE_DIR, "last_sync_topology.json")
+# Warehouses, locations, picking types and tags: reloaded every N hours or when the periodic check sees a change
+TOPOLOGY_TTL_HOURS = float(os.environ.get("TOPOLOGY_TTL_HOURS", "24"))
+TOPOLOGY_CHECK_MINUTES = float(os.environ.get("TOPOLOGY_CHECK_MINUTES", "30"))
+# Daily sales buckets kept locally; full rebuilds re-query the last N days to pick up late corrections
+SALES_LEDGER_RETENTION_DAYS = 90
+SALES_LEDGER_FULL_REFRESH_DAYS = 30
+# Incremental cycles reuse unchanged master records; a full rebuild runs every N hours
+FULL_SYNC_INTERVAL_HOURS = float(os.environ.get("FULL_SYNC_INTERVAL_HOURS", "6"))
+# Overlap applied to write_date marks to absorb clock skew between us and Odoo
+SYNC_MARK_OVERLAP_MIN = 5
+# Multi-worker: followers retry the sync lease every N seconds; the leader checks for forwarded sync requests every N seconds
+SYNC_LEASE_RETRY_SECONDS = 30
+SYNC_REQUEST_POLL_SECONDS = 5
+# A manual sync requested within N seconds of a finished one reuses that run
+MANUAL_SYNC_DEBOUNCE_SECONDS = float(os.environ.get("MANUAL_SYNC_DEBOUNCE_SECONDS", "60"))
+SYNC_INTERVAL_MINUTES = 30
 _next_sync_time = None # ISO format string
+topology = TopologyRegistry(TOPOLOGY_FILE, TOPOLOGY_TTL_HOURS, TOPOLOGY_CHECK_MINUTES)
+snapshots = SnapshotStore(SNAPSHOT_DIR, legacy_path=CACHE_FILE)
+product_queries = ProductQueryCache()
+search_indexes = SearchIndexCache()
+sync_events = SyncEventBus()
+movements_cache = MovementsCache(ttl=MOVEMENTS_CACHE_TTL)
+odoo_breaker = CircuitBreaker("odoo", failure_rate=ODOO_BREAKER_FAILURE_RATE, slow_call_seconds=ODOO_BREAKER_SLOW_SECONDS,
+                              cooldown=ODOO_BREAKER_COOLDOWN, probe_timeout=ODOO_TIMEOUT)
+# Single-flight: every sync request (auto loop, ?sync=true, scripts) goes through here
+sync_coordinator = SyncCoordinator(lambda job: run_sync_job(job), manual_debounce=MANUAL_SYNC_DEBOUNCE_SECONDS)
 
 def load_user_data():
     if os.path.exists(USER_DATA_FILE):
@@ -104,18 +162,16 @@ for user in VALID_USERS:
         _user_profiles[user] = {"username": user, "avatar": None, "password": VALID_USERS[user]}
 save_user_data(_user_profiles)
 
-# Restore next_sync from cache if available to persist timer across restarts
-if os.path.exists(CACHE_FILE):
-    try:
-        with open(CACHE_FILE, "r") as f:
-            cdata = json.load(f)
-            _next_sync_time = cdata.get("next_sync")
-            # If next sync is in the past, reset it (auto-sync will pick it up)
-            if _next_sync_time:
-                ns = datetime.fromisoformat(_next_sync_time)
-                if ns < datetime.now():
-                    _next_sync_time = None
-    except: pass
+# Restore next_sync from the snapshot sidecar to persist timer across restarts (no need to parse the snapshot)
+try:
+    _next_sync_time = snapshots.meta().get("next_sync")
+    # If next sync is in the past, reset it (auto-sync will pick it up)
+    if _next_sync_time:
+        ns = datetime.fromisoformat(_next_sync_time)
+        if ns < datetime.now():
+            _next_sync_time = None
+    sync_events.state.update(version=snapshots.meta().get("version"), next_sync=_next_sync_time)
+except: pass
 
 def load_provider_origins():
     origins = {}
@@ -135,6 +191,41 @@ def load_provider_origins():
             logger.error(f"Error loading provider origins: {e}")
     return origins
 
+def open_master_store():
+    return ProductMasterStore(PRODUCT_MASTER_DB)
+
+def open_sales_ledger():
+    return SalesLedger(SALES_LEDGER_DB)
+
+def should_run_full_sync(store):
+    last_full = store.get_meta("last_full")
+    if not last_full or not store.get_meta("marks"):
+        return True
+    try:
+        last_full = datetime.fromisoformat(last_full)
+    except ValueError:
+        return True
+    return datetime.now() - last_full >= timedelta(hours=FULL_SYNC_INTERVAL_HOURS)
+
+async def fetch_changed(client, model, mark, fields=()):
+    """
+    Registros (id, write_date y `fields`) de `model` modificados en Odoo después
+    de la marca (incluye archivados); None si Odoo falló.
+    """
+    if not mark: return []
+    return await client.call_kw(model, "search_read", [[('write_date', '>', mark)]],
+                                {"fields": ["id", "write_date", *fields], "context": {"active_test": False}})
+
+async def fetch_template_variant_ids(client, tmpl_ids):
+    """
+    Ids de variantes de `tmpl_ids`. Nombre, categoría, marca, etiquetas y
+    seller_ids viven en product.template: editarlos (o sus líneas de proveedor)
+    no cambia el write_date de product.product.
+    """
+    if not tmpl_ids: return set()
+    pids = await client.call_kw("product.product", "search", [[('product_tmpl_id', 'in', list(tmpl_ids))]], {"context": {"active_test": False}})
+    return None if pids is None else set(pids)
+
 class OdooClient:
     def __init__(self):
         self.session = requests.Session()
@@ -179,6 +270,123 @@ class OdooClient:
         response = self.session.post(f"{self.url}/web/dataset/call_kw", json=payload, timeout=120)
         return response.json().get("result")
 
+class AsyncOdooClient:
+    """
+    Cliente JSON-RPC asíncrono (httpx) con pool keep-alive. Las llamadas
+    concurrentes a Odoo se limitan a `max_concurrency`, de las cuales
+    ODOO_INTERACTIVE_SLOTS quedan reservadas para las interactivas (tooltips),
+    así no esperan detrás de la sincronización. Cada llamada pasa por
+    odoo_breaker: con el circuito abierto falla al instante (CircuitOpenError).
+    """
+    def __init__(self, max_concurrency=None):
+        max_concurrency = max_concurrency or ODOO_MAX_CONCURRENCY
+        self.url = ODOO_URL
+        reserved = max(0, min(ODOO_INTERACTIVE_SLOTS, max_concurrency - 1))
+        self.semaphore = asyncio.Semaphore(max_concurrency - reserved)
+        self.interactive_semaphore = asyncio.Semaphore(reserved) if reserved else self.semaphore
+        self.session = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            timeout=httpx.Timeout(ODOO_TIMEOUT, connect=20)
+        )
+        self._authenticated = False
+        self._auth_lock = asyncio.Lock()
+
+    async def authenticate(self, force=False):
+        async with self._auth_lock:
+            if self._authenticated and not force:
+                return True
+            ticket = odoo_breaker.check()
+            started = time.perf_counter()
+            try:
+                payload = {
+                    "jsonrpc": "2.0",
+                    "params": {
+                        "db": ODOO_DB,
+                        "login": ODOO_USER,
+                        "password": ODOO_PASS
+                    }
+                }
+                try:
+                    response = await self.session.post(f"{self.url}/web/session/authenticate", json=payload, timeout=20)
+                except httpx.HTTPError as e:
+                    odoo_breaker.record(False, time.perf_counter() - started, type(e).__name__, ticket)
+                    raise
+                odoo_breaker.record(response.status_code < 500, time.perf_counter() - started, f"HTTP {response.status_code}", ticket)
+                result = response.json()
+                self._authenticated = not result.get("error")
+                if result.get("error"):
+                    logger.error(f"Odoo Auth Error: {result['error']}")
+                return self._authenticated
+            except Exception as e:
+                logger.error(f"Odoo Connection Error: {e}")
+                self._authenticated = False
+                return False
+
+    async def call_kw(self, model, method, args=None, kwargs=None, interactive=False, with_size=False):
+        """Resultado de Odoo o None si Odoo devolvió un error; con `with_size`, (resultado, bytes de la respuesta)."""
+        payload = {
+            "jsonrpc": "2.0",
+            "method": "call",
+            "params": {
+                "model": model,
+                "method": method,
+                "args": args or [],
+                "kwargs": kwargs or {}
+            },
+            "id": 1
+        }
+        started, size, retries, result, failure = time.perf_counter(), 0, 0, None, None
+        # Sync calls may legitimately take up to ODOO_TIMEOUT: not slow for the breaker
+        timeout, slow_after = (ODOO_INTERACTIVE_TIMEOUT, None) if interactive else (ODOO_TIMEOUT, ODOO_TIMEOUT)
+        semaphore = self.interactive_semaphore if interactive else self.semaphore
+        try:
+            for attempt in range(2):
+                async with semaphore:
+                    # Checked once a slot is free: calls queued behind a failing Odoo fail fast too
+                    ticket = odoo_breaker.check()
+                    call_started = time.perf_counter()
+                    try:
+                        response = await self.session.post(f"{self.url}/web/dataset/call_kw", json=payload, timeout=timeout)
+                    except httpx.HTTPError as e:
+                        odoo_breaker.record(False, time.perf_counter() - call_started, type(e).__name__, ticket, slow_after)
+                        raise
+                odoo_breaker.record(response.status_code < 500, time.perf_counter() - call_started, f"HTTP {response.status_code}",
+                                    ticket, slow_after)
+                size += len(response.content)
+                data = await asyncio.to_thread(response.json) if len(response.content) > ODOO_THREAD_DECODE_BYTES else response.json()
+                error = data.get("error")
+                if not error:
+                    result = data.get("result")
+                    return (result, size) if with_size else result
+                # Session expired (code 100): re-authenticate once and retry
+                if attempt == 0 and error.get("code") == 100 and await self.authenticate(force=True):
+                    retries += 1
+                    continue
+                failure = error.get('data', {}).get('message') or error.get('message') or "odoo_error"
+                logger.error(f"Odoo error on {model}.{method}: {failure}")
+                return (None, size) if with_size else None
+        except Exception as e:
+            failure = type(e).__name__
+            raise
+        finally:
+            rows = len(result) if isinstance(result, (list, dict)) else (1 if result is not None else 0)
+            sync_metrics.record_call(model, method, time.perf_counter() - started, rows, size, retries, failure)
+
+    async def close(self):
+        await self.session.aclose()
+
+# One shared client (connection pool + semaphore + session) per event loop
+_async_clients = {}
+
+async def get_async_odoo_client():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        for old_loop in [l for l in _async_clients if l.is_closed()]:
+            _async_clients.pop(old_loop, None)
+        client = _async_clients[loop] = AsyncOdooClient()
+    return client
+
 def calculate_abc_segments(data_dict, force_aa_threshold=None):
     if not data_dict: return {}
     
@@ -230,158 +438,231 @@ def calculate_abc_segments(data_dict, force_aa_threshold=None):
         results[pid] = {'cat': best, 'part': round(part, 2), 'cum': round(cum_perc, 2)}
     return results
 
-def fetch_active_products_data():
-    global _is_syncing
-    if _is_syncing:
-        logger.warning("Sincronización ya está en curso. Saltando.")
-        return None
-        
-    _is_syncing = True
-    client = OdooClient()
-    if not client.authenticate():
-        logger.error("Failed to authenticate with Odoo")
+def fetch_active_products_data(full=False):
+    """Punto de entrada síncrono (scripts, hilos): ejecuta la sincronización en su propio event loop."""
+    async def run():
+        try:
+            return await fetch_active_products_data_async(full)
+        finally:
+            client = _async_clients.pop(asyncio.get_running_loop(), None)
+            if client: await client.close()
+    return asyncio.run(run())
+
+def staleness_headers(meta):
+    """Edad del snapshot servido y si está desactualizado (Odoo con el circuito abierto o la última sync falló)."""
+    stale = odoo_breaker.state != "closed" or meta.get("sync_status") == "error"
+    return {
+        "X-Data-Age": str(int(time.time() - meta["published_ts"])) if meta.get("published_ts") else "",
+        "X-Stale": "true" if stale else "false",
+        "X-Odoo-Circuit": odoo_breaker.state,
+    }
+
+def shared_sync_state():
+    """(is_syncing, next_sync): el líder usa su propio estado; los seguidores, el sidecar que escribe el líder."""
+    if snapshots.lease.is_leader: return sync_coordinator.running, _next_sync_time
+    meta = snapshots.meta()
+    # A leader that died mid-sync leaves sync_status="syncing"; it only counts while someone holds the lease
+    syncing = meta.get("sync_status") == "syncing" and snapshots.lease.holder_alive()
+    return syncing, meta.get("next_sync")
+
+async def fetch_active_products_data_async(full=False, source="script"):
+    """Pide una sincronización al coordinador (se suma a la que esté en curso) y devuelve su resultado."""
+    return await sync_coordinator.run(full, source)
+
+async def run_sync_job(job):
+    """Una corrida de sincronización (sólo la invoca sync_coordinator, que garantiza una a la vez)."""
+    if not snapshots.lease.try_acquire():
+        logger.warning("Otro proceso es el líder de sincronización. Saltando.")
+        job.state, job.error = "skipped", "not the sync leader"
         return None
 
+    full = job.mode == "full"
+    recorder, graph, master = None, None, None
     try:
-        # 1. Start discovery (Warehouses and internal location IDs)
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            fut_wh = executor.submit(client.call_kw, "stock.warehouse", "search_read", [], {"fields": ["id", "name", "code", "lot_stock_id"]})
-            fut_loc_int = executor.submit(client.call_kw, "stock.location", "search_read", [[('usage', '=', 'internal')]], {"fields": ["id", "warehouse_id", "complete_name"]})
-            fut_loc_cust = executor.submit(client.call_kw, "stock.location", "search", [[('usage', '=', 'customer')]])
-            fut_pts = executor.submit(client.call_kw, "stock.picking.type", "search_read", [], {"fields": ["id", "warehouse_id"]})
-            fut_tags = executor.submit(client.call_kw, "product.tag", "search_read", [], {"fields": ["id", "name"]})
-            
-            warehouses = fut_wh.result() or []
-            locations_int = fut_loc_int.result() or []
-            customer_loc_ids = fut_loc_cust.result() or []
-            pts = fut_pts.result() or []
-            tags_res = fut_tags.result() or []
-            
-        tag_map = {t['id']: t['name'] for t in tags_res}
-            
-        logger.info(f"Discovery: WH={len(warehouses)}, LocInt={len(locations_int)}, LocCust={len(customer_loc_ids)}, PTs={len(pts)}")
-
-        wh_map = {wh['id']: wh for wh in warehouses}
-        # Improved Keyword Map: map 'ACHUMANI' -> wh_id
-        wh_keywords = {}
-        for wh_id, wh in wh_map.items():
-            name = wh['name'].upper()
-            # Extract distinctive part (after ANDYS)
-            clean = name.replace("ANDYS", "").strip()
-            if clean:
-                wh_keywords[clean.split()[0]] = wh_id
-            wh_keywords[wh['code'].upper()] = wh_id
-
-        pt_to_wh = {}
-        for pt in pts:
-            if pt.get('warehouse_id'): 
-                pt_to_wh[pt['id']] = pt['warehouse_id'][0]
-            else:
-                pt_name = pt.get('name', '').upper()
-                # Try keyword matching (e.g., if 'ACHUMANI' is in 'PoS Orders Achumani')
-                matched = False
-                for kw, wh_id in wh_keywords.items():
-                    if kw in pt_name:
-                        pt_to_wh[pt['id']] = wh_id
-                        matched = True
-                        break
-                if not matched:
-                    # Fallback to prefix matching
-                    for wh_id, wh in wh_map.items():
-                        if wh['code'].upper() in pt_name:
-                            pt_to_wh[pt['id']] = wh_id; break
-
-        internal_loc_ids = [l['id'] for l in locations_int]
-        loc_to_wh = {}
-        for l in locations_int:
-            if l.get('warehouse_id'): 
-                loc_to_wh[l['id']] = l['warehouse_id'][0]
-            else:
-                l_name = l['complete_name'].upper()
-                for kw, wh_id in wh_keywords.items():
-                    if kw in l_name:
-                        loc_to_wh[l['id']] = wh_id; break
-
-        date_90_ago = (datetime.now() - timedelta(days=90)).strftime('%Y-%m-%d %H:%M:%S')
+        snapshots.update_meta(sync_status="syncing", sync_started_at=datetime.now().isoformat())
+        client = await get_async_odoo_client()
+        if not await client.authenticate():
+            raise RuntimeError("Failed to authenticate with Odoo")
+        # 0. Sync mode: incremental reuses master records unchanged since the last marks
+        master = open_master_store()
+        incremental = not full and not should_run_full_sync(master)
+        marks = master.get_meta("marks", {}) if incremental else {}
+        marks.setdefault("product.template", marks.get("product.product"))
+        # Ids whose read was given up last cycle: re-read this time whatever their write_date says
+        retry_ids = master.get_meta("retry_ids", {})
+        # Odoo stores write_date in UTC
+        new_mark = (datetime.utcnow() - timedelta(minutes=SYNC_MARK_OVERLAP_MIN)).strftime('%Y-%m-%d %H:%M:%S')
+        logger.info(f"Sync mode: {'INCREMENTAL' if incremental else 'FULL'}")
+        recorder = sync_metrics.begin_sync("incremental" if incremental else "full")
+        job.mode = recorder.mode
+        sync_events.publish("sync_start", {"is_syncing": True, "phase": None, "next_sync": _next_sync_time}, mode=recorder.mode, job=job.id)
+
+        today = datetime.now().date()
+        date_90_ago = today - timedelta(days=SALES_LEDGER_RETENTION_DAYS)
         date_30_ago = (datetime.now() - timedelta(days=30)).replace(hour=0, minute=0, second=0).strftime('%Y-%m-%d %H:%M:%S')
 
-        # 2. Parallel Core Data (Rotation 90d, Stock, POS Revenue)
-        with concurrent.futures.ThreadPoolExecutor(max_workers=15) as executor:
-            domain_rot = [('date', '>=', date_30_ago), ('state', '=', 'done'), 
-                          ('location_dest_id', 'in', customer_loc_ids), ('location_id', 'in', internal_loc_ids)]
-            fut_rot = executor.submit(client.call_kw, "stock.move.line", "read_group", 
-                                     [domain_rot, ['product_id', 'location_id', 'quantity:sum'], ['product_id', 'location_id']], {"lazy": False})
-            
-            domain_stock = [('location_id', 'in', internal_loc_ids), ('quantity', '!=', 0)]
-            fut_stock = executor.submit(client.call_kw, "stock.quant", "read_group",
-                                       [domain_stock, ['product_id', 'location_id', 'quantity:sum'], ['product_id', 'location_id']], {"lazy": False})
-
-            # POS Revenue Optimization: Global
-            rev_domain = [('order_id.date_order', '>=', date_30_ago)]
-            fut_pos_global = executor.submit(client.call_kw, "pos.order.line", "read_group", 
-                                            [rev_domain, ['product_id', 'price_subtotal_incl:sum'], ['product_id']], {"lazy": False})
-            
-            # POS Revenue Optimization: Per-Warehouse (Parallel)
-            wh_rev_futs = {}
-            for wh_id in wh_map:
-                d = rev_domain + [('order_id.picking_type_id.warehouse_id', '=', wh_id)]
-                wh_rev_futs[wh_id] = executor.submit(client.call_kw, "pos.order.line", "read_group", 
-                                                    [d, ['product_id', 'price_subtotal_incl:sum'], ['product_id']], {"lazy": False})
-
-            rot_groups = fut_rot.result() or []
-            logger.info("Rotation data received")
-            stock_groups = fut_stock.result() or []
-            logger.info("Stock data received")
-            pos_global_groups = fut_pos_global.result() or []
-            logger.info("POS Global data received")
-            
-            logger.info(f"Odoo Core Data: Rot={len(rot_groups)}, Stock={len(stock_groups)}, POS Global={len(pos_global_groups)}")
-
-        # 3. Processing Maps (Rotation and Stock)
-        rotation_map, rotation_by_wh = {}, {}
-        for g in rot_groups:
-            if not g.get('product_id'): continue
-            pid, lid, qty = g['product_id'][0], g['location_id'][0], g.get('quantity') or 0
-            wh_id = loc_to_wh.get(lid)
-            rotation_map[pid] = rotation_map.get(pid, 0) + qty
-            if wh_id:
-                if pid not in rotation_by_wh: rotation_by_wh[pid] = {}
-                rotation_by_wh[pid][wh_id] = rotation_by_wh[pid].get(wh_id, 0) + qty
-
-        stock_by_wh = {}
-        for g in stock_groups:
-            if not g.get('product_id'): continue
-            pid, lid, qty = g['product_id'][0], g['location_id'][0], g.get('quantity') or 0
-            wh_id = loc_to_wh.get(lid)
-            if wh_id:
-                if pid not in stock_by_wh: stock_by_wh[pid] = {}
-                stock_by_wh[pid][wh_id] = stock_by_wh[pid].get(wh_id, 0) + qty
-
-        # Processing POS Revenue Maps
-        revenue_map = {g['product_id'][0]: (g.get('price_subtotal_incl') or 0) for g in pos_global_groups if g.get('product_id')}
-        revenue_by_wh = {}
-        for wh_id, fut in wh_rev_futs.items():
-            wh_res = fut.result() or []
-            for g in wh_res:
+        # Ids referenced by this run; a full rebuild drops the other master records once it finishes
+        seen_ids = {"products": set(), "suppliers": set(), "partners": set()}
+        # Ids Odoo never returned (kept from the master copy) and models whose change query failed:
+        # both are picked up again next cycle instead of waiting for the next full rebuild
+        gave_up_ids = {"products": set(), "suppliers": set(), "partners": set()}
+        failed_marks = set()
+
+        # Each phase is a node of the sync graph; it starts as soon as its dependencies finish
+        def on_progress(phase, done, total):
+            job.progress(phase, done, total)
+            sync_events.publish("sync_progress", {"phase": phase}, done=done, total=total, job=job.id)
+        graph = SyncGraph("sync", on_progress=on_progress)
+
+        # 1. Discovery: cached topology (warehouses, locations, picking types, tags); full rebuilds reload it
+        @graph.node("discovery")
+        async def discovery(ctx):
+            disc = await topology.get(client, force=not incremental)
+            if disc is None:
+                raise RuntimeError("Odoo topology unavailable")
+            logger.info(f"Discovery: WH={len(disc['warehouses'])}, LocInt={len(disc['internal_loc_ids'])}, LocCust={len(disc['customer_loc_ids'])}, PTs={len(disc['pt_to_wh'])}")
+            return disc
+
+        # Incremental: ids written in Odoo after the last mark, with their current write_date
+        @graph.node("changes")
+        async def changes(ctx):
+            products, sellers, partners, templates = await asyncio.gather(
+                fetch_changed(client, "product.product", marks.get("product.product")),
+                fetch_changed(client, "product.supplierinfo", marks.get("product.supplierinfo"), ["product_tmpl_id"]),
+                fetch_changed(client, "res.partner", marks.get("res.partner")),
+                fetch_changed(client, "product.template", marks.get("product.template"))
+            )
+            failed_marks.update(m for m, rows in (("product.product", products), ("product.supplierinfo", sellers),
+                                                   ("res.partner", partners), ("product.template", templates)) if rows is None)
+            products, sellers, partners, templates = (rows or [] for rows in (products, sellers, partners, templates))
+            changed_pids, changed_sids, changed_partners = ({r['id']: r.get('write_date') for r in rows} for rows in (products, sellers, partners))
+            # Template edits and new/edited supplier lines: the variant write_date did not move, None forces the re-read
+            template_pids = await fetch_template_variant_ids(client, {t['id'] for t in templates} |
+                                                             {s['product_tmpl_id'][0] for s in sellers if s.get('product_tmpl_id')})
+            if template_pids is None: failed_marks.update(("product.template", "product.supplierinfo"))
+            changed_pids.update(dict.fromkeys(template_pids or ()))
+            for table, changed in (("products", changed_pids), ("suppliers", changed_sids), ("partners", changed_partners)):
+                changed.update(dict.fromkeys(retry_ids.get(table, ())))
+            if failed_marks: logger.warning(f"Incremental: change queries failed for {sorted(failed_marks)}, their marks stay put")
+            if template_pids: logger.info(f"Incremental: {len(template_pids)} variants with template or supplier changes")
+            return {"products": changed_pids, "suppliers": changed_sids, "partners": changed_partners}
+
+        # 2. Stock
+        @graph.node("stock", deps=["discovery"])
+        async def stock(ctx):
+            disc = ctx["discovery"]
+            domain_stock = [('location_id', 'in', disc["internal_loc_ids"]), ('quantity', '!=', 0)]
+            stock_groups = await client.call_kw("stock.quant", "read_group",
+                                                [domain_stock, ['product_id', 'location_id', 'quantity:sum'], ['product_id', 'location_id']], {"lazy": False})
+            stock_groups = stock_groups or []
+            logger.info(f"Stock data received: {len(stock_groups)} groups")
+
+            stock_by_wh = {}
+            for g in stock_groups:
                 if not g.get('product_id'): continue
-                pid, rev = g['product_id'][0], g.get('price_subtotal_incl') or 0
-                if pid not in revenue_by_wh: revenue_by_wh[pid] = {}
-                revenue_by_wh[pid][wh_id] = rev
-
-        sales_map, sales_by_wh = {}, {}
-        # Populate initially with rotation (physical moves to customer)
-        # This ensures we have sales data even if POS lines are missing or for non-POS backoffice sales
-        for pid, qty in rotation_map.items():
-            sales_map[pid] = qty
-        
-        # Consistent mapping [pid][wh_id]
-        for pid, wh_dict in rotation_by_wh.items():
-            if pid not in sales_by_wh: sales_by_wh[pid] = {}
-            for wh_id, qty in wh_dict.items():
-                sales_by_wh[pid][wh_id] = qty
+                pid, lid, qty = g['product_id'][0], g['location_id'][0], g.get('quantity') or 0
+                wh_id = disc["loc_to_wh"].get(lid)
+                if wh_id:
+                    if pid not in stock_by_wh: stock_by_wh[pid] = {}
+                    stock_by_wh[pid][wh_id] = stock_by_wh[pid].get(wh_id, 0) + qty
+            return stock_by_wh
+
+        # 3. Daily sales ledger refresh (rotation and POS revenue) and rolling windows
+        @graph.node("sales", deps=["discovery"])
+        async def sales(ctx):
+            disc = ctx["discovery"]
+            customer_loc_ids, internal_loc_ids, loc_to_wh = disc["customer_loc_ids"], disc["internal_loc_ids"], disc["loc_to_wh"]
+
+            # Only today, yesterday and days missing from the ledger are queried (last 30 days on full rebuilds)
+            ledger = open_sales_ledger()
+            refresh_days = ledger.days_to_refresh(today, SALES_LEDGER_RETENTION_DAYS, refresh_last=2 if incremental else SALES_LEDGER_FULL_REFRESH_DAYS + 1)
+
+            def bounds(first, last):
+                start = datetime.combine(first, datetime.min.time())
+                end = datetime.combine(last, datetime.min.time()) + timedelta(days=1)
+                return start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S')
+
+            def pos_domain(day_start, day_end):
+                return [('order_id.date_order', '>=', day_start), ('order_id.date_order', '<', day_end)]
+
+            # The whole range goes in one read_group per model grouped by day; buckets are split locally
+            range_start, range_end = bounds(min(refresh_days), max(refresh_days))
+
+            async def fetch_rotation():
+                domain_rot = [('date', '>=', range_start), ('date', '<', range_end), ('state', '=', 'done'), 
+                              ('location_dest_id', 'in', customer_loc_ids), ('location_id', 'in', internal_loc_ids)]
+                groups = await client.call_kw("stock.move.line", "read_group", 
+                                              [domain_rot, ['product_id', 'location_id', 'quantity:sum'], ['product_id', 'location_id', 'date:day']],
+                                              {"lazy": False, "context": {"tz": "UTC"}})
+                if groups is None:
+                    return None
+                by_day = {}
+                for g in groups:
+                    by_day.setdefault(group_day(g, 'date:day'), []).append(g)
+                return by_day
+
+            async def fetch_pos():
+                args = (['price_subtotal_incl'], disc["pt_wh_explicit"], disc["wh_map"])
+                if not related_groupby_rejected():
+                    by_day = await read_group_by_warehouse(client, "pos.order.line", pos_domain(range_start, range_end), *args, day_field="order_id.date_order")
+                    if by_day is not None or not related_groupby_rejected():
+                        return by_day
+                # Odoo can't group by the order date (related field): the day goes in the domain instead
+                per_day = await asyncio.gather(*[read_group_by_warehouse(client, "pos.order.line", pos_domain(*bounds(d, d)), *args) for d in refresh_days])
+                return dict(zip(refresh_days, per_day))
+
+            rot_by_day, pos_by_day = await asyncio.gather(fetch_rotation(), fetch_pos())
+
+            def store_days():
+                refreshed_at = datetime.now().isoformat()
+                for day in refresh_days:
+                    rot_groups = rot_by_day.get(day, []) if rot_by_day is not None else None
+                    pos_res = pos_by_day.get(day, ({}, {})) if pos_by_day is not None else None
+                    if rot_groups is None or pos_res is None:
+                        logger.warning(f"Sales ledger: {day} failed, will retry next cycle")
+                        continue
+                    rows = {}  # {(pid, wh_id): [qty, revenue]}
+                    for g in rot_groups:
+                        if not g.get('product_id'): continue
+                        wh_id = loc_to_wh.get(g['location_id'][0]) or UNASSIGNED_WH
+                        rows.setdefault((g['product_id'][0], wh_id), [0, 0])[0] += g.get('quantity') or 0
+                    pos_totals, pos_by_wh = pos_res
+                    for pid, tot in pos_totals.items():
+                        assigned = 0
+                        for wh_id, v in pos_by_wh.get(pid, {}).items():
+                            rows.setdefault((pid, wh_id), [0, 0])[1] += v['price_subtotal_incl']
+                            assigned += v['price_subtotal_incl']
+                        if abs(tot['price_subtotal_incl'] - assigned) > 0.001:
+                            rows.setdefault((pid, UNASSIGNED_WH), [0, 0])[1] += tot['price_subtotal_incl'] - assigned
+                    ledger.replace_day(day, rows, refreshed_at)
+                ledger.prune(date_90_ago)
+
+                # Rolling windows are local sums over the daily buckets (same 30 days + today as before)
+                window = ledger.window(today - timedelta(days=30))
+                sales_windows = {n: ledger.qty_totals(today - timedelta(days=n)) for n in (7, 60, 90)}
+                ledger.close()
+                return window, sales_windows
+
+            # Ledger writes and window sums are SQLite work: kept off the event loop
+            (rotation_map, rotation_by_wh, revenue_map, revenue_by_wh), sales_windows = await asyncio.to_thread(store_days)
+            logger.info(f"Sales ledger: days refreshed={len(refresh_days)}, Rot products={len(rotation_map)}, POS products={len(revenue_map)}")
+
+            sales_map, sales_by_wh = {}, {}
+            # Populate initially with rotation (physical moves to customer)
+            # This ensures we have sales data even if POS lines are missing or for non-POS backoffice sales
+            for pid, qty in rotation_map.items():
+                sales_map[pid] = qty
+            
+            # Consistent mapping [pid][wh_id]
+            for pid, wh_dict in rotation_by_wh.items():
+                if pid not in sales_by_wh: sales_by_wh[pid] = {}
+                for wh_id, qty in wh_dict.items():
+                    sales_by_wh[pid][wh_id] = qty
+
+            return {"rotation_map": rotation_map, "rotation_by_wh": rotation_by_wh, "revenue_map": revenue_map, "revenue_by_wh": revenue_by_wh,
+                    "sales_windows": sales_windows, "sales_map": sales_map, "sales_by_wh": sales_by_wh}
 
         # 3.5 Purchase Orders (Pending RFQs) - Optimized with read_group for totals
-        logger.info("Fetching pending purchase orders (Last 30 days)...")
         po_line_domain = [
             ('state', 'in', ['draft', 'sent', 'to approve', 'purchase']),
             ('order_id.create_date', '>=', date_30_ago)
@@ -390,315 +671,435 @@ def fetch_active_products_data():
             ('state', 'in', ['draft', 'sent', 'to approve', 'purchase']),
             ('create_date', '>=', date_30_ago)
         ]
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-            fut_po_global = executor.submit(client.call_kw, "purchase.order.line", "read_group",
-                                           [po_line_domain, ['product_id', 'product_qty:sum', 'qty_received:sum'], ['product_id']], {"lazy": False})
-            
-            # Per-Warehouse PO totals
-            wh_po_futs = {}
-            for wh_id in wh_map:
-                d = po_line_domain + [('order_id.picking_type_id.warehouse_id', '=', wh_id)]
-                wh_po_futs[wh_id] = executor.submit(client.call_kw, "purchase.order.line", "read_group",
-                                                     [d, ['product_id', 'product_qty:sum', 'qty_received:sum'], ['product_id']], {"lazy": False})
-
-            # Still fetch a subset of individual lines for tooltip display (capped)
-            fut_po_lines = executor.submit(client.call_kw, "purchase.order.line", "search_read",
-                                         [po_line_domain], 
-                                         {"fields": ["product_id", "product_qty", "qty_received", "order_id", "date_planned"], "limit": 15000})
-
-            # Fetch Orders needed for tooltip details
-            fut_po_orders = executor.submit(client.call_kw, "purchase.order", "search_read", 
+
+        # Pending totals per warehouse (same grouped query as POS revenue)
+        @graph.node("po_totals", deps=["discovery"])
+        async def po_totals(ctx):
+            disc = ctx["discovery"]
+            po_res = await read_group_by_warehouse(client, "purchase.order.line", po_line_domain, ['product_qty', 'qty_received'], disc["pt_wh_explicit"], disc["wh_map"])
+            po_totals, po_by_wh = po_res or ({}, {})
+            pending_by_product = {}  # {pid: {wh_id: qty}}
+            for pid, whs in po_by_wh.items():
+                for wh_id, g in whs.items():
+                    qty = g['product_qty'] - g['qty_received']
+                    if qty <= 0.05: continue
+                    if pid not in pending_by_product: pending_by_product[pid] = {}
+                    pending_by_product[pid][wh_id] = qty
+            logger.info(f"Pending POs: Aggregated totals for {len(po_totals)} products")
+            return pending_by_product
+
+        # Orders referenced by the pending lines (tooltip display); independent of discovery
+        @graph.node("po_orders")
+        async def po_orders(ctx):
+            orders = await client.call_kw("purchase.order", "search_read", 
                                           [po_domain_filter], 
                                           {"fields": ["id", "picking_type_id", "name", "partner_id", "state", "date_order", "date_approve", "create_date", "company_id"]})
-
-            po_global_groups = fut_po_global.result() or []
-            po_lines = fut_po_lines.result() or []
-            orders = fut_po_orders.result() or []
-        
-        po_details = {o['id']: o for o in orders}
-        
-        # Aggregate PO Totals from read_groups
-        pending_by_product = {}  # {pid: {wh_id: qty}}
-        for wh_id, fut in wh_po_futs.items():
-            wh_res = fut.result() or []
-            for g in wh_res:
-                if not g.get('product_id'): continue
-                pid = g['product_id'][0]
-                qty = (g.get('product_qty') or 0) - (g.get('qty_received') or 0)
-                if qty <= 0.05: continue
-                if pid not in pending_by_product: pending_by_product[pid] = {}
-                pending_by_product[pid][wh_id] = qty
-
-        # Aggregate individual orders for tooltip (using the subset of lines fetched)
-        pending_orders_by_product = {}  # {pid: [{order_name, qty, date, supplier}]}
-        for l in po_lines:
-            if not l.get('product_id'): continue
-            pid = l['product_id'][0]
-            qty = (l.get('product_qty') or 0) - (l.get('qty_received') or 0)
-            if qty <= 0.05: continue
-            
-            oid = l['order_id'][0]
-            if oid not in po_details: continue
-            po = po_details[oid]
-            
-            if pid not in pending_orders_by_product: pending_orders_by_product[pid] = []
-            
-            wh_id = None
-            if po.get('picking_type_id'):
-                wh_id = pt_to_wh.get(po['picking_type_id'][0])
-            
-            pending_orders_by_product[pid].append({
-                "order_name": po.get('name', ''),
-                "qty": qty,
-                "date_planned": l.get('date_planned', ''),
-                "supplier": po.get('partner_id', [None, 'N/A'])[1] if po.get('partner_id') else 'N/A',
-                "state": po.get('state', 'draft'),
-                "warehouse_id": wh_id,
-                "company_name": "EXPANDIA" if po.get('company_id') and "Expandia" in str(po['company_id']) else ("ANDYS" if po.get('company_id') and "Andy" in str(po['company_id']) else (str(po.get('company_id', [None, 'N/A'])[1]).split(' ')[0].upper())),
-                "date_order": po.get('date_approve') or po.get('create_date') or ''
-            })
-        
-        logger.info(f"Pending POs: Aggregated totals from {len(po_global_groups)} groups and {len(po_lines)} line details.")
+            return {o['id']: o for o in (orders or [])}
+
+        # Individual pending lines for the tooltip, streamed page by page (keyset on id) into the per-product lists
+        @graph.node("pending_orders", deps=["discovery", "po_orders"])
+        async def pending_orders(ctx):
+            pt_to_wh = ctx["discovery"]["pt_to_wh"]
+            po_details = ctx["po_orders"]
+            pending_orders_by_product = {}  # {pid: [(sort key, {order_name, qty, date, supplier})]}
+
+            def add_lines(lines):
+                for l in lines:
+                    if not l.get('product_id'): continue
+                    pid = l['product_id'][0]
+                    qty = (l.get('product_qty') or 0) - (l.get('qty_received') or 0)
+                    if qty <= 0.05: continue
+                    
+                    oid = l['order_id'][0]
+                    if oid not in po_details: continue
+                    po = po_details[oid]
+                    
+                    if pid not in pending_orders_by_product: pending_orders_by_product[pid] = []
+                    
+                    wh_id = None
+                    if po.get('picking_type_id'):
+                        wh_id = pt_to_wh.get(po['picking_type_id'][0])
+                    
+                    entry = {
+                        "order_name": po.get('name', ''),
+                        "qty": qty,
+                        "date_planned": l.get('date_planned', ''),
+                        "supplier": po.get('partner_id', [None, 'N/A'])[1] if po.get('partner_id') else 'N/A',
+                        "state": po.get('state', 'draft'),
+                        "warehouse_id": wh_id,
+                        "company_name": "EXPANDIA" if po.get('company_id') and "Expandia" in str(po['company_id']) else ("ANDYS" if po.get('company_id') and "Andy" in str(po['company_id']) else (str(po.get('company_id', [None, 'N/A'])[1]).split(' ')[0].upper())),
+                        "date_order": po.get('date_approve') or po.get('create_date') or ''
+                    }
+                    # Sort key kept alongside: partitions are paged concurrently and arrive in any order
+                    pending_orders_by_product[pid].append(((oid, l.get('sequence') or 0, l['id']), entry))
+
+            n_lines, complete = await stream_search_read(client, "purchase.order.line", po_line_domain,
+                                                         ["product_id", "product_qty", "qty_received", "order_id", "date_planned", "sequence"], add_lines)
+            if not complete: logger.warning("Pending POs: some line pages could not be read, tooltips may be incomplete")
+            logger.info(f"Pending POs: {n_lines} line details.")
+            # Same order as the purchase.order.line default (order_id, sequence, id), stable across syncs
+            return {pid: [entry for _, entry in sorted(lines, key=lambda k: k[0])] for pid, lines in pending_orders_by_product.items()}
 
         # 4. Product Details Fetch
-        active_pids = list(set(list(rotation_map.keys()) + list(revenue_map.keys()) + list(stock_by_wh.keys()) + list(pending_by_product.keys())))
-        logger.info(f"Fetching details for {len(active_pids)} unique products...")
-        
-        detail_products = []
-        costs_map = {}
-        
-        # Use a local client for thread safety in threads/executors
-        # Note: xmlrpc.client.ServerProxy is thread-safe for making calls, 
-        # but creating a new one ensures clean state.
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-            fields = ["id", "display_name", "barcode", "seller_ids", "standard_price", "type", "categ_id", "brand_id", "additional_product_tag_ids", "product_tag_ids"]
-            
-            # Helper to create client per thread if needed, but ServerProxy is usually fine. 
-            # We will just use the global client but catch errors better.
-            def fetch_batch(b): 
-                try:
-                    return client.call_kw("product.product", "read", [b], {"fields": fields})
-                except Exception as e:
-                    logger.error(f"Batch fetch error: {e}")
-                    return []
-
-            batches = [active_pids[i:i+500] for i in range(0, len(active_pids), 500)] # Reduced batch size
-            
-            for i, res in enumerate(executor.map(fetch_batch, batches)):
-                if i % 5 == 0: logger.info(f"Processed batch {i+1}/{len(batches)}")
-                for p in (res or []):
-                    detail_products.append(p)
-                    costs_map[p['id']] = p.get('standard_price') or 0
-
-            # Supplier names
+        fields = ["id", "display_name", "barcode", "seller_ids", "standard_price", "type", "categ_id", "brand_id", "additional_product_tag_ids", "product_tag_ids", "write_date"]
+
+        async def read_master(model, table, ids, fields):
+            # Adaptive batched read; ids Odoo never returned fall back to the last copy in the master store
+            seen_ids[table].update(ids)
+            fresh, failed = await read_batched(client, model, ids, fields, concurrency=ODOO_MAX_CONCURRENCY)
+            await asyncio.to_thread(master.put_many, table, fresh)
+            if failed:
+                gave_up_ids[table].update(failed)
+                sync_metrics.record_gave_up(model, failed)
+                stale = await asyncio.to_thread(master.get_many, table, failed)
+                logger.warning(f"{model}: {len(failed)} ids could not be read, {len(stale)} served from the previous master copy")
+                fresh.extend(stale.values())
+            return fresh
+
+        async def read_products(pids, changed_pids):
+            # Only ids missing from the master store or with a different write_date go to Odoo
+            # SQLite lookups and JSON decoding of the hydrated records run off the event loop
+            to_read = await asyncio.to_thread(master.stale_ids, "products", pids, changed_pids) if incremental else pids
+            to_read_set = set(to_read)
+            hydrated = await asyncio.to_thread(master.get_many, "products", [pid for pid in pids if pid not in to_read_set])
+            fresh = await read_master("product.product", "products", to_read, fields)
+            logger.info(f"Product master: {len(hydrated)} hydrated locally, {len(fresh)} read from Odoo")
+            return list(hydrated.values()) + fresh
+
+        # Stocked products (the bulk of the catalogue) are read as soon as stock arrives
+        @graph.node("details_stock", deps=["stock", "changes"])
+        async def details_stock(ctx):
+            return await read_products(list(ctx["stock"]), ctx["changes"]["products"])
+
+        # Remaining active products (sales or pending only) once sales and POs are known
+        @graph.node("details_rest", deps=["sales", "po_totals", "details_stock", "changes"])
+        async def details_rest(ctx):
+            s = ctx["sales"]
+            active = set(s["rotation_map"]) | set(s["revenue_map"]) | set(ctx["stock"]) | set(ctx["po_totals"])
+            rest = list(active - set(ctx["stock"]))
+            logger.info(f"Fetching details for {len(active)} unique products ({len(rest)} without stock)...")
+            return await read_products(rest, ctx["changes"]["products"])
+
+        # Supplier names
+        @graph.node("suppliers", deps=["details_stock", "details_rest", "changes"])
+        async def suppliers(ctx):
+            changed = ctx["changes"]
+            detail_products = ctx["details_stock"] + ctx["details_rest"]
             sel_ids = list(set([sid for p in detail_products for sid in (p.get('seller_ids') or [])]))
             supplier_map = {}
-            if sel_ids:
-                def fetch_s(b): return client.call_kw("product.supplierinfo", "read", [b], {"fields": ["id", "partner_id"]})
-                s_res = []
-                for res in executor.map(fetch_s, [sel_ids[i:i+1000] for i in range(0, len(sel_ids), 1000)]): s_res.extend(res or [])
-                p_ids = list(set([s['partner_id'][0] for s in s_res if s.get('partner_id')]))
-                p_name_m = {}
-                def fetch_p(b): return client.call_kw("res.partner", "read", [b], {"fields": ["id", "name"]})
-                for res in executor.map(fetch_p, [p_ids[i:i+1000] for i in range(0, len(p_ids), 1000)]):
-                    for part in (res or []): p_name_m[part['id']] = part['name']
-                for s in s_res: supplier_map[s['id']] = {"name": p_name_m.get(s['partner_id'][0], "N/A"), "partner_id": s['partner_id'][0]}
-
-        # 5. ABC and Assemble
-        abc_rot_g = calculate_abc_segments(rotation_map, force_aa_threshold=2000)
-        abc_rev_g = calculate_abc_segments(revenue_map)
-        abc_data = {}
-        # Global best category
-        for pid in active_pids:
-            cat_rot = abc_rot_g.get(pid, {'cat': 'E'})['cat']
-            cat_rev = abc_rev_g.get(pid, {'cat': 'E'})['cat']
-            order = {'AA': 0, 'A': 1, 'B': 2, 'C': 3, 'D': 4, 'E': 5}
-            # Prioritize ROTATION (Units) only, per user request.
-            # Revenue is ignored for category classification to reflect true movement.
-            best_cat_global = cat_rot
-            
-            abc_data[pid] = {
-                "category": best_cat_global,
-                "rotation": cat_rot,
-                "revenue": cat_rev,
-                "by_warehouse": {}
-            }
-        
-        # Branch-specific best category
-        all_wh_ids = set()
-        for wh_stocks in stock_by_wh.values():
-            for wh_id in wh_stocks: all_wh_ids.add(wh_id)
-        for wh_dict in rotation_by_wh.values():
-            for wh_id in wh_dict: all_wh_ids.add(wh_id)
-        for wh_dict in revenue_by_wh.values():
-            for wh_id in wh_dict: all_wh_ids.add(wh_id)
-
-        cat_order = {'AA': 0, 'A': 1, 'B': 2, 'C': 3, 'D': 4, 'E': 5}
-        # Pre-calculate products per warehouse to avoid O(N*M) loops
-        pids_by_wh = {}
-        for pid, whs in stock_by_wh.items():
-            for wh_id in whs:
-                if wh_id not in pids_by_wh: pids_by_wh[wh_id] = set()
-                pids_by_wh[wh_id].add(pid)
-        for pid, whv in rotation_by_wh.items():
-            for wh_id in whv:
-                if wh_id not in pids_by_wh: pids_by_wh[wh_id] = set()
-                pids_by_wh[wh_id].add(pid)
-        for pid, whv in revenue_by_wh.items():
-            for wh_id in whv:
-                if wh_id not in pids_by_wh: pids_by_wh[wh_id] = set()
-                pids_by_wh[wh_id].add(pid)
-
-        wh_processed = {}
-        for wh_id in all_wh_ids:
-            # Build dataset for this warehouse
-            wh_pids = pids_by_wh.get(wh_id, set())
-                
-            rot_dat = {p: rotation_by_wh.get(p, {}).get(wh_id, 0) for p in wh_pids}
-            rev_dat = {p: revenue_by_wh.get(p, {}).get(wh_id, 0) for p in wh_pids}
-            
-            s_rot = calculate_abc_segments(rot_dat)
-            s_rev = calculate_abc_segments(rev_dat)
-            
-            c_aa, c_a = 0, 0
-            for pid in wh_pids:
-                if pid not in abc_data: continue
-                # Use ONLY rotation (units) for branch ABC
-                cr = s_rot.get(pid, {'cat': 'E'})['cat']
-                cv = s_rev.get(pid, {'cat': 'E'})['cat']
-                
-                # Manual E override: If no sales (cr='E') but has stock, it's definitely E
-                # (Logic already handles cr='E' from s_rot if val=0, but being explicit helps clarity)
-                
-                if cr == 'AA': c_aa += 1
-                elif cr == 'A': c_a += 1
-                
-                abc_data[pid]["by_warehouse"][str(wh_id)] = {
-                    "category": cr,
-                    "rotation": cr,
-                    "revenue": cv,
-                    "val_rot": round(rot_dat.get(pid, 0), 2), 
-                    "val_rev": round(rev_dat.get(pid, 0), 2)
-                }
-            logger.info(f"ABC Wh {wh_id}: Pids={len(wh_pids)}, AA={c_aa}, A={c_a}")
-            wh_processed[wh_id] = {"AA": c_aa, "A": c_a}
-        
-        # Log global distribution summary
-        total_aa = sum(v["AA"] for v in wh_processed.values())
-        logger.info(f"ABC COMPLETE: Processed {len(all_wh_ids)} whs. Total AA in branches: {total_aa}")
-
-        provider_origins = load_provider_origins()
-        final_products = []
-        for p in detail_products:
-            pid = p['id']
-            sales_val = sales_map.get(pid, 0)
-            rot_val = rotation_map.get(pid, 0)
-            pending_val = float(sum(pending_by_product.get(pid, {}).values()))
-            
-            # Show if it has sales OR rotation OR pending orders
-            if sales_val <= 0.001 and rot_val <= 0.001 and pending_val <= 0.001: continue
-            
-            clean_name = re.sub(r'\[.*?\]', '', p.get('display_name') or "").strip()
-            provider, provider_id = "N/A", None
-            if p.get('seller_ids'):
-                best, fallback = None, None
-                for sid in p['seller_ids']:
-                    if sid in supplier_map:
-                        s = supplier_map[sid]
-                        sn = s['name'].upper()
-                        if "ANDY" in sn and ("STORE" in sn or "TIENDA" in sn or "SRL" in sn):
-                            if not fallback: fallback = s
-                        else: best = s; break
-                sel = best if best else fallback
-                if sel: provider, provider_id = sel['name'], sel['partner_id']
-
-            origin = provider_origins.get(provider.strip().upper(), "N/A")
-            abc_item = abc_data.get(pid, {})
-            total_stock = float(sum(stock_by_wh.get(pid, {}).values()))
-            
-            final_products.append({
-                "id": pid, "barcode": p.get('barcode') or "", "name": clean_name, "provider": provider, "origen": origin,
-                "total_stock": total_stock, "stock_by_wh": {str(k): float(v) for k, v in stock_by_wh.get(pid, {}).items()},
-                "sales_30d": float(sales_val), "sales_30d_global": float(rotation_map.get(pid, 0)),
-                "sales_by_wh": {str(wh): float(q) for wh, q in sales_by_wh.get(pid, {}).items() if q > 0.05},
-                "total_pending": float(sum(pending_by_product.get(pid, {}).values())),
-                "pending_by_wh": {str(wh): float(q) for wh, q in pending_by_product.get(pid, {}).items()},
-                "pending_orders": pending_orders_by_product.get(pid, []),
-                "abc_category": abc_item.get('category', 'E'), "abc_details": f"{abc_item.get('rotation', 'E')}/{abc_item.get('revenue', 'E')}",
-                "abc_by_wh": abc_item.get("by_warehouse", {}), "type_name": p.get('type') or "consu",
-                "category_name": p['categ_id'][1] if isinstance(p.get('categ_id'), (list, tuple)) else "N/A",
-                "brand_name": p['brand_id'][1] if isinstance(p.get('brand_id'), (list, tuple)) else "N/A",
-                "tags": [tag_map.get(tid) for tid in (list(set((p.get('additional_product_tag_ids') or []) + (p.get('product_tag_ids') or [])))) if tag_map.get(tid)]
-            })
-            # If no tags, we could add 'Ninguno' here, but usually 'All' covers it. 
-            # However, Odoo shows 'Ninguno', so let's add it if empty for better UX.
-            if not final_products[-1]["tags"]:
-                final_products[-1]["tags"] = ["Ninguno"]
-
-        summary = {"rotation": {}, "revenue": {}}
-        for i in abc_rot_g.values(): summary["rotation"][i['cat']] = summary["rotation"].get(i['cat'], 0) + 1
-        for i in abc_rev_g.values(): summary["revenue"][i['cat']] = summary["revenue"].get(i['cat'], 0) + 1
-
-        cache_data = {
-            "last_update": datetime.now().isoformat(), "products": final_products, "warehouses": warehouses,
-            "abc_summary": summary, 
-            "global_stats": {
-                "pending": len([p for p in final_products if p['total_pending'] > 0]),
-                "out_of_stock": len([p for p in final_products if p['total_stock'] <= 0])
-            },
-            "next_sync": _next_sync_time
-        }
-        with open(CACHE_FILE, "w") as f: json.dump(cache_data, f)
-        try:
-            with gzip.open(CACHE_FILE + ".gz", "wb") as f: f.write(json.dumps(cache_data).encode('utf-8'))
-        except: pass
-        logger.info(f"Cache saved: {len(final_products)} products.")
-        return cache_data
+            if not sel_ids: return supplier_map
+            sel_to_read = await asyncio.to_thread(master.stale_ids, "suppliers", sel_ids, changed["suppliers"]) if incremental else sel_ids
+            sel_to_read_set = set(sel_to_read)
+            s_res = list((await asyncio.to_thread(master.get_many, "suppliers", [sid for sid in sel_ids if sid not in sel_to_read_set])).values())
+            s_fresh = await read_master("product.supplierinfo", "suppliers", sel_to_read, ["id", "partner_id", "write_date"])
+            s_res.extend(s_fresh)
+
+            p_ids = list(set([s['partner_id'][0] for s in s_res if s.get('partner_id')]))
+            part_to_read = await asyncio.to_thread(master.stale_ids, "partners", p_ids, changed["partners"]) if incremental else p_ids
+            part_to_read_set = set(part_to_read)
+            p_stored = await asyncio.to_thread(master.get_many, "partners", [pid for pid in p_ids if pid not in part_to_read_set])
+            p_name_m = {pid: part['name'] for pid, part in p_stored.items()}
+            p_fresh = await read_master("res.partner", "partners", part_to_read, ["id", "name", "write_date"])
+            for part in p_fresh: p_name_m[part['id']] = part['name']
+            logger.info(f"Supplier master: read {len(s_fresh)}/{len(sel_ids)} sellers, {len(p_fresh)}/{len(p_ids)} partners from Odoo")
+            for s in s_res:
+                if not s.get('partner_id'): continue
+                supplier_map[s['id']] = {"name": p_name_m.get(s['partner_id'][0], "N/A"), "partner_id": s['partner_id'][0]}
+            return supplier_map
+
+        # 5. ABC, assembly and cache write are CPU-bound: run them off the event loop.
+        #    Cold start (nothing published yet): partial layers are published as soon as their phases finish,
+        #    each one a normal version; a layer that would land after a more complete one is skipped.
+        publish_lock, published_rank = threading.Lock(), [0]
+        def publish_layer(ctx, rank, layer):
+            with publish_lock:
+                if rank <= published_rank[0]: return None
+                data = assemble_snapshot(ctx, layer)
+                published_rank[0] = rank
+            if layer:
+                sync_events.publish("snapshot", {"version": snapshots.meta().get("version")}, partial=layer, job=job.id)
+            return data
+
+        if snapshots.meta().get("version") is None:
+            @graph.node("preview_stock", deps=["discovery", "stock", "details_stock"])
+            async def preview_stock(ctx):
+                await asyncio.to_thread(publish_layer, ctx, 1, "stock")
+
+            @graph.node("preview_sales", deps=["discovery", "stock", "sales", "po_totals", "details_stock", "details_rest"])
+            async def preview_sales(ctx):
+                await asyncio.to_thread(publish_layer, ctx, 2, "sales")
+
+        @graph.node("assemble", deps=["discovery", "stock", "sales", "po_totals", "pending_orders", "details_stock", "details_rest", "suppliers"])
+        async def assemble(ctx):
+            return await asyncio.to_thread(publish_layer, ctx, 3, None)
+
+        ctx = await graph.run()
+
+        # High-water marks for the next incremental cycle (a model whose change query failed keeps its mark)
+        master.set_meta("marks", {m: marks[m] if m in failed_marks else new_mark
+                                  for m in ("product.product", "product.template", "product.supplierinfo", "res.partner")})
+        master.set_meta("retry_ids", {table: sorted(ids) for table, ids in gave_up_ids.items() if ids})
+        if not incremental:
+            # Old rows were kept during the run as fallback for ids Odoo failed to return
+            for table, ids in seen_ids.items():
+                dropped = master.retain(table, ids)
+                if dropped: logger.info(f"Product master: dropped {dropped} {table} no longer referenced")
+            master.set_meta("last_full", datetime.now().isoformat())
+
+        graph.log_summary()
+        sync_metrics.end_sync(recorder, "ok", graph.timings, graph.critical_path(), len(ctx["assemble"]["products"]))
+        snapshots.update_meta(sync_status="ok", sync_error=None)
+        sync_events.publish("sync_complete", {"is_syncing": False, "phase": None, "version": snapshots.meta().get("version")},
+                            products=len(ctx["assemble"]["products"]), job=job.id)
+        return ctx["assemble"]
     except Exception as e:
         logger.error(f"Error Turbo Sync: {e}", exc_info=True)
+        job.state, job.error = "error", str(e)
+        try: snapshots.update_meta(sync_status="error", sync_error=str(e))
+        except Exception: pass
+        sync_events.publish("sync_error", {"is_syncing": False, "phase": None}, error=str(e), job=job.id)
+        if recorder is not None:
+            sync_metrics.end_sync(recorder, "error", graph.timings if graph else None, graph.critical_path() if graph else None)
         return None
     finally:
-        _is_syncing = False
+        if master is not None: master.close()
+
+# Phases still missing in each partial layer of a cold start (see run_sync_job)
+SNAPSHOT_LAYERS = {
+    "stock": ["sales", "abc", "pending_orders", "suppliers"],
+    "sales": ["pending_orders", "suppliers"],
+}
+EMPTY_SALES = {"rotation_map": {}, "rotation_by_wh": {}, "revenue_map": {}, "revenue_by_wh": {},
+               "sales_windows": {7: {}, 60: {}, 90: {}}, "sales_map": {}, "sales_by_wh": {}}
+
+def assemble_snapshot(ctx, layer=None):
+    """
+    ABC por almacén y global, armado de filas de producto y escritura del caché a partir de los nodos del grafo.
+    Con `layer` ("stock" / "sales") publica una versión parcial: las fases que aún no terminaron quedan vacías
+    y, sin ventas, se listan los productos con stock.
+    """
+    disc, s = ctx["discovery"], ctx.get("sales") or EMPTY_SALES
+    warehouses, tag_map = disc["warehouses"], disc["tag_map"]
+    stock_by_wh = ctx["stock"]
+    rotation_map, rotation_by_wh = s["rotation_map"], s["rotation_by_wh"]
+    revenue_map, revenue_by_wh = s["revenue_map"], s["revenue_by_wh"]
+    sales_map, sales_by_wh, sales_windows = s["sales_map"], s["sales_by_wh"], s["sales_windows"]
+    pending_by_product, pending_orders_by_product = ctx.get("po_totals") or {}, ctx.get("pending_orders") or {}
+    detail_products = ctx["details_stock"] + (ctx.get("details_rest") or [])
+    supplier_map = ctx.get("suppliers") or {}
+    active_pids = [p['id'] for p in detail_products]
+
+    # 5. ABC and Assemble
+    abc_rot_g = calculate_abc_segments(rotation_map, force_aa_threshold=2000)
+    abc_rev_g = calculate_abc_segments(revenue_map)
+    abc_data = {}
+    # Global best category
+    for pid in active_pids:
+        cat_rot = abc_rot_g.get(pid, {'cat': 'E'})['cat']
+        cat_rev = abc_rev_g.get(pid, {'cat': 'E'})['cat']
+        order = {'AA': 0, 'A': 1, 'B': 2, 'C': 3, 'D': 4, 'E': 5}
+        # Prioritize ROTATION (Units) only, per user request.
+        # Revenue is ignored for category classification to reflect true movement.
+        best_cat_global = cat_rot
+    
+        abc_data[pid] = {
+            "category": best_cat_global,
+            "rotation": cat_rot,
+            "revenue": cat_rev,
+            "by_warehouse": {}
+        }
+
+    # Branch-specific best category
+    all_wh_ids = set()
+    for wh_stocks in stock_by_wh.values():
+        for wh_id in wh_stocks: all_wh_ids.add(wh_id)
+    for wh_dict in rotation_by_wh.values():
+        for wh_id in wh_dict: all_wh_ids.add(wh_id)
+    for wh_dict in revenue_by_wh.values():
+        for wh_id in wh_dict: all_wh_ids.add(wh_id)
+
+    cat_order = {'AA': 0, 'A': 1, 'B': 2, 'C': 3, 'D': 4, 'E': 5}
+    # Pre-calculate products per warehouse to avoid O(N*M) loops
+    pids_by_wh = {}
+    for pid, whs in stock_by_wh.items():
+        for wh_id in whs:
+            if wh_id not in pids_by_wh: pids_by_wh[wh_id] = set()
+            pids_by_wh[wh_id].add(pid)
+    for pid, whv in rotation_by_wh.items():
+        for wh_id in whv:
+            if wh_id not in pids_by_wh: pids_by_wh[wh_id] = set()
+            pids_by_wh[wh_id].add(pid)
+    for pid, whv in revenue_by_wh.items():
+        for wh_id in whv:
+            if wh_id not in pids_by_wh: pids_by_wh[wh_id] = set()
+            pids_by_wh[wh_id].add(pid)
+
+    wh_processed = {}
+    for wh_id in all_wh_ids:
+        # Build dataset for this warehouse
+        wh_pids = pids_by_wh.get(wh_id, set())
+        
+        rot_dat = {p: rotation_by_wh.get(p, {}).get(wh_id, 0) for p in wh_pids}
+        rev_dat = {p: revenue_by_wh.get(p, {}).get(wh_id, 0) for p in wh_pids}
+    
+        s_rot = calculate_abc_segments(rot_dat)
+        s_rev = calculate_abc_segments(rev_dat)
+    
+        c_aa, c_a = 0, 0
+        for pid in wh_pids:
+            if pid not in abc_data: continue
+            # Use ONLY rotation (units) for branch ABC
+            cr = s_rot.get(pid, {'cat': 'E'})['cat']
+            cv = s_rev.get(pid, {'cat': 'E'})['cat']
+        
+            # Manual E override: If no sales (cr='E') but has stock, it's definitely E
+            # (Logic already handles cr='E' from s_rot if val=0, but being explicit helps clarity)
+        
+            if cr == 'AA': c_aa += 1
+            elif cr == 'A': c_a += 1
+        
+            abc_data[pid]["by_warehouse"][str(wh_id)] = {
+                "category": cr,
+                "rotation": cr,
+                "revenue": cv,
+                "val_rot": round(rot_dat.get(pid, 0), 2), 
+                "val_rev": round(rev_dat.get(pid, 0), 2)
+            }
+        logger.info(f"ABC Wh {wh_id}: Pids={len(wh_pids)}, AA={c_aa}, A={c_a}")
+        wh_processed[wh_id] = {"AA": c_aa, "A": c_a}
+
+    # Log global distribution summary
+    total_aa = sum(v["AA"] for v in wh_processed.values())
+    logger.info(f"ABC COMPLETE: Processed {len(all_wh_ids)} whs. Total AA in branches: {total_aa}")
+
+    provider_origins = load_provider_origins()
+    final_products = []
+    for p in detail_products:
+        pid = p['id']
+        sales_val = sales_map.get(pid, 0)
+        rot_val = rotation_map.get(pid, 0)
+        pending_val = float(sum(pending_by_product.get(pid, {}).values()))
+    
+        # Show if it has sales OR rotation OR pending orders (stock-only layer: sales unknown yet, show stocked products)
+        if layer == "stock":
+            if not any(q > 0 for q in stock_by_wh.get(pid, {}).values()): continue
+        elif sales_val <= 0.001 and rot_val <= 0.001 and pending_val <= 0.001: continue
+    
+        clean_name = re.sub(r'\[.*?\]', '', p.get('display_name') or "").strip()
+        provider, provider_id = "N/A", None
+        if p.get('seller_ids'):
+            best, fallback = None, None
+            for sid in p['seller_ids']:
+                if sid in supplier_map:
+                    s = supplier_map[sid]
+                    sn = s['name'].upper()
+                    if "ANDY" in sn and ("STORE" in sn or "TIENDA" in sn or "SRL" in sn):
+                        if not fallback: fallback = s
+                    else: best = s; break
+            sel = best if best else fallback
+            if sel: provider, provider_id = sel['name'], sel['partner_id']
+
+        origin = provider_origins.get(provider.strip().upper(), "N/A")
+        abc_item = abc_data.get(pid, {})
+        total_stock = float(sum(stock_by_wh.get(pid, {}).values()))
+    
+        final_products.append({
+            "id": pid, "barcode": p.get('barcode') or "", "name": clean_name, "provider": provider, "origen": origin,
+            "total_stock": total_stock, "stock_by_wh": {str(k): float(v) for k, v in stock_by_wh.get(pid, {}).items()},
+            "sales_30d": float(sales_val), "sales_30d_global": float(rotation_map.get(pid, 0)),
+            "sales_7d": float(sales_windows[7].get(pid, 0)), "sales_60d": float(sales_windows[60].get(pid, 0)), "sales_90d": float(sales_windows[90].get(pid, 0)),
+            "sales_by_wh": {str(wh): float(q) for wh, q in sales_by_wh.get(pid, {}).items() if q > 0.05},
+            "total_pending": float(sum(pending_by_product.get(pid, {}).values())),
+            "pending_by_wh": {str(wh): float(q) for wh, q in pending_by_product.get(pid, {}).items()},
+            "pending_orders": pending_orders_by_product.get(pid, []),
+            "abc_category": abc_item.get('category', 'E'), "abc_details": f"{abc_item.get('rotation', 'E')}/{abc_item.get('revenue', 'E')}",
+            "abc_by_wh": abc_item.get("by_warehouse", {}), "type_name": p.get('type') or "consu",
+            "category_name": p['categ_id'][1] if isinstance(p.get('categ_id'), (list, tuple)) else "N/A",
+            "brand_name": p['brand_id'][1] if isinstance(p.get('brand_id'), (list, tuple)) else "N/A",
+            "tags": [tag_map.get(tid) for tid in (list(set((p.get('additional_product_tag_ids') or []) + (p.get('product_tag_ids') or [])))) if tag_map.get(tid)]
+        })
+        # If no tags, we could add 'Ninguno' here, but usually 'All' covers it. 
+        # However, Odoo shows 'Ninguno', so let's add it if empty for better UX.
+        if not final_products[-1]["tags"]:
+            final_products[-1]["tags"] = ["Ninguno"]
+
+    summary = {"rotation": {}, "revenue": {}}
+    for i in abc_rot_g.values(): summary["rotation"][i['cat']] = summary["rotation"].get(i['cat'], 0) + 1
+    for i in abc_rev_g.values(): summary["revenue"][i['cat']] = summary["revenue"].get(i['cat'], 0) + 1
+
+    cache_data = {
+        "last_update": datetime.now().isoformat(), "products": final_products, "warehouses": warehouses,
+        "abc_summary": summary, 
+        "global_stats": {
+            "pending": len([p for p in final_products if p['total_pending'] > 0]),
+            "out_of_stock": len([p for p in final_products if p['total_stock'] <= 0])
+        },
+        "next_sync": _next_sync_time,
+        "partial": layer, "pending_phases": SNAPSHOT_LAYERS.get(layer, [])
+    }
+    # Query index and unfiltered facet counts (global and per warehouse) computed once per sync
+    index = ProductIndex(None, cache_data)
+    cache_data["facets"] = index.facets()["facets"]
+    projections, slim = {}, slim_rows(final_products)
+    for wh in warehouses:
+        if wh.get('id') is None: continue
+        projections[wh['id']] = project_warehouse(cache_data, wh['id'], index.view(wh['id']), slim)
+        projections[wh['id']]["facets"] = index.facets(warehouse_id=wh['id'])["facets"]
+    # Serialized once, written atomically as a new immutable version, with a slim projection per warehouse
+    published = snapshots.publish(cache_data, projections=projections, next_sync=_next_sync_time, partial=layer)
+    index.version = published["version"]
+    product_queries.warm(index)
+    search_indexes.warm(published["version"], cache_data)
+    logger.info(f"Cache saved: {len(final_products)} products{f' (partial: {layer})' if layer else ''}.")
+    return cache_data
 
 async def auto_sync_task():
-    """Bucle interno para sincronizar. Espera 30 minutos DESPUÉS de terminar cada sincronización."""
+    """
+    Bucle interno para sincronizar. Espera 30 minutos DESPUÉS de terminar cada sincronización
+    (también las manuales: una sincronización manual corre el próximo ciclo automático).
+    Con varios workers sólo el líder (lease de snapshots) sincroniza; los demás reintentan tomar el lease.
+    """
     global _next_sync_time
-    logger.info("Iniciando tarea de sincronización automática (GAP de 30 min)")
+    logger.info(f"Iniciando tarea de sincronización automática (GAP de {SYNC_INTERVAL_MINUTES} min)")
+    full, source, following = False, "auto", False
     
     while True:
         try:
+            if not snapshots.lease.try_acquire():
+                if not following: logger.info("Proceso seguidor: otro worker sincroniza; se sirven sus snapshots publicados.")
+                following = True
+                await asyncio.sleep(SYNC_LEASE_RETRY_SECONDS)
+                continue
+            following = False
+
             # 1. Iniciar Sincronización
             logger.info("Iniciando ciclo de sincronización...")
             _next_sync_time = None # Limpiar para indicar que está sucediendo ahora
             
-            # Ejecutar en thread aparte para no bloquear el loop de FastAPI
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(None, fetch_active_products_data)
-            
-            # 2. Calcular Próxima Sincronización (30 min desde AHORA, que ya terminó la anterior)
-            interval_min = 30
-            next_time = datetime.now() + timedelta(minutes=interval_min)
-            _next_sync_time = next_time.isoformat()
-            
-            # 3. Actualizar el archivo de caché en disco para que la API sirva el nuevo cronograma inmediatamente
-            if os.path.exists(CACHE_FILE):
-                try:
-                    with open(CACHE_FILE, "r") as f:
-                        data = json.load(f)
-                    data["next_sync"] = _next_sync_time
-                    with open(CACHE_FILE, "w") as f:
-                        json.dump(data, f)
-                    with gzip.open(CACHE_FILE + ".gz", "wb") as f:
-                        f.write(json.dumps(data).encode('utf-8'))
-                except Exception as ce:
-                    logger.error(f"Error actualizando next_sync en caché: {ce}")
-
-            logger.info(f"Sincronización completada. Próxima programada para: {_next_sync_time}")
+            # E/S asíncrona contra Odoo; el ensamblado pesado corre en un thread aparte
+            await sync_coordinator.run(full, source)
             
-            # 4. Esperar los 30 minutos de GAP
-            await asyncio.sleep(interval_min * 60) 
+            # 2-4. Esperar el GAP desde la última corrida terminada; si en el medio termina una manual,
+            #      el cronograma se recalcula. Un seguidor puede pedir sincronizar antes.
+            request, scheduled_from = None, None
+            while request is None:
+                finished = sync_coordinator.last_finished_ts or time.monotonic()
+                if finished != scheduled_from:
+                    scheduled_from = finished
+                    deadline = finished + SYNC_INTERVAL_MINUTES * 60
+                    _next_sync_time = (datetime.now() + timedelta(seconds=deadline - time.monotonic())).isoformat()
+                    # Guardar el cronograma en el sidecar del snapshot (el snapshot en sí no se reescribe)
+                    try:
+                        snapshots.update_meta(next_sync=_next_sync_time)
+                    except Exception as ce:
+                        logger.error(f"Error actualizando next_sync en caché: {ce}")
+                    sync_events.publish("schedule", {"next_sync": _next_sync_time})
+                    logger.info(f"Sincronización completada. Próxima programada para: {_next_sync_time}")
+                if time.monotonic() >= deadline: break
+                await asyncio.sleep(min(SYNC_REQUEST_POLL_SECONDS, max(0, deadline - time.monotonic())))
+                request = snapshots.lease.take_request()
+            full, source = request == "full", "manual" if request else "auto"
+            if request: logger.info(f"Sincronización solicitada por otro worker ({request}).")
             
         except Exception as e:
             logger.error(f"Error en tarea automática: {e}")
@@ -709,129 +1110,278 @@ async def startup_event():
     asyncio.create_task(auto_sync_task())
 
 @app.get("/api/products")
-async def get_products(request: Request, sync: bool = Query(False), background_tasks: BackgroundTasks = None):
-    global _data_cache, _is_syncing
-    
+async def get_products(request: Request, sync: bool = Query(False), full: bool = Query(False), warehouse_id: int = Query(None)):
     if sync:
-        if _is_syncing:
-            # If already syncing, return lightweight status immediately without loading 18MB file
+        if not snapshots.lease.try_acquire():
+            # Follower worker: the leader runs it (picked up from the sync.request mark)
+            if not shared_sync_state()[0]: snapshots.lease.request_sync(full)
             return Response(content=json.dumps({
                 "status": "syncing",
                 "is_syncing": True,
-                "message": "Sincronización en curso..."
+                "message": "Sincronización solicitada..."
             }), media_type="application/json")
-        else:
-            # Start sync in background
-            background_tasks.add_task(fetch_active_products_data)
+        # Lightweight status (no 18MB payload); concurrent requests coalesce onto the job in flight
+        job = sync_coordinator.request(full, "manual")
+        if job.finished:
             return Response(content=json.dumps({
-                "status": "syncing", 
-                "is_syncing": True,
-                "message": "Iniciando sincronización..."
+                "status": "debounced",
+                "is_syncing": False,
+                "message": "Los datos se sincronizaron hace instantes.",
+                "job": job.to_dict()
             }), media_type="application/json")
+        return Response(content=json.dumps({
+            "status": "syncing",
+            "is_syncing": True,
+            "message": "Sincronización en curso..." if job.requests > 1 else "Iniciando sincronización...",
+            "job": job.to_dict()
+        }), media_type="application/json")
 
 
-    # 1. Pre-Compressed GZip Delivery (FASTEST)
-    # Be case-insensitive for header check
-    accept_encoding = request.headers.get("accept-encoding", "") or request.headers.get("Accept-Encoding", "")
-    accept_encoding = accept_encoding.lower()
-    
-    # Prepare dynamic headers
+    # Dynamic headers (also sent with 304 so the browser refreshes them)
+    meta = snapshots.meta()
+    is_syncing, next_sync = shared_sync_state()
     headers = {
-        "Content-Type": "application/json",
-        "X-Next-Sync": _next_sync_time or "",
-        "X-Is-Syncing": "true" if _is_syncing else "false",
-        "X-Last-Update": str(os.path.getmtime(CACHE_FILE)) if os.path.exists(CACHE_FILE) else ""
+        "X-Next-Sync": next_sync or "",
+        "X-Is-Syncing": "true" if is_syncing else "false",
+        "X-Last-Update": str(meta.get("published_ts", "")),
+        "X-Snapshot-Version": str(meta.get("version", "")),
+        "Cache-Control": "no-cache",
+        "Vary": "Accept, Accept-Encoding",
+        **staleness_headers(meta)
     }
 
-    if "gzip" in accept_encoding and os.path.exists(CACHE_FILE + ".gz"):
-        try:
-            with open(CACHE_FILE + ".gz", "rb") as f:
-                content = f.read()
-                headers["Content-Encoding"] = "gzip"
-                headers["Content-Length"] = str(len(content))
-                return Response(
-                    content=content,
-                    media_type="application/json",
-                    headers=headers
-                )
-        except Exception as e:
-            logger.error(f"Error serving pre-compressed cache: {e}")
+    # 1. Pre-encoded in-memory buffers of the current snapshot (no disk I/O; 304 when the tab already has it).
+    #    With warehouse_id, the slim projection of that warehouse if the current version has one;
+    #    with Accept: application/x-stockpro-columnar, the binary columnar layout (see columnar.py).
+    media_type = "application/json"
+    buffers = snapshots.buffers(warehouse_id) if warehouse_id is not None else None
+    if warehouse_id is not None:
+        headers["X-Warehouse-Projection"] = str(warehouse_id) if buffers is not None else "none"
+    elif columnar.MEDIA_TYPE in request.headers.get("accept", ""):
+        buffers = snapshots.buffers(columnar=True)
+        if buffers is not None: media_type = columnar.MEDIA_TYPE
+    buffers = buffers or snapshots.buffers()
+    if buffers is not None:
+        encoding, content = buffers.pick(request.headers.get("accept-encoding", ""))
+        headers["ETag"] = buffers.etag_for(encoding)
+        if buffers.matches(request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=content, media_type=media_type, headers=headers)
+
+    # 3. Cold start (nothing published yet): start or join the sync and answer right away. The first partial
+    #    version (stock only) is announced over /api/events as soon as it is published.
+    job = sync_coordinator.request(False, "cold") if snapshots.lease.try_acquire() else None
+    if job is None and not shared_sync_state()[0]: snapshots.lease.request_sync()
+    headers["X-Is-Syncing"] = "true"
+    return Response(status_code=202, content=json.dumps({
+        "status": "syncing",
+        "is_syncing": True,
+        "message": "Preparando los primeros datos...",
+        "products": [], "warehouses": [],
+        "job": job.to_dict() if job else None
+    }), media_type="application/json", headers=headers)
+
+def _watch_snapshot_meta():
+    """Cambios hechos por otro proceso (el worker líder, un script de sync): se detectan por el sidecar."""
+    meta, events = snapshots.meta(), []
+    if meta.get("version") is not None and meta.get("version") != sync_events.state["version"]:
+        events.append(("sync_complete", {"version": meta["version"], "next_sync": meta.get("next_sync") or sync_events.state["next_sync"]}))
+    if not snapshots.lease.is_leader:
+        is_syncing, next_sync = shared_sync_state()
+        if is_syncing != sync_events.state["is_syncing"] or next_sync != sync_events.state["next_sync"]:
+            events.append(("status", {"is_syncing": is_syncing, "phase": None, "next_sync": next_sync}))
+    return events
+
+@app.get("/api/events")
+async def sync_event_stream(request: Request):
+    """
+    Server-Sent Events con el estado de sincronización: status (al conectar), sync_start,
+    sync_progress (fase terminada), snapshot (versión parcial del arranque en frío),
+    sync_complete (versión nueva), sync_error y schedule (next_sync). El cliente sólo
+    vuelve a pedir datos cuando cambia la versión.
+    """
+    # Content-Encoding identity: GZipMiddleware leaves the stream alone (older Starlette would compress and buffer it)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Content-Encoding": "identity"}
+    return StreamingResponse(sync_events.stream(request, watch=_watch_snapshot_meta), media_type="text/event-stream", headers=headers)
 
-    # 2. Raw JSON Delivery
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, "rb") as f:
-                content = f.read()
-                return Response(
-                    content=content, 
-                    media_type="application/json",
-                    headers=headers
-                )
-        except Exception as e:
-            logger.error(f"Error reading cache: {e}")
+@app.get("/api/products/changes")
+async def get_product_changes(request: Request, since: int = Query(...)):
+    """
+    Cambios desde la versión `since` (X-Snapshot-Version) hasta la vigente: productos
+    agregados, ids quitados y sólo los campos modificados. Si la versión es demasiado
+    vieja o desconocida responde el snapshot completo con X-Delta: full.
+    """
+    meta = snapshots.meta()
+    is_syncing, next_sync = shared_sync_state()
+    headers = {
+        "X-Next-Sync": next_sync or "",
+        "X-Is-Syncing": "true" if is_syncing else "false",
+        "X-Snapshot-Version": str(meta.get("version", "")),
+        "Cache-Control": "no-cache",
+        **staleness_headers(meta)
+    }
+    changes = await asyncio.to_thread(snapshots.changes_since, since)
+    if changes is not None:
+        headers["X-Delta"] = "partial"
+        return Response(content=json.dumps(changes), media_type="application/json", headers=headers)
+
+    buffers = snapshots.buffers()
+    if buffers is None:
+        return Response(status_code=404, content=json.dumps({"detail": "No snapshot published yet"}), media_type="application/json", headers=headers)
+    encoding, content = buffers.pick(request.headers.get("accept-encoding", ""))
+    headers.update({"X-Delta": "full", "ETag": buffers.etag_for(encoding), "Vary": "Accept-Encoding"})
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=content, media_type="application/json", headers=headers)
+
+@app.get("/api/products/query")
+async def query_products(
+    view: str = Query("products"), warehouse_id: int = Query(None), pending_days: int = Query(None),
+    search: str = Query(""), provider: str = Query(None), origin: str = Query(None), tag: str = Query(None),
+    abc: str = Query(None), product_category: str = Query(None), abc_store: str = Query(None), coverage: str = Query(None),
+    deficient: bool = Query(False), pending: bool = Query(False), out_of_stock: bool = Query(False),
+    out_of_stock_pending: bool = Query(False), status: str = Query(None), product_type: str = Query(None),
+    brand: str = Query(None), target_warehouse_id: int = Query(None), sort: str = Query(None),
+    order: str = Query("asc"), offset: int = Query(0), limit: int = Query(500)
+):
+    """
+    Filtros, orden y paginado de la grilla de productos (vista `products` o `transfers`)
+    evaluados en el servidor sobre el snapshot vigente. Devuelve una página de filas y el total.
+    """
+    params = {k: v for k, v in locals().items()}
+    index = await asyncio.to_thread(product_queries.get, snapshots)
+    if index is None:
+        return {"version": None, "total": 0, "offset": offset, "limit": limit, "rows": []}
+    try:
+        result = await asyncio.to_thread(lambda: index.query(**params))
+    except ValueError as e:
+        return Response(status_code=400, content=json.dumps({"detail": str(e)}), media_type="application/json")
+    result["version"] = index.version
+    return Response(content=json.dumps(result), media_type="application/json",
+                    headers={"X-Snapshot-Version": str(index.version), "Cache-Control": "no-cache"})
+
+@app.get("/api/facets")
+async def get_facets(
+    view: str = Query("products"), warehouse_id: int = Query(None), pending_days: int = Query(None),
+    search: str = Query(""), provider: str = Query(None), origin: str = Query(None), tag: str = Query(None),
+    abc: str = Query(None), product_category: str = Query(None), abc_store: str = Query(None), coverage: str = Query(None),
+    deficient: bool = Query(False), pending: bool = Query(False), out_of_stock: bool = Query(False),
+    out_of_stock_pending: bool = Query(False), status: str = Query(None), product_type: str = Query(None),
+    brand: str = Query(None), target_warehouse_id: int = Query(None)
+):
+    """
+    Conteos de los desplegables (proveedor, origen, etiqueta, ABC, categoría, ABC sucursal,
+    cobertura, tipo, marca, estado) bajo los filtros activos; mismos parámetros que /api/products/query.
+    """
+    params = {k: v for k, v in locals().items()}
+    index = await asyncio.to_thread(product_queries.get, snapshots)
+    if index is None:
+        return {"version": None, "total": 0, "facets": {}}
+    result = await asyncio.to_thread(lambda: index.facets(**params))
+    return Response(content=json.dumps(dict(result, version=index.version)), media_type="application/json",
+                    headers={"X-Snapshot-Version": str(index.version), "Cache-Control": "no-cache"})
+
+@app.get("/api/search")
+async def search_products(q: str = Query(...), limit: int = Query(50)):
+    """Búsqueda por nombre (sin tildes, subcadenas), código de barras, proveedor, marca o categoría, ordenada por relevancia."""
+    index = await asyncio.to_thread(search_indexes.get, snapshots)
+    if index is None:
+        return {"version": None, "query": q, "results": []}
+    started = time.perf_counter()
+    results = index.search(q, limit)
+    return {"version": index.version, "query": q, "results": results, "took_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+@app.get("/api/sync/jobs")
+async def get_sync_jobs():
+    """Corrida en curso, la encolada (si hay) y las últimas terminadas, con su avance por fase."""
+    return {"leader": snapshots.lease.is_leader, "jobs": sync_coordinator.jobs()}
+
+@app.get("/api/sync/jobs/{job_id}")
+async def get_sync_job(job_id: int):
+    job = sync_coordinator.job(job_id)
+    if job is None:
+        return Response(status_code=404, content=json.dumps({"detail": "Unknown sync job"}), media_type="application/json")
+    return job.to_dict()
+
+@app.get("/api/sync/metrics")
+async def get_sync_metrics(last: int = Query(None), calls: bool = Query(False)):
+    """Métricas de las últimas sincronizaciones (fases y llamadas a Odoo) y totales por modelo/método."""
+    return {
+        "syncs": sync_metrics.history(last, include_calls=calls),
+        "odoo_calls": sync_metrics.call_totals(),
+        "odoo_circuit": odoo_breaker.status()
+    }
 
-    # 3. Fallback to Sync
-    data = fetch_active_products_data()
-    if data:
-        return Response(content=json.dumps(data), media_type="application/json")
-    return {"products": [], "warehouses": []}
+@app.get("/api/sync/metrics/prometheus")
+async def get_sync_metrics_prometheus():
+    return Response(content=sync_metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+def _stale_movements(key, error):
+    """Última respuesta buena de (producto, almacén), marcada como desactualizada, o 503 si no hay ninguna."""
+    headers = {"X-Stale": "true", "X-Odoo-Circuit": odoo_breaker.state}
+    stale = movements_cache.stale(key)
+    if stale is None:
+        logger.warning(f"Movements {key}: Odoo unavailable ({error}) and nothing cached")
+        headers["Retry-After"] = str(math.ceil(odoo_breaker.retry_after() or ODOO_BREAKER_COOLDOWN))
+        return Response(status_code=503, content=json.dumps({"detail": "Odoo unavailable", "error": str(error)}), media_type="application/json", headers=headers)
+    age, result = stale
+    logger.warning(f"Movements {key}: Odoo unavailable ({error}); serving last known result ({int(age)}s old)")
+    headers["X-Data-Age"] = str(int(age))
+    return Response(content=json.dumps(result), media_type="application/json", headers=headers)
+
+async def fetch_movements(product_id, warehouse_id):
+    """Últimos 100 movimientos hechos del producto (del almacén, si se pide) con la sesión compartida."""
+    client = await get_async_odoo_client()
+    if not await client.authenticate():
+        raise RuntimeError("Failed to authenticate with Odoo")
 
-@app.get("/api/movements/{product_id}")
-async def get_movements(product_id: int, warehouse_id: int = None):
-    logger.info(f"Fetching movements for product_id: {product_id}, warehouse_id: {warehouse_id}")
-    client = OdooClient()
-    if not client.authenticate(): 
-        logger.error("Failed to authenticate for movements")
-        return []
-    
     domain = [('product_id', '=', product_id), ('state', '=', 'done')]
-    
     if warehouse_id:
-        # Get locations for this warehouse
-        try:
-            # We already have warehouse info from sync, but for this direct call let's fetch code
-            wh = client.call_kw("stock.warehouse", "search_read", [[('id', '=', warehouse_id)]], {"fields": ["code"]})
-            if wh:
-                code = wh[0]['code']
-                # Filter moves where either origin or destination starts with WH code
-                domain.append('|')
-                domain.append(('location_id.complete_name', 'ilike', f"{code}/"))
-                domain.append(('location_dest_id.complete_name', 'ilike', f"{code}/"))
-        except: pass
+        # Internal locations of the warehouse from the cached topology: an indexed `in` instead of an ilike on complete_name
+        disc = topology.current() or await topology.get(client)
+        loc_ids = ((disc or {}).get("wh_locations") or {}).get(warehouse_id)
+        if not loc_ids: return []
+        domain += ['|', ('location_id', 'in', loc_ids), ('location_dest_id', 'in', loc_ids)]
+
+    # Use stock.move which is generally more reliable for historical overview
+    moves = await client.call_kw("stock.move", "search_read", [domain], {
+        "fields": ["date", "reference", "product_uom_qty", "location_id", "location_dest_id"], "limit": 100, "order": "date desc"
+    }, interactive=True)
+    # None is an Odoo error: raising keeps it out of the cache and serves the last good answer instead
+    if moves is None: raise RuntimeError("Odoo error reading stock.move")
+    logger.info(f"Found {len(moves)} moves")
+
+    if not moves:
+        # Fallback to stock.move.line just in case (the result, empty or not, is cached like any other)
+        moves = await client.call_kw("stock.move.line", "search_read", [domain], {
+            "fields": ["date", "reference", "qty_done", "location_id", "location_dest_id"], "limit": 100, "order": "date desc"
+        }, interactive=True)
+        if moves is None: raise RuntimeError("Odoo error reading stock.move.line")
+        if moves:
+            for m in moves:
+                m['product_uom_qty'] = m.pop('qty_done', 0)
+
+    return [
+        {
+            "date": str(m['date']),
+            "ref": m['reference'] or "Sin Ref",
+            "qty": float(m.get('product_uom_qty') or m.get('qty_done') or 0),
+            "from": m['location_id'][1] if isinstance(m['location_id'], (list, tuple)) else "N/A",
+            "to": m['location_dest_id'][1] if isinstance(m['location_dest_id'], (list, tuple)) else "N/A"
+        } for m in (moves or [])
+    ]
 
+@app.get("/api/movements/{product_id}")
+async def get_movements(product_id: int, warehouse_id: int = None):
+    """Movimientos del producto; cacheados por (producto, almacén) hasta el TTL o la próxima versión del snapshot."""
+    key = (product_id, warehouse_id or None)
     try:
-        # Use stock.move which is generally more reliable for historical overview
-        moves = client.call_kw("stock.move", "search_read", 
-                              [domain], 
-                              {
-                                  "fields": ["date", "reference", "product_uom_qty", "location_id", "location_dest_id"], 
-                                  "limit": 100, 
-                                  "order": "date desc"
-                              })
-        
-        logger.info(f"Found {len(moves) if moves else 0} moves")
-        
-        if not moves:
-            # Fallback to stock.move.line just in case
-            moves = client.call_kw("stock.move.line", "search_read", 
-                                  [domain], 
-                                  {"fields": ["date", "reference", "qty_done", "location_id", "location_dest_id"], "limit": 100, "order": "date desc"})
-            if moves:
-                for m in moves:
-                    m['product_uom_qty'] = m.pop('qty_done', 0)
-
-        return [
-            {
-                "date": str(m['date']),
-                "ref": m['reference'] or "Sin Ref",
-                "qty": float(m.get('product_uom_qty') or m.get('qty_done') or 0),
-                "from": m['location_id'][1] if isinstance(m['location_id'], (list, tuple)) else "N/A",
-                "to": m['location_dest_id'][1] if isinstance(m['location_dest_id'], (list, tuple)) else "N/A"
-            } for m in (moves or [])
-        ]
+        return await movements_cache.get_or_fetch(key, snapshots.meta().get("version"), lambda: fetch_movements(product_id, warehouse_id))
     except Exception as e:
         logger.error(f"Error in get_movements: {e}")
-        return []
+        return _stale_movements(key, e)
 
 @app.post("/api/analyze_product")
 async def analyze_product(request: Request):
@@ -911,8 +1461,8 @@ async def analyze_transfers(request: Request):
     try:
         data = await request.json()
         products_list = data.get("products", [])
-        source_wh_name = data.get("source_warehouse_name", "Origen")
-        target_wh_name = data.get("target_warehouse_name", "Destino")
+        source_wh_name = data.get("source_warehouse_name") or topology.warehouse_name(data.get("source_warehouse_id")) or "Origen"
+        target_wh_name = data.get("target_warehouse_name") or topology.warehouse_name(data.get("target_warehouse_id")) or "Destino"
         source_wh_id = str(data.get("source_warehouse_id"))
         target_wh_id = str(data.get("target_warehouse_id"))
 
@@ -1169,7 +1719,7 @@ async def analyze_all_transfers(request: Request):
         
         data = await request.json()
         products_list = data.get("products", [])
-        warehouses = data.get("warehouses", [])
+        warehouses = data.get("warehouses") or topology.warehouses()
         dest_warehouse_id = data.get("destination_warehouse_id")
         use_ml = data.get("use_ml", False)
         
@@ -0,0 +1,65 @@
+"""
+Caché de /api/movements (tooltips de movimientos por producto y almacén).
+
+LRU acotado con TTL, por (producto, almacén). Una entrada sólo está fresca si
+es de la versión vigente del snapshot y tiene menos de `ttl` segundos: al
+publicarse una versión nueva todas quedan vencidas sin recorrerlas. Las
+vencidas se conservan (hasta salir por LRU) para servirlas marcadas como
+desactualizadas si Odoo falla. Pedidos simultáneos de la misma clave esperan
+una única consulta.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+MOVEMENTS_CACHE_ENTRIES = 2000
+
+
+class MovementsCache:
+    def __init__(self, ttl, max_entries=MOVEMENTS_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (fetched_at, snapshot version, result)
+        self._inflight = {}  # key -> asyncio.Task of the query being made
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def fresh(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != version or time.time() - entry[0] > self.ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def stale(self, key):
+        """(edad en segundos, resultado) de la última respuesta buena, o None."""
+        with self._lock:
+            entry = self._entries.get(key)
+        return (time.time() - entry[0], entry[2]) if entry else None
+
+    def put(self, key, version, result):
+        with self._lock:
+            self._entries[key] = (time.time(), version, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def get_or_fetch(self, key, version, fetch):
+        """Resultado fresco de la caché o de `fetch()` (una sola consulta por clave a la vez)."""
+        result = self.fresh(key, version)
+        if result is not None: return result
+        task = self._inflight.get(key)
+        if task is None:
+            async def run():
+                fetched = await fetch()
+                self.put(key, version, fetched)
+                return fetched
+            task = self._inflight[key] = asyncio.ensure_future(run())
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded: a client that goes away does not cancel the query other callers are waiting on
+        return await asyncio.shield(task)
@@ -0,0 +1,90 @@
+"""
+Almacén local (SQLite) de registros maestros de Odoo: productos, proveedores
+(product.supplierinfo) y partners, cada uno con su write_date.
+
+La sincronización sólo vuelve a leer de Odoo los ids nuevos o cuyo write_date
+cambió; el resto se hidrata en bloque desde este archivo.
+
+La sincronización llama a estos métodos desde hilos (asyncio.to_thread): la
+conexión se comparte y cada consulta se hace bajo el mismo lock.
+"""
+
+import json
+import sqlite3
+import threading
+
+TABLES = ("products", "suppliers", "partners")
+# SQLite limits the number of bound parameters per statement
+_CHUNK = 900
+
+
+class ProductMasterStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        for table in TABLES:
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, write_date TEXT, data TEXT NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key, value):
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def write_dates(self, table, ids):
+        """{id: write_date} de los ids presentes en el almacén."""
+        out = {}
+        ids = list(ids)
+        for i in range(0, len(ids), _CHUNK):
+            chunk = ids[i:i+_CHUNK]
+            q = f"SELECT id, write_date FROM {table} WHERE id IN ({','.join('?' * len(chunk))})"
+            with self._lock:
+                for rid, wd in self.conn.execute(q, chunk): out[rid] = wd
+        return out
+
+    def get_many(self, table, ids):
+        """{id: registro} de los ids presentes en el almacén."""
+        out = {}
+        ids = list(ids)
+        for i in range(0, len(ids), _CHUNK):
+            chunk = ids[i:i+_CHUNK]
+            q = f"SELECT id, data FROM {table} WHERE id IN ({','.join('?' * len(chunk))})"
+            with self._lock:
+                rows = self.conn.execute(q, chunk).fetchall()
+            for rid, data in rows: out[rid] = json.loads(data)
+        return out
+
+    def put_many(self, table, records):
+        rows = [(r['id'], r.get('write_date') or None, json.dumps(r)) for r in records]
+        if not rows: return
+        with self._lock, self.conn:
+            self.conn.executemany(f"INSERT OR REPLACE INTO {table} (id, write_date, data) VALUES (?, ?, ?)", rows)
+
+    def retain(self, table, ids):
+        """Borra los registros de `table` cuyo id no está en `ids`; devuelve cuántos borró."""
+        with self._lock, self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep_ids (id INTEGER PRIMARY KEY)")
+            self.conn.execute("DELETE FROM keep_ids")
+            self.conn.executemany("INSERT OR IGNORE INTO keep_ids (id) VALUES (?)", ((i,) for i in ids))
+            deleted = self.conn.execute(f"DELETE FROM {table} WHERE id NOT IN (SELECT id FROM keep_ids)").rowcount
+            self.conn.execute("DELETE FROM keep_ids")
+        return deleted
+
+    def stale_ids(self, table, ids, changed):
+        """
+        Ids que hay que volver a leer: los que no están en el almacén y los que
+        aparecen en `changed` ({id: write_date} de Odoo) con un write_date distinto
+        (None fuerza la relectura).
+        """
+        known = self.write_dates(table, ids)
+        return [i for i in ids if i not in known or (i in changed and (changed[i] is None or changed[i] != known[i]))]
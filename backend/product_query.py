@@ -0,0 +1,417 @@
+"""
+Consultas de productos del lado del servidor (/api/products/query).
+
+Replica los filtros y ordenamientos de App.tsx (baseProcessedProducts,
+productMatchStates, filteredProducts / transferFilteredProducts) sobre
+columnas en memoria del snapshot vigente, para que el navegador reciba sólo
+una página de filas y el total:
+
+- columnas categóricas (proveedor, origen, marca, segmento, categoría, ABC,
+  etiquetas) con un bitmap por valor (un int de Python, bit i = producto i);
+- columnas derivadas por almacén (stock, ventas, cobertura, estado,
+  pendientes filtrados por antigüedad) que se calculan una vez por
+  (almacén, antigüedad, día), con sus propios bitmaps por estado, ABC de
+  sucursal, tramo de cobertura, etc.
+
+Cada filtro activo es un bitmap y la consulta es su AND. Los conteos de los
+desplegables (/api/facets) salen de los mismos bitmaps: cada faceta se cuenta
+con todos los filtros activos menos el suyo, con un AND y un popcount por valor.
+
+El índice se reconstruye sólo cuando cambia la versión publicada; la
+sincronización lo deja armado al publicar.
+"""
+
+import json
+import logging
+import math
+import threading
+from datetime import date, timedelta
+
+logger = logging.getLogger(__name__)
+
+SEGMENTS = ("FRUVER", "CARNICERIA", "GRANIPAN")
+ABC_ORDER = {"AA": 0, "A": 1, "B": 2, "C": 3, "D": 4, "E": 5}
+STATUS_ORDER = {"Sin Stock": 0, "Deficiente": 1, "Normal": 2}
+# Coverage buckets of the UI: (lower bound, lower bound inclusive, upper bound inclusive or None)
+COVERAGE_RANGES = {
+    "0-1": (0, True, 1), "2-5": (2, True, 5), "5-7": (5, False, 7), "8-10": (8, True, 10),
+    "11-15": (11, True, 15), "16-20": (16, True, 20), "21-30": (21, True, 30), "+30": (30, False, None),
+}
+# Transfer view sort keys: (warehouse argument, metric)
+TRANSFER_SORTS = {
+    "origin_stock": ("target", "stock"), "origin_coverage": ("target", "coverage"), "origin_sales": ("target", "sales"),
+    "dest_stock": ("warehouse", "stock"), "dest_coverage": ("warehouse", "coverage"), "dest_sales": ("warehouse", "sales"),
+}
+# Sort keys computed from the warehouse view, plus the scalar product columns sortable as they are
+DERIVED_SORTS = ("currentStock", "currentSales", "currentSalesGlobal", "currentPending", "coverage", "currentStatus",
+                 "abc_category", "abc_category_store", "category_name")
+SCALAR_SORTS = ("id", "name", "barcode", "provider", "origen", "brand_name", "type_name", "abc_details", "total_stock",
+                "total_pending", "sales_30d", "sales_30d_global", "sales_7d", "sales_60d", "sales_90d")
+SORT_KEYS = frozenset(TRANSFER_SORTS) | frozenset(DERIVED_SORTS) | frozenset(SCALAR_SORTS)
+# Facet bucket of a coverage value, as counted by the coverage dropdown (upper bounds, first match wins)
+COVERAGE_BUCKETS = [("0-1", 1), ("2-5", 5), ("5-7", 7), ("8-10", 10), ("11-15", 15), ("16-20", 20), ("21-30", 30), ("+30", None)]
+# Facet -> (filter parameter, bitmap column); view columns are per warehouse
+FACETS = {
+    "providers": ("provider", "provider"), "origins": ("origin", "origin"), "tags": ("tag", "tag"),
+    "abc": ("abc", "abc"), "categories": ("product_category", "category"), "abc_store": ("abc_store", "view:abc_store"),
+    "coverage": ("coverage", "view:coverage_bucket"), "types": ("product_type", "segment"), "brands": ("brand", "brand"),
+    "status": ("status", "view:status"),
+}
+# Facets (and filters) that only exist in the products view
+PRODUCTS_ONLY = ("types", "brands", "status")
+FACET_ORDER = {"abc": list(ABC_ORDER), "abc_store": list(ABC_ORDER), "coverage": [b for b, _ in COVERAGE_BUCKETS],
+               "types": list(SEGMENTS) + ["Ninguno"], "status": list(STATUS_ORDER)}
+# Per-warehouse columns left out of projected rows (their value for the warehouse is already in current*)
+PROJECTION_DROP = ("stock_by_wh", "sales_by_wh", "pending_by_wh", "abc_by_wh", "pending_orders")
+MAX_PAGE = 5000
+# Derived per-warehouse columns kept per index version
+VIEW_CACHE_SIZE = 32
+# Memoized search bitmaps and facet results per index version
+MEMO_SIZE = 256
+
+_popcount = getattr(int, "bit_count", None) or (lambda x: bin(x).count("1"))
+
+
+def coverage_days(stock, sales):
+    return stock / (sales / 30) if sales > 0 else 999
+
+
+def coverage_matches(bucket, coverage):
+    rng = COVERAGE_RANGES.get(bucket)
+    if rng is None: return True
+    lo, lo_inclusive, hi = rng
+    if coverage < lo or (coverage == lo and not lo_inclusive): return False
+    return hi is None or coverage <= hi
+
+
+def pending_window(days, today):
+    """[desde, hasta) sobre date_order[:10] para el filtro de antigüedad de pedidos (mismos cortes que App.tsx)."""
+    d = lambda n: (today - timedelta(days=n)).isoformat()
+    return {1: (d(0), d(-1)), 2: (d(1), d(0)), 3: (d(3), d(1)), 7: (d(7), d(3))}.get(days, ("", "\uffff"))
+
+
+def _clean_category(name):
+    name = name or ""
+    return name[len("All products / "):] if name.startswith("All products / ") else name
+
+
+def _js_round(x):
+    return int(math.floor(x + 0.5))
+
+
+def coverage_bucket(coverage):
+    return next(name for name, hi in COVERAGE_BUCKETS if hi is None or coverage <= hi)
+
+
+def to_bitmap(positions, n):
+    bits = bytearray((n + 7) // 8)
+    for i in positions:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, "little")
+
+
+def from_bitmap(bitmap):
+    """Posiciones (ordenadas) de los bits encendidos."""
+    result = []
+    for byte_index, byte in enumerate(bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")):
+        if byte:
+            base = byte_index * 8
+            result.extend(base + bit for bit in range(8) if byte >> bit & 1)
+    return result
+
+
+def _bitmaps_by_value(values, n):
+    positions = {}
+    for i, value in enumerate(values):
+        positions.setdefault(value, []).append(i)
+    return {value: to_bitmap(pos, n) for value, pos in positions.items()}
+
+
+class WarehouseView:
+    """Columnas derivadas de un almacén (None = global) y una antigüedad de pedidos."""
+    __slots__ = ("warehouse_id", "stock", "sales", "coverage", "status", "pending", "orders", "abc_store", "visible", "_bitmaps")
+
+    def __init__(self, products, warehouse_id, pending_days, today):
+        self.warehouse_id = warehouse_id
+        self._bitmaps = {}
+        wh = str(warehouse_id) if warehouse_id is not None else None
+        window = pending_window(pending_days, today) if pending_days is not None else None
+        self.stock, self.sales, self.coverage, self.status = [], [], [], []
+        self.pending, self.orders, self.abc_store, self.visible = [], [], [], []
+        for p in products:
+            if wh is None:
+                stock, sales, abc_store = p.get("total_stock") or 0, p.get("sales_30d") or 0, "E"
+            else:
+                stock = (p.get("stock_by_wh") or {}).get(wh, 0)
+                sales = (p.get("sales_by_wh") or {}).get(wh, 0)
+                abc_store = ((p.get("abc_by_wh") or {}).get(wh) or {}).get("category") or "E"
+            orders = p.get("pending_orders") or []
+            if orders and wh is not None:
+                orders = [o for o in orders if o.get("warehouse_id") == warehouse_id]
+            if orders and window is not None:
+                orders = [o for o in orders if o.get("date_order") and window[0] <= o["date_order"][:10] < window[1]]
+            coverage = coverage_days(stock, sales)
+            self.stock.append(stock)
+            self.sales.append(sales)
+            self.coverage.append(coverage)
+            self.status.append("Sin Stock" if stock <= 0 else ("Deficiente" if coverage < 7 else "Normal"))
+            self.pending.append(sum(o.get("qty") or 0 for o in orders) if orders else 0)
+            self.orders.append(orders)
+            self.abc_store.append(abc_store)
+            self.visible.append(wh is None or sales > 0 or stock > 0)
+
+    def bitmap(self, name):
+        """Bitmap de una columna derivada (o dict valor -> bitmap); se arma recién la primera vez que se pide."""
+        cached = self._bitmaps.get(name)
+        if cached is None:
+            cached = self._bitmaps[name] = self._build_bitmap(name)
+        return cached
+
+    def _build_bitmap(self, name):
+        n = len(self.stock)
+        rows = range(n)
+        stock, sales, pending = self.stock, self.sales, self.pending
+        if name == "visible": return to_bitmap((i for i in rows if self.visible[i]), n)
+        if name == "in_stock": return to_bitmap((i for i in rows if stock[i] > 0), n)
+        if name == "deficient": return to_bitmap((i for i in rows if self.status[i] != "Normal"), n)
+        if name == "pending": return to_bitmap((i for i in rows if pending[i] > 0), n)
+        if name == "out_of_stock": return to_bitmap((i for i in rows if stock[i] <= 0 and pending[i] == 0 and sales[i] > 0), n)
+        if name == "out_of_stock_pending": return to_bitmap((i for i in rows if stock[i] <= 0 and pending[i] > 0), n)
+        if name in ("status", "abc_store"): return _bitmaps_by_value(getattr(self, name), n)
+        if name == "coverage_bucket": return _bitmaps_by_value([coverage_bucket(c) for c in self.coverage], n)
+        if name.startswith("coverage:"):
+            bucket = name[len("coverage:"):]
+            return to_bitmap((i for i in rows if coverage_matches(bucket, self.coverage[i])), n)
+        raise KeyError(name)
+
+
+def derived_fields(p, i, view, category_name):
+    """Campos que App.tsx agrega en baseProcessedProducts, tomados de las columnas de `view`."""
+    return {"currentStock": view.stock[i], "currentSales": view.sales[i], "currentSalesGlobal": p.get("sales_30d"),
+            "abc_category": p.get("abc_category") or "E", "abc_category_store": view.abc_store[i],
+            "coverage": _js_round(view.coverage[i]), "currentStatus": view.status[i], "currentPending": view.pending[i],
+            "filteredPendingOrders": [dict(o, date=o.get("date_order") or o.get("create_date") or o.get("date")) for o in view.orders[i]],
+            "category_name": category_name}
+
+
+def slim_rows(products):
+    """Parte común a todas las proyecciones: cada producto sin las columnas por almacén y con los campos fijos ya limpios."""
+    return [dict({k: v for k, v in p.items() if k not in PROJECTION_DROP}, currentSalesGlobal=p.get("sales_30d"),
+                 abc_category=p.get("abc_category") or "E", category_name=_clean_category(p.get("category_name")))
+            for p in products]
+
+
+def project_warehouse(data, warehouse_id, view=None, slim=None):
+    """
+    Snapshot liviano de un almacén: sólo los productos con stock o ventas en él,
+    sin las columnas por almacén y con los campos derivados ya calculados.
+    `slim` (slim_rows) se puede compartir entre los almacenes de una misma sincronización.
+    """
+    products = data.get("products", [])
+    view = view or WarehouseView(products, warehouse_id, None, date.today())
+    slim = slim or slim_rows(products)
+    stock, sales, coverage, status, pending, orders, abc_store = (view.stock, view.sales, view.coverage, view.status,
+                                                                   view.pending, view.orders, view.abc_store)
+    rows = []
+    for i, visible in enumerate(view.visible):
+        if not visible: continue
+        rows.append(dict(slim[i], currentStock=stock[i], currentSales=sales[i], abc_category_store=abc_store[i],
+                         coverage=_js_round(coverage[i]), currentStatus=status[i], currentPending=pending[i],
+                         filteredPendingOrders=[dict(o, date=o.get("date_order") or o.get("create_date") or o.get("date")) for o in orders[i]]))
+    projected = {k: v for k, v in data.items() if k != "products"}
+    projected.update({"warehouse_id": warehouse_id, "products": rows})
+    return projected
+
+
+class ProductIndex:
+    def __init__(self, version, data):
+        self.version = version
+        self.products = products = data.get("products", [])
+        self.n = n = len(products)
+        self.all = (1 << n) - 1
+        self.names = [(p.get("name") or "").lower() for p in products]
+        self.barcodes = [p.get("barcode") or "" for p in products]
+        self.categories = [_clean_category(p.get("category_name")) for p in products]
+        brands = [p.get("brand_name") or "N/A" for p in products]
+        tags = {}
+        for i, p in enumerate(products):
+            for t in p.get("tags") or []:
+                tags.setdefault(t, []).append(i)
+        self.bitmaps = {
+            "provider": _bitmaps_by_value([p.get("provider") or "Sin Proveedor" for p in products], n),
+            "origin": _bitmaps_by_value([p.get("origen") or "N/A" for p in products], n),
+            "brand": _bitmaps_by_value(brands, n),
+            "segment": _bitmaps_by_value([b if b in SEGMENTS else "Ninguno" for b in brands], n),
+            "category": _bitmaps_by_value([c or "N/A" for c in self.categories], n),
+            "abc": _bitmaps_by_value([p.get("abc_category") or "E" for p in products], n),
+            "tag": {t: to_bitmap(pos, n) for t, pos in tags.items()},
+        }
+        # Transfer view: stock somewhere and stock or sales overall
+        self.has_stock = to_bitmap((i for i, p in enumerate(products)
+                                    if (p.get("total_stock") or 0) > 0 or any(s > 0 for s in (p.get("stock_by_wh") or {}).values())), n)
+        self.has_activity = to_bitmap((i for i, p in enumerate(products) if (p.get("total_stock") or 0) > 0 or (p.get("sales_30d") or 0) > 0), n)
+        self._views = {}
+        self._views_lock = threading.Lock()
+        self._memo = {}
+
+    def view(self, warehouse_id=None, pending_days=None, today=None):
+        key = (warehouse_id, pending_days, (today or date.today()).isoformat() if pending_days is not None else None)
+        cached = self._views.get(key)
+        if cached is not None: return cached
+        with self._views_lock:
+            if key not in self._views:
+                if len(self._views) >= VIEW_CACHE_SIZE: self._views.clear()
+                self._views[key] = WarehouseView(self.products, warehouse_id, pending_days, today or date.today())
+            return self._views[key]
+
+    def _remember(self, key, compute):
+        value = self._memo.get(key)
+        if value is None:
+            if len(self._memo) >= MEMO_SIZE: self._memo.clear()
+            value = self._memo[key] = compute()
+        return value
+
+    def _search_bitmap(self, search):
+        term = search.lower()
+        return self._remember(("search", search), lambda: to_bitmap(
+            (i for i in range(self.n) if term in self.names[i] or search in self.barcodes[i]), self.n))
+
+    def _filters(self, view="products", warehouse_id=None, pending_days=None, search="", provider=None, origin=None, tag=None,
+                 abc=None, product_category=None, abc_store=None, coverage=None, deficient=False, pending=False,
+                 out_of_stock=False, out_of_stock_pending=False, status=None, product_type=None, brand=None,
+                 target_warehouse_id=None, **_):
+        """
+        Bitmap de cada filtro activo, con el nombre de su parámetro ('All', '' y None
+        no filtran), y la vista del almacén sobre la que se evaluaron.
+        """
+        norm = lambda v: None if v in (None, "", "All") else v
+        transfers = view in ("transfers", "ml")
+        wh_view = self.view(warehouse_id, pending_days)
+        vb = wh_view.bitmap
+        filters = {}
+        if warehouse_id is not None: filters["visible"] = vb("visible")
+        if search: filters["search"] = self._search_bitmap(search)
+        equals = {"provider": ("provider", provider), "origin": ("origin", origin), "tag": ("tag", tag), "abc": ("abc", abc),
+                  "product_category": ("category", product_category)}
+        if not transfers:
+            equals.update({"product_type": ("segment", product_type), "brand": ("brand", brand)})
+        for param, (column, value) in equals.items():
+            if norm(value) is not None: filters[param] = self.bitmaps[column].get(value, 0)
+        if norm(abc_store) is not None: filters["abc_store"] = vb("abc_store").get(abc_store, 0)
+        # Unknown coverage buckets do not filter, as in the UI
+        coverage = coverage if coverage in COVERAGE_RANGES else None
+        if transfers:
+            in_stock = self.view(target_warehouse_id).bitmap("in_stock") if target_warehouse_id is not None else self.has_stock
+            filters["stock"] = in_stock & self.has_activity
+            if coverage is not None and warehouse_id is not None: filters["coverage"] = vb(f"coverage:{coverage}")
+        else:
+            if deficient: filters["deficient"] = vb("deficient")
+            if pending or pending_days is not None: filters["pending"] = vb("pending")
+            if out_of_stock: filters["out_of_stock"] = vb("out_of_stock")
+            if out_of_stock_pending: filters["out_of_stock_pending"] = vb("out_of_stock_pending")
+            if norm(status) is not None: filters["status"] = vb("status").get(status, 0)
+            if coverage is not None: filters["coverage"] = vb(f"coverage:{coverage}")
+        return filters, wh_view
+
+    def _and(self, filters, skip=None):
+        result = self.all
+        for name, bitmap in filters.items():
+            if name != skip: result &= bitmap
+        return result
+
+    def row(self, i, view):
+        """Producto con los campos derivados que App.tsx agrega en baseProcessedProducts."""
+        p = self.products[i]
+        return dict(p, **derived_fields(p, i, view, self.categories[i]))
+
+    def _sort_value(self, i, sort, view, target_view):
+        if sort in TRANSFER_SORTS:
+            which, metric = TRANSFER_SORTS[sort]
+            v = target_view if which == "target" else view
+            if v is None or v.warehouse_id is None: return 0
+            return getattr(v, metric)[i]
+        if sort == "currentStock": return view.stock[i]
+        if sort == "currentSales": return view.sales[i]
+        if sort == "currentSalesGlobal": return self.products[i].get("sales_30d")
+        if sort == "currentPending": return view.pending[i]
+        if sort == "coverage": return _js_round(view.coverage[i])
+        if sort == "currentStatus": return STATUS_ORDER.get(view.status[i], 99)
+        if sort == "abc_category": return ABC_ORDER.get(self.products[i].get("abc_category") or "E", 99)
+        if sort == "abc_category_store": return ABC_ORDER.get(view.abc_store[i], 99)
+        if sort == "category_name": return self.categories[i].lower()
+        value = self.products[i].get(sort)
+        return value.lower() if isinstance(value, str) else value
+
+    def query(self, sort=None, order="asc", offset=0, limit=500, **params):
+        """
+        Filtra, ordena y pagina como la vista `products` o `transfers` de App.tsx.
+        Los filtros en 'All' o None no se aplican. Devuelve {total, offset, limit, rows}.
+        `sort` fuera de SORT_KEYS (columnas por almacén, listas) lanza ValueError.
+        """
+        if sort and sort not in SORT_KEYS:
+            raise ValueError(f"Unsupported sort key: {sort}")
+        filters, wh_view = self._filters(**params)
+        matched = from_bitmap(self._and(filters))
+
+        if sort:
+            target = params.get("target_warehouse_id")
+            target_view = self.view(target) if params.get("view") in ("transfers", "ml") and target is not None else None
+            keyed = [(self._sort_value(i, sort, wh_view, target_view), i) for i in matched]
+            # Missing values always go last, as in the UI
+            present = [(v, i) for v, i in keyed if v is not None]
+            present.sort(key=lambda k: (isinstance(k[0], str), k[0]), reverse=(order == "desc"))
+            matched = [i for _, i in present] + [i for v, i in keyed if v is None]
+
+        offset, limit = max(0, offset), max(0, min(limit, MAX_PAGE))
+        return {"total": len(matched), "offset": offset, "limit": limit,
+                "rows": [self.row(i, wh_view) for i in matched[offset:offset + limit]]}
+
+    def facets(self, **params):
+        """
+        Conteos de los desplegables bajo los filtros activos: cada faceta se cuenta
+        con todos los filtros menos el propio. Devuelve {total, facets: {nombre: [{name, count}]}}.
+        """
+        params = {k: v for k, v in params.items() if k not in ("sort", "order", "offset", "limit")}
+        key = ("facets",) + tuple(sorted((k, v) for k, v in params.items() if v not in (None, "", False, "All")))
+        return self._remember(key, lambda: self._facets(params))
+
+    def _facets(self, params):
+        filters, wh_view = self._filters(**params)
+        transfers = params.get("view") in ("transfers", "ml")
+        result = {}
+        for facet, (param, column) in FACETS.items():
+            if transfers and facet in PRODUCTS_ONLY: continue
+            base = self._and(filters, skip=param)
+            values = wh_view.bitmap(column[5:]) if column.startswith("view:") else self.bitmaps[column]
+            counts = {value: _popcount(base & bitmap) for value, bitmap in values.items()}
+            order = FACET_ORDER.get(facet)
+            if order:
+                result[facet] = [{"name": v, "count": counts.get(v, 0)} for v in order]
+            else:
+                result[facet] = [{"name": v, "count": c} for v, c in sorted(counts.items()) if c > 0]
+        return {"total": _popcount(self._and(filters)), "facets": result}
+
+
+class ProductQueryCache:
+    """ProductIndex de la versión vigente del SnapshotStore; se reconstruye cuando se publica otra."""
+
+    def __init__(self):
+        self._index = None
+        self._lock = threading.Lock()
+
+    def warm(self, index):
+        """Deja vigente un índice ya armado (la sincronización lo arma antes de publicar)."""
+        with self._lock:
+            self._index = index
+
+    def get(self, store):
+        buffers = store.buffers()
+        if buffers is None: return None
+        index = self._index
+        if index is not None and index.version == buffers.version:
+            return index
+        with self._lock:
+            if self._index is None or self._index.version != buffers.version:
+                self._index = ProductIndex(buffers.version, json.loads(buffers.bodies["identity"]))
+                logger.info(f"Product query: indexed v{buffers.version} ({len(self._index.products)} products)")
+            return self._index
@@ -0,0 +1,148 @@
+"""
+Planificador de consultas agregadas por almacén.
+
+En lugar de un read_group global más uno por almacén (filtrando por
+`order_id.picking_type_id.warehouse_id`), pide a Odoo un único read_group
+agrupado por producto y tipo de operación, y deriva localmente los totales
+por almacén (tipo de operación -> almacén) y los globales.
+
+Si la consulta agrupada falla se cae al abanico clásico de consultas. Sólo se
+da por no soportada (y se deja de intentar durante `GROUPBY_RECHECK_SECONDS`)
+si nunca funcionó y el read_group sin el campo relacionado sí responde con el
+mismo dominio; un error transitorio sólo afecta a esa llamada.
+
+Opcionalmente agrupa también por día (`campo:day`), de modo que un rango de
+varios días se resuelve con las mismas consultas y se reparte en buckets
+diarios localmente.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PICKING_TYPE_GROUPBY = "order_id.picking_type_id"
+GROUPBY_RECHECK_SECONDS = 3600
+
+# None = not probed yet; True once Odoo answered the grouped query; False if it rejected it (until recheck)
+_related_groupby_supported = None
+_rejected_at = None
+
+
+def _add(target, key, row, measures):
+    acc = target.setdefault(key, {m: 0 for m in measures})
+    for m in measures:
+        acc[m] += row.get(m) or 0
+
+
+def group_day(group, groupby):
+    """
+    Día (date) de un grupo `campo:day` de read_group: del `__range` (Odoo 16+),
+    del límite inferior en `__domain` o, en último caso, de la etiqueta.
+    """
+    rng = (group.get('__range') or {}).get(groupby)
+    if rng and rng.get('from'):
+        return datetime.strptime(rng['from'][:10], '%Y-%m-%d').date()
+    field = groupby.partition(':')[0]
+    for cond in group.get('__domain') or []:
+        if isinstance(cond, (list, tuple)) and len(cond) == 3 and cond[0] == field and cond[1] == '>=' and cond[2]:
+            return datetime.strptime(str(cond[2])[:10], '%Y-%m-%d').date()
+    label = group.get(groupby)
+    return datetime.strptime(label, '%d %b %Y').date() if label else None
+
+
+def related_groupby_rejected():
+    """True mientras Odoo tenga rechazado el agrupado por campos relacionados (hasta el próximo reintento)."""
+    return _related_groupby_supported is False and time.monotonic() - _rejected_at < GROUPBY_RECHECK_SECONDS
+
+
+async def read_group_by_warehouse(client, model, domain, measures, pt_to_wh, wh_ids, day_field=None):
+    """
+    Suma `measures` de `model` por producto, globalmente y por almacén.
+
+    Devuelve (totals, by_wh): totals = {pid: {measure: valor}} y
+    by_wh = {pid: {wh_id: {measure: valor}}}, o None si Odoo devolvió un error.
+
+    Con `day_field` agrupa además por `day_field:day` en las mismas consultas y
+    devuelve {date: (totals, by_wh)}. Si `day_field` es un campo relacionado,
+    depende del mismo soporte que el agrupado por tipo de operación: cuando
+    Odoo lo rechaza devuelve None y el llamador debe partir el rango él mismo.
+    """
+    global _related_groupby_supported, _rejected_at
+    fields = ['product_id'] + [f"{m}:sum" for m in measures]
+    day_groupby = [f"{day_field}:day"] if day_field else []
+    # Dates are bucketed in UTC, the same boundaries the day-by-day domains use
+    kwargs = {"lazy": False, "context": {"tz": "UTC"}} if day_field else {"lazy": False}
+
+    def bucket(out, g):
+        if not day_field:
+            return out.setdefault(None, ({}, {}))
+        day = group_day(g, day_groupby[0])
+        return out.setdefault(day, ({}, {})) if day else None
+
+    def result(out):
+        return out if day_field else out.get(None, ({}, {}))
+
+    if _related_groupby_supported is False and time.monotonic() - _rejected_at >= GROUPBY_RECHECK_SECONDS:
+        logger.info(f"Query planner: retrying grouped {PICKING_TYPE_GROUPBY} read_group")
+        _related_groupby_supported = None
+
+    grouped_failed = False
+    if _related_groupby_supported is not False:
+        groups = await client.call_kw(model, "read_group", [domain, fields, ['product_id', PICKING_TYPE_GROUPBY] + day_groupby], kwargs)
+        if groups is not None:
+            if _related_groupby_supported is None: logger.info(f"Query planner: grouped {PICKING_TYPE_GROUPBY} read_group supported")
+            _related_groupby_supported = True
+            out = {}
+            for g in groups:
+                if not g.get('product_id'): continue
+                target = bucket(out, g)
+                if target is None: continue
+                totals, by_wh = target
+                pid = g['product_id'][0]
+                _add(totals, pid, g, measures)
+                pt = g.get(PICKING_TYPE_GROUPBY)
+                wh_id = pt_to_wh.get(pt[0]) if pt else None
+                if wh_id is not None:
+                    _add(by_wh.setdefault(pid, {}), wh_id, g, measures)
+            return result(out)
+        grouped_failed = True
+        if _related_groupby_supported:
+            logger.warning(f"Query planner: grouped {PICKING_TYPE_GROUPBY} read_group failed, using per-warehouse queries for this call")
+
+    if day_field and "." in day_field and _related_groupby_supported is False:
+        return None
+
+    # Fallback: one global read_group plus one per warehouse
+    wh_ids = list(wh_ids)
+    calls = [client.call_kw(model, "read_group", [domain, fields, ['product_id'] + day_groupby], kwargs)]
+    for wh_id in wh_ids:
+        d = domain + [('order_id.picking_type_id.warehouse_id', '=', wh_id)]
+        calls.append(client.call_kw(model, "read_group", [d, fields, ['product_id'] + day_groupby], kwargs))
+    global_groups, *wh_results = await asyncio.gather(*calls)
+    if global_groups is None and grouped_failed and _related_groupby_supported is None and day_groupby and "." in day_field:
+        # The day grouping is related too: probe the plain query to tell a rejection from a transient error
+        if await client.call_kw(model, "read_group", [domain, fields, ['product_id']], {"lazy": False, "limit": 1}) is not None:
+            logger.warning(f"Query planner: {PICKING_TYPE_GROUPBY} grouping rejected by Odoo, using per-warehouse queries "
+                           f"(retry in {GROUPBY_RECHECK_SECONDS // 60} min)")
+            _related_groupby_supported, _rejected_at = False, time.monotonic()
+        return None
+    if global_groups is None:
+        return None
+    if grouped_failed and _related_groupby_supported is None:
+        # Same domain answers without the related groupby: Odoo rejects the grouping itself
+        logger.warning(f"Query planner: {PICKING_TYPE_GROUPBY} grouping rejected by Odoo, using per-warehouse queries "
+                       f"(retry in {GROUPBY_RECHECK_SECONDS // 60} min)")
+        _related_groupby_supported, _rejected_at = False, time.monotonic()
+
+    out = {}
+    for g in (global_groups or []):
+        if g.get('product_id') and (target := bucket(out, g)) is not None:
+            _add(target[0], g['product_id'][0], g, measures)
+    for wh_id, groups in zip(wh_ids, wh_results):
+        for g in (groups or []):
+            if g.get('product_id') and (target := bucket(out, g)) is not None:
+                _add(target[1].setdefault(g['product_id'][0], {}), wh_id, g, measures)
+    return result(out)
@@ -0,0 +1,89 @@
+"""
+Libro diario local (SQLite) de ventas: (día, producto, almacén, cantidad, ingreso).
+
+Cada ciclo de sincronización sólo vuelve a consultar en Odoo el día actual y
+el anterior (más los días que falten dentro de la retención); las ventanas de
+7, 30, 60 o 90 días se calculan sumando días localmente.
+
+warehouse_id = 0 agrupa lo que no se pudo asignar a un almacén, para que los
+totales globales sigan cuadrando con Odoo.
+"""
+
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+UNASSIGNED_WH = 0
+
+
+class SalesLedger:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS ledger (
+            day TEXT NOT NULL, product_id INTEGER NOT NULL, warehouse_id INTEGER NOT NULL,
+            qty REAL NOT NULL DEFAULT 0, revenue REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, product_id, warehouse_id))""")
+        # Days whose buckets were fully loaded from Odoo
+        self.conn.execute("CREATE TABLE IF NOT EXISTS days (day TEXT PRIMARY KEY, refreshed_at TEXT)")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def loaded_days(self):
+        return {row[0] for row in self.conn.execute("SELECT day FROM days")}
+
+    def days_to_refresh(self, today, retention_days, refresh_last=2):
+        """
+        Días (date) a consultar en Odoo: los `refresh_last` más recientes siempre,
+        y cualquier día de la retención que todavía no esté cargado.
+        """
+        loaded = self.loaded_days()
+        out = []
+        for i in range(retention_days + 1):
+            d = today - timedelta(days=i)
+            if i < refresh_last or d.isoformat() not in loaded:
+                out.append(d)
+        return out
+
+    def replace_day(self, day, rows, refreshed_at):
+        """Reemplaza los buckets de `day` con rows = {(product_id, warehouse_id): (qty, revenue)}."""
+        day = day.isoformat() if isinstance(day, date) else day
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM ledger WHERE day = ?", (day,))
+            self.conn.executemany(
+                "INSERT INTO ledger (day, product_id, warehouse_id, qty, revenue) VALUES (?, ?, ?, ?, ?)",
+                [(day, pid, wh_id, qty, rev) for (pid, wh_id), (qty, rev) in rows.items()]
+            )
+            self.conn.execute("INSERT OR REPLACE INTO days (day, refreshed_at) VALUES (?, ?)", (day, refreshed_at))
+
+    def prune(self, oldest_day):
+        oldest_day = oldest_day.isoformat()
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM ledger WHERE day < ?", (oldest_day,))
+            self.conn.execute("DELETE FROM days WHERE day < ?", (oldest_day,))
+
+    def window(self, since_day):
+        """
+        Sumas desde `since_day` (incluido):
+        (qty_map, qty_by_wh, revenue_map, revenue_by_wh) con el mismo formato que la sincronización.
+        """
+        qty_map, qty_by_wh, rev_map, rev_by_wh = {}, {}, {}, {}
+        q = "SELECT product_id, warehouse_id, SUM(qty), SUM(revenue) FROM ledger WHERE day >= ? GROUP BY product_id, warehouse_id"
+        for pid, wh_id, qty, rev in self.conn.execute(q, (since_day.isoformat(),)):
+            if qty:
+                qty_map[pid] = qty_map.get(pid, 0) + qty
+                if wh_id != UNASSIGNED_WH: qty_by_wh.setdefault(pid, {})[wh_id] = qty
+            if rev:
+                rev_map[pid] = rev_map.get(pid, 0) + rev
+                if wh_id != UNASSIGNED_WH: rev_by_wh.setdefault(pid, {})[wh_id] = rev
+        return qty_map, qty_by_wh, rev_map, rev_by_wh
+
+    def qty_totals(self, since_day):
+        """{product_id: cantidad} global desde `since_day` (incluido)."""
+        q = "SELECT product_id, SUM(qty) FROM ledger WHERE day >= ? GROUP BY product_id"
+        return {pid: qty for pid, qty in self.conn.execute(q, (since_day.isoformat(),)) if qty}
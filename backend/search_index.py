@@ -0,0 +1,195 @@
+"""
+Índice de búsqueda del catálogo (/api/search).
+
+Se arma una vez por versión del snapshot (la sincronización lo deja listo al
+publicar; otro proceso lo arma al primer uso):
+
+- nombres limpios normalizados (minúsculas, sin tildes ni signos) con un
+  índice de trigramas para buscar subcadenas y uno de palabras para prefijos;
+- hash exacto de código de barras (y prefijo de código para búsquedas parciales);
+- palabras de proveedor, marca y categoría.
+
+Cada palabra de la consulta tiene que aparecer en el nombre o en alguno de
+esos campos; el resultado se ordena por relevancia (código exacto, palabra
+exacta, prefijo, subcadena, campo secundario) y luego por ventas. Los niveles
+de relevancia se arman con operaciones de conjuntos, sin puntuar producto por
+producto, así una palabra muy común no recorre todo el catálogo en Python.
+"""
+
+import bisect
+import json
+import logging
+import re
+import threading
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+MAX_RESULTS = 200
+# Score of each kind of match, per query word
+SCORE_BARCODE, SCORE_WORD, SCORE_PREFIX, SCORE_SUBSTRING, SCORE_FIELD = 1000, 10, 6, 3, 2
+FIELDS = ("provider", "brand_name", "category_name")
+
+_NON_ALNUM = re.compile(r"[^a-z0-9ñ]+")
+
+
+def normalize(text):
+    """Minúsculas sin tildes ni signos ('Café  Ñandú-500g' -> 'cafe ñandu 500g'); la ñ se conserva."""
+    text = (text or "").lower().replace("ñ", "\0")
+    text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return _NON_ALNUM.sub(" ", text.replace("\0", "ñ")).strip()
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class _WordIndex:
+    """palabra -> posiciones, con vocabulario ordenado para buscar por prefijo."""
+
+    def __init__(self):
+        self.postings = {}
+        self.vocab = []
+
+    def add(self, pos, text):
+        for word in text.split():
+            self.postings.setdefault(word, set()).add(pos)
+
+    def freeze(self):
+        self.vocab = sorted(self.postings)
+
+    def exact(self, word):
+        return self.postings.get(word, set())
+
+    def prefix(self, word):
+        result = set()
+        i = bisect.bisect_left(self.vocab, word)
+        while i < len(self.vocab) and self.vocab[i].startswith(word):
+            result |= self.postings[self.vocab[i]]
+            i += 1
+        return result
+
+
+class SearchIndex:
+    def __init__(self, version, products):
+        self.version = version
+        self.products = products
+        self.names = [normalize(p.get("name")) for p in products]
+        self.sales = [p.get("sales_30d") or 0 for p in products]
+        self.barcodes = {}
+        self.name_words, self.field_words, self.codes = _WordIndex(), _WordIndex(), _WordIndex()
+        self.grams = {}
+        for pos, p in enumerate(products):
+            name = self.names[pos]
+            self.name_words.add(pos, name)
+            for gram in trigrams(name):
+                self.grams.setdefault(gram, set()).add(pos)
+            barcode = (p.get("barcode") or "").strip()
+            if barcode:
+                self.barcodes.setdefault(barcode, []).append(pos)
+                self.codes.add(pos, barcode)
+            for field in FIELDS:
+                self.field_words.add(pos, normalize((p.get(field) or "").replace("All products / ", "")))
+        for words in (self.name_words, self.field_words, self.codes):
+            words.freeze()
+        # Static rank used inside a score tier: best sellers first, then shorter names
+        self.order = sorted(range(len(products)), key=lambda pos: (-self.sales[pos], len(self.names[pos])))
+        self.rank = [0] * len(products)
+        for r, pos in enumerate(self.order):
+            self.rank[pos] = r
+
+    def _substring(self, word):
+        """Posiciones cuyo nombre contiene `word`: intersección de trigramas y verificación final."""
+        if len(word) < 3: return self.name_words.prefix(word)
+        sets = sorted((self.grams.get(g, set()) for g in trigrams(word)), key=len)
+        candidates = set(sets[0])
+        for s in sets[1:]:
+            candidates &= s
+            if not candidates: return candidates
+        # Positions with a word starting with `word` obviously contain it; only the rest is verified
+        known = self.name_words.prefix(word)
+        return known | {pos for pos in candidates - known if word in self.names[pos]}
+
+    def _top(self, positions, k):
+        """Las k posiciones de mejor rango estático (más ventas, nombre más corto)."""
+        if len(positions) * 16 > len(self.order):
+            # Dense set: walking the precomputed order stops early
+            result = []
+            for pos in self.order:
+                if pos in positions:
+                    result.append(pos)
+                    if len(result) == k: break
+            return result
+        return sorted(positions, key=self.rank.__getitem__)[:k]
+
+    def search(self, q, limit=50):
+        """Resultados rankeados: [{id, name, barcode, provider, brand_name, category_name, score}]."""
+        raw = (q or "").strip()
+        words = normalize(raw).split()
+        limit = max(0, min(limit, MAX_RESULTS))
+        if not raw or not limit: return []
+        # Per word, the match kinds from best to worst; candidates must match every word in some way
+        kinds, candidates = [], None
+        for word in words:
+            codes = self.codes.prefix(word) if word.isdigit() and len(word) >= 4 else set()
+            kind = (self.name_words.exact(word), self.name_words.prefix(word) | codes, self._substring(word), self.field_words.prefix(word))
+            kinds.append(kind)
+            hits = kind[1] | kind[2] | kind[3]
+            candidates = hits if candidates is None else candidates & hits
+            if not candidates: break
+
+        # Score tiers with set operations only: each word splits every group by its best match kind
+        groups = [(0, candidates or set())]
+        for exact, prefix, substring, _ in kinds:
+            split = []
+            for score, rest in groups:
+                for value, kind_set in ((SCORE_WORD, exact), (SCORE_PREFIX, prefix), (SCORE_SUBSTRING, substring)):
+                    part = rest & kind_set
+                    if part:
+                        split.append((score + value, part))
+                        rest = rest - part
+                if rest: split.append((score + SCORE_FIELD, rest))
+            groups = split
+        tiers = {}
+        for score, part in groups:
+            tiers.setdefault(score, set()).update(part)
+
+        barcode_hits = self.barcodes.get(raw, [])
+        ranked = [(pos, SCORE_BARCODE) for pos in barcode_hits]
+        seen = set(barcode_hits)
+        for score in sorted(tiers, reverse=True):
+            if len(ranked) >= limit: break
+            ranked.extend((pos, score) for pos in self._top(tiers[score] - seen, limit - len(ranked)))
+
+        results = []
+        for pos, score in ranked[:limit]:
+            p = self.products[pos]
+            results.append({"id": p["id"], "name": p.get("name"), "barcode": p.get("barcode"), "provider": p.get("provider"),
+                            "brand_name": p.get("brand_name"), "category_name": p.get("category_name"), "score": score})
+        return results
+
+
+class SearchIndexCache:
+    """SearchIndex de la versión vigente; la sincronización lo precalienta al publicar."""
+
+    def __init__(self):
+        self._index = None
+        self._lock = threading.Lock()
+
+    def warm(self, version, data):
+        index = SearchIndex(version, data.get("products", []))
+        with self._lock:
+            self._index = index
+        logger.info(f"Search index: v{version} built ({len(index.products)} products, {len(index.grams)} trigrams)")
+
+    def get(self, store):
+        buffers = store.buffers()
+        if buffers is None: return None
+        index = self._index
+        if index is not None and index.version == buffers.version:
+            return index
+        with self._lock:
+            if self._index is None or self._index.version != buffers.version:
+                self._index = SearchIndex(buffers.version, json.loads(buffers.bodies["identity"]).get("products", []))
+                logger.info(f"Search index: v{buffers.version} built from the published snapshot")
+            return self._index
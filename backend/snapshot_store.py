@@ -0,0 +1,445 @@
+"""
+Almacén de snapshots versionados e inmutables de /api/products.
+
+Cada sincronización publica una versión nueva:
+- el dict se serializa una sola vez; el .gz se comprime a partir de esos bytes;
+- ambos archivos se escriben en temporales y se renombran (os.replace), así un
+  lector nunca ve un archivo a medio escribir;
+- al final se reescribe el sidecar `current.json` (también atómico), que apunta
+  a la versión vigente y guarda los metadatos volátiles: next_sync, estado de
+  la sincronización, tamaños, etc. Cambiar next_sync sólo toca ese sidecar.
+
+Se conservan las últimas `keep` versiones para que un lector que ya abrió la
+anterior termine de leerla. `last_sync_cache.json(.gz)` se mantiene como
+enlace duro a la versión vigente para los scripts que lo leen directamente.
+Si el directorio de snapshots está vacío y existe ese archivo (instalaciones
+anteriores a este almacén), se importa como v1 al arrancar.
+Con varios procesos sólo publica el que tiene `lease` (sync_lease.py); los
+demás ven la versión nueva al releer el sidecar.
+
+La versión vigente también se mantiene en memoria ya codificada (identity,
+gzip y, si están instalados, brotli y zstd) en un SnapshotBuffers inmutable
+que se reemplaza de una vez al publicar o al detectar una versión nueva.
+
+Cada versión se escribe también en el layout columnar binario de columnar.py
+(`snapshot-NNNNNN.col`), que se sirve por negociación de Accept.
+
+Junto con el snapshot completo se pueden publicar proyecciones por almacén
+(`snapshot-NNNNNN.wh-<id>.json`, con sus propias codificaciones y ETag): filas
+livianas con los valores de ese almacén ya calculados.
+
+Al publicar se guarda además el conjunto de cambios respecto de la versión
+anterior (`delta-NNNNNN.json`: productos agregados, ids quitados y, de los
+modificados, sólo los campos que cambiaron). Se conservan DELTA_HISTORY
+conjuntos; changes_since() los encadena para llevar a un cliente desde su
+versión hasta la vigente, o devuelve None si el salto es demasiado viejo.
+"""
+
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from columnar import encode as encode_columnar
+from sync_lease import SyncLease
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+SIDECAR = "current.json"
+# How often (seconds) the sidecar is re-checked for versions published by another process
+META_CHECK_INTERVAL = 1.0
+# Extra encodings: (name, file suffix, encoder)
+EXTRA_ENCODINGS = []
+if brotli is not None:
+    EXTRA_ENCODINGS.append(("br", ".br", lambda raw: brotli.compress(raw, quality=5)))
+if zstandard is not None:
+    EXTRA_ENCODINGS.append(("zstd", ".zst", lambda raw: zstandard.ZstdCompressor(level=10).compress(raw)))
+# Preferred order when the client accepts several
+ENCODING_PREFERENCE = ["br", "zstd", "gzip", "identity"]
+# Encoding -> file suffix
+SUFFIXES = {"identity": "", "gzip": ".gz", **{enc: suffix for enc, suffix, _ in EXTRA_ENCODINGS}}
+# Change sets kept on disk (48 syncs = one day at the default 30 minutes)
+DELTA_HISTORY = 48
+
+
+def _write_atomic(path, payload):
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _encode_bodies(raw):
+    bodies = {"identity": raw, "gzip": gzip.compress(raw, compresslevel=6)}
+    for enc, _, encode in EXTRA_ENCODINGS:
+        bodies[enc] = encode(raw)
+    return bodies
+
+
+def _read_bodies(path):
+    bodies = {}
+    with open(path, "rb") as f: bodies["identity"] = f.read()
+    with open(path + ".gz", "rb") as f: bodies["gzip"] = f.read()
+    for enc, suffix, encode in EXTRA_ENCODINGS:
+        if os.path.exists(path + suffix):
+            with open(path + suffix, "rb") as f: bodies[enc] = f.read()
+        else:
+            bodies[enc] = encode(bodies["identity"])
+    return bodies
+
+
+def _encode_products(products):
+    """{id: json del producto}; comparar strings es mucho más barato que comparar dicts anidados."""
+    return {p["id"]: json.dumps(p, separators=(",", ":")) for p in products}
+
+
+def diff_snapshots(prev_products, prev_fields, data):
+    """
+    Conjunto de cambios entre la versión anterior (productos codificados con
+    _encode_products y campos de primer nivel) y `data`.
+    """
+    products = _encode_products(data.get("products", []))
+    added, modified = [], []
+    for pid, encoded in products.items():
+        old = prev_products.get(pid)
+        if old is None:
+            added.append(json.loads(encoded))
+        elif old != encoded:
+            before, after = json.loads(old), json.loads(encoded)
+            changed = {k: v for k, v in after.items() if before.get(k) != v}
+            changed.update({k: None for k in before if k not in after})
+            changed["id"] = pid
+            modified.append(changed)
+    removed = [pid for pid in prev_products if pid not in products]
+    fields = {k: v for k, v in data.items() if k != "products" and prev_fields.get(k) != v}
+    return {"added": added, "removed": removed, "modified": modified, "fields": fields}, products
+
+
+def merge_changes(changes):
+    """Encadena conjuntos de cambios consecutivos en uno solo (del más viejo al más nuevo)."""
+    added, removed, modified, fields = {}, set(), {}, {}
+    for change in changes:
+        for p in change["added"]:
+            removed.discard(p["id"])
+            modified.pop(p["id"], None)
+            added[p["id"]] = p
+        for pid in change["removed"]:
+            if added.pop(pid, None) is None:
+                removed.add(pid)
+            modified.pop(pid, None)
+        for m in change["modified"]:
+            target = added.get(m["id"])
+            if target is not None:
+                target.update(m)
+            else:
+                modified.setdefault(m["id"], {}).update(m)
+        fields.update(change["fields"])
+    return {"added": list(added.values()), "removed": sorted(removed), "modified": list(modified.values()), "fields": fields}
+
+
+class SnapshotBuffers:
+    """Versión vigente ya codificada en memoria; inmutable, se reemplaza entera."""
+    __slots__ = ("version", "etag", "bodies")
+
+    def __init__(self, version, etag, bodies):
+        self.version, self.etag, self.bodies = version, etag, bodies
+
+    def pick(self, accept_encoding):
+        """(encoding, bytes) según Accept-Encoding, respetando q=0."""
+        accepted = {}
+        for part in (accept_encoding or "").lower().split(","):
+            name, _, params = part.strip().partition(";")
+            q = 1.0
+            if params.strip().startswith("q="):
+                try: q = float(params.strip()[2:])
+                except ValueError: pass
+            if name: accepted[name] = q
+        for enc in ENCODING_PREFERENCE:
+            if enc in self.bodies and (enc == "identity" or accepted.get(enc, accepted.get("*", 0)) > 0):
+                return enc, self.bodies[enc]
+        return "identity", self.bodies["identity"]
+
+    def etag_for(self, encoding):
+        # Strong validator per representation: each encoding has its own bytes
+        return f'"{self.etag}"' if encoding == "identity" else f'"{self.etag}-{encoding}"'
+
+    def matches(self, if_none_match):
+        """If-None-Match usa comparación débil: basta con que coincida la versión, sea cual sea la codificación."""
+        if not if_none_match: return False
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*": return True
+            tag = tag[2:] if tag.startswith("W/") else tag
+            if tag.strip('"').split("-")[0] == self.etag: return True
+        return False
+
+
+class SnapshotStore:
+    def __init__(self, directory, keep=3, legacy_path=None):
+        self.directory = directory
+        self.keep = keep
+        self.legacy_path = legacy_path
+        self.sidecar_path = os.path.join(directory, SIDECAR)
+        self._lock = threading.Lock()
+        self._meta, self._meta_mtime, self._meta_checked = {}, None, 0.0
+        self._buffers = None
+        self._extra_buffers = {}  # "wh:<id>" / "columnar" -> SnapshotBuffers of that representation
+        self._previous = None  # (version, encoded products, top-level fields) of the last published version
+        self._changes_cache = {}  # (since, current) -> merged change set
+        os.makedirs(directory, exist_ok=True)
+        # Only the holder of this lease syncs and publishes into the directory (see sync_lease.py)
+        self.lease = SyncLease(os.path.join(directory, "sync.lock"))
+        self._seed_from_legacy()
+
+    def _seed_from_legacy(self):
+        """Publica el cache legacy como v1 si todavía no hay ninguna versión (primer arranque tras actualizar)."""
+        if not self.legacy_path or not os.path.exists(self.legacy_path): return
+        if self.meta().get("version") is not None or glob.glob(os.path.join(self.directory, "snapshot-*.json")): return
+        # Another process may be importing it too: only the lease holder publishes
+        if not self.lease.try_acquire(): return
+        self._meta_checked = 0.0
+        if self.meta().get("version") is not None: return
+        try:
+            with open(self.legacy_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Snapshot store: could not import {self.legacy_path}: {e}")
+            return
+        if not isinstance(data, dict) or not isinstance(data.get("products"), list):
+            logger.warning(f"Snapshot store: {self.legacy_path} is not a products snapshot, not imported")
+            return
+        self.publish(data)
+        logger.info(f"Snapshot store: imported {self.legacy_path} as v1 ({len(data['products'])} products)")
+
+    def meta(self):
+        """Metadatos del sidecar; se relee sólo si el archivo cambió (otro proceso pudo publicar)."""
+        if time.monotonic() - self._meta_checked < META_CHECK_INTERVAL:
+            return self._meta
+        self._meta_checked = time.monotonic()
+        try:
+            mtime = os.stat(self.sidecar_path).st_mtime_ns
+        except OSError:
+            return {}
+        if mtime != self._meta_mtime:
+            try:
+                with open(self.sidecar_path) as f:
+                    self._meta, self._meta_mtime = json.load(f), mtime
+            except (OSError, ValueError) as e:
+                logger.warning(f"Snapshot store: could not read {self.sidecar_path}: {e}")
+        return self._meta
+
+    def _write_meta(self, meta):
+        _write_atomic(self.sidecar_path, json.dumps(meta).encode("utf-8"))
+        self._meta, self._meta_mtime = meta, os.stat(self.sidecar_path).st_mtime_ns
+        self._meta_checked = time.monotonic()
+
+    def update_meta(self, **fields):
+        """Actualiza sólo campos volátiles (next_sync, sync_status, ...) sin tocar el snapshot."""
+        with self._lock:
+            self._meta_checked = 0.0
+            meta = dict(self.meta())
+            meta.update(fields)
+            meta["meta_updated_at"] = datetime.now().isoformat()
+            self._write_meta(meta)
+            return meta
+
+    def paths(self):
+        """(json, gz) de la versión vigente, o (None, None) si todavía no hay ninguna."""
+        meta = self.meta()
+        if not meta.get("file"): return None, None
+        return os.path.join(self.directory, meta["file"]), os.path.join(self.directory, meta["gz_file"])
+
+    def buffers(self, warehouse_id=None, columnar=False):
+        """
+        SnapshotBuffers de la versión vigente: el JSON completo, su proyección para
+        `warehouse_id` o su codificación columnar (None si no existe). Sólo lee
+        disco cuando cambió la versión.
+        """
+        meta = self.meta()
+        version = meta.get("version")
+        if columnar:
+            key, entry = "columnar", meta.get("columnar")
+        elif warehouse_id is not None:
+            key, entry = f"wh:{warehouse_id}", (meta.get("projections") or {}).get(str(warehouse_id))
+        else:
+            key, entry = None, {"file": meta.get("file"), "etag": meta.get("etag")}
+        current = self._buffers if key is None else self._extra_buffers.get(key)
+        if current is not None and current.version == version:
+            return current
+        if not entry or not entry.get("file"):
+            return current if key is None else None
+        with self._lock:
+            cached = self._buffers if key is None else self._extra_buffers.get(key)
+            if cached is not None and cached.version == version:
+                return cached
+            try:
+                bodies = _read_bodies(os.path.join(self.directory, entry["file"]))
+            except OSError as e:
+                logger.error(f"Snapshot store: could not load {entry['file']}: {e}")
+                return current
+            loaded = SnapshotBuffers(version, entry["etag"], bodies)
+            if key is None:
+                self._buffers = loaded
+            else:
+                if any(b.version != version for b in self._extra_buffers.values()): self._extra_buffers = {}
+                self._extra_buffers[key] = loaded
+            logger.info(f"Snapshot store: {entry['file']} loaded in memory ({', '.join(bodies)})")
+            return loaded
+
+    def load(self):
+        path, _ = self.paths()
+        if not path or not os.path.exists(path): return None
+        with open(path, "rb") as f:
+            return json.loads(f.read())
+
+    def _next_version(self):
+        versions = [self.meta().get("version") or 0]
+        for path in glob.glob(os.path.join(self.directory, "snapshot-*.json")):
+            try: versions.append(int(os.path.basename(path)[9:-5]))
+            except ValueError: pass
+        return max(versions) + 1
+
+    def _previous_state(self):
+        """(versión, productos codificados, campos) de la versión vigente; si no está en memoria se lee de disco."""
+        version = self.meta().get("version")
+        if self._previous is not None and self._previous[0] == version:
+            return self._previous
+        try:
+            data = self.load()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Snapshot store: could not read v{version} to compute changes: {e}")
+            data = None
+        if data is None: return None
+        return version, _encode_products(data.get("products", [])), {k: v for k, v in data.items() if k != "products"}
+
+    def _delta_path(self, version):
+        return os.path.join(self.directory, f"delta-{version:06d}.json")
+
+    def publish(self, data, projections=None, **fields):
+        """
+        Escribe `data` (y sus proyecciones {warehouse_id: dict}) como nueva versión
+        inmutable y la vuelve vigente. Devuelve los metadatos publicados.
+        """
+        previous = self._previous_state()
+        if previous is not None:
+            change, encoded = diff_snapshots(previous[1], previous[2], data)
+        else:
+            change, encoded = None, _encode_products(data.get("products", []))
+        raw = json.dumps(data).encode("utf-8")
+        bodies = _encode_bodies(raw)
+        col_bodies = _encode_bodies(encode_columnar(data))
+        projected = {str(wh): _encode_bodies(json.dumps(p).encode("utf-8")) for wh, p in (projections or {}).items()}
+        with self._lock:
+            self._meta_checked = 0.0
+            version = self._next_version()
+            name = f"snapshot-{version:06d}.json"
+            path = os.path.join(self.directory, name)
+            for enc, body in bodies.items():
+                _write_atomic(path + SUFFIXES[enc], body)
+            col_name = f"snapshot-{version:06d}.col"
+            for enc, body in col_bodies.items():
+                _write_atomic(os.path.join(self.directory, col_name + SUFFIXES[enc]), body)
+            projection_meta = {}
+            for wh, wh_bodies in projected.items():
+                wh_name = f"snapshot-{version:06d}.wh-{wh}.json"
+                for enc, body in wh_bodies.items():
+                    _write_atomic(os.path.join(self.directory, wh_name + SUFFIXES[enc]), body)
+                projection_meta[wh] = {"file": wh_name, "etag": hashlib.sha1(wh_bodies["identity"]).hexdigest()[:16],
+                                       "bytes": len(wh_bodies["identity"]), "gz_bytes": len(wh_bodies["gzip"])}
+            # Only a change set against the immediately previous version can be chained
+            if change is not None and previous[0] == version - 1:
+                change.update({"version": version, "base": previous[0]})
+                _write_atomic(self._delta_path(version), json.dumps(change).encode("utf-8"))
+            meta = dict(self.meta())
+            meta.update({
+                "version": version, "file": name, "gz_file": name + ".gz",
+                "etag": hashlib.sha1(raw).hexdigest()[:16], "bytes": len(raw), "gz_bytes": len(bodies["gzip"]),
+                "last_update": data.get("last_update"), "products": len(data.get("products", [])),
+                "published_at": datetime.now().isoformat(), "published_ts": time.time(),
+                "projections": projection_meta,
+                "columnar": {"file": col_name, "etag": hashlib.sha1(col_bodies["identity"]).hexdigest()[:16],
+                             "bytes": len(col_bodies["identity"]), "gz_bytes": len(col_bodies["gzip"])},
+            })
+            meta.update(fields)
+            self._write_meta(meta)
+            self._buffers = SnapshotBuffers(version, meta["etag"], bodies)
+            self._extra_buffers = {f"wh:{wh}": SnapshotBuffers(version, projection_meta[wh]["etag"], wh_bodies) for wh, wh_bodies in projected.items()}
+            self._extra_buffers["columnar"] = SnapshotBuffers(version, meta["columnar"]["etag"], col_bodies)
+            self._previous = (version, encoded, {k: v for k, v in data.items() if k != "products"})
+            self._changes_cache = {}
+            self._link_legacy(path)
+            self._prune(version)
+        logger.info(f"Snapshot store: published v{version} ({len(raw) / 1e6:.1f} MB, gz {len(bodies['gzip']) / 1e6:.1f} MB, "
+                    f"{len(projected)} warehouse projections)")
+        return meta
+
+    def _link_legacy(self, path):
+        if not self.legacy_path: return
+        for src, dst in ((path, self.legacy_path), (path + ".gz", self.legacy_path + ".gz")):
+            tmp = f"{dst}.tmp-{os.getpid()}"
+            try:
+                if os.path.exists(tmp): os.remove(tmp)
+                os.link(src, tmp)
+                os.replace(tmp, dst)
+            except OSError as e:
+                logger.warning(f"Snapshot store: could not link {dst}: {e}")
+
+    def _prune(self, current):
+        for path in glob.glob(os.path.join(self.directory, "snapshot-*")):
+            try:
+                version = int(os.path.basename(path)[9:15])
+            except ValueError:
+                continue
+            if version <= current - self.keep:
+                try: os.remove(path)
+                except OSError: pass
+        for path in glob.glob(os.path.join(self.directory, "delta-*.json")):
+            try:
+                version = int(os.path.basename(path)[6:12])
+            except ValueError:
+                continue
+            if version <= current - DELTA_HISTORY:
+                try: os.remove(path)
+                except OSError: pass
+
+    def changes_since(self, since):
+        """
+        Cambios desde la versión `since` hasta la vigente, o None si no se pueden
+        reconstruir (versión desconocida, futura o más vieja que DELTA_HISTORY).
+        """
+        current = self.meta().get("version")
+        if not current or since is None or since > current or since < current - DELTA_HISTORY:
+            return None
+        key = (since, current)
+        cached = self._changes_cache.get(key)
+        if cached is not None: return cached
+        changes = []
+        for version in range(since + 1, current + 1):
+            try:
+                with open(self._delta_path(version), "rb") as f:
+                    change = json.loads(f.read())
+            except (OSError, ValueError):
+                return None
+            if change.get("base") != version - 1: return None
+            changes.append(change)
+        merged = merge_changes(changes)
+        merged.update({"from_version": since, "version": current})
+        if len(self._changes_cache) > 64: self._changes_cache = {}
+        self._changes_cache[key] = merged
+        return merged
@@ -0,0 +1,155 @@
+"""
+Coordinador single-flight de la sincronización.
+
+Todas las entradas (bucle automático, /api/products?sync=true, scripts) piden
+la sincronización acá en vez de llamar a la corrida directamente:
+
+- si ya hay una corrida en curso, el pedido se suma a ella y recibe el mismo
+  SyncJob (y el mismo resultado); un pedido "full" sobre una incremental en
+  curso queda encolado como una única corrida completa a continuación;
+- un pedido manual que llega menos de `manual_debounce` segundos después de
+  terminar otra corrida exitosa devuelve esa corrida en lugar de repetirla (los
+  de arranque en frío, aunque haya fallado: no se reintenta en cada request);
+- cada SyncJob expone estado, fase actual y fases terminadas/total, y se
+  puede esperar desde cualquier event loop (concurrent.futures.Future).
+
+El chequeo y el alta del job se hacen bajo un threading.Lock, así dos pedidos
+simultáneos (incluso desde hilos distintos) no pueden arrancar dos corridas.
+"""
+
+import asyncio
+import concurrent.futures
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+JOB_HISTORY = 20
+
+
+class SyncJob:
+    _ids = itertools.count(1)
+
+    def __init__(self, mode, source):
+        self.id = next(SyncJob._ids)
+        self.mode = mode  # "full" | "incremental"
+        self.source = source  # "auto" | "manual" | "script" | "cold" (first request without a snapshot)
+        self.state = "queued"  # queued -> running -> ok | error | skipped
+        self.phase, self.done, self.total = None, 0, 0
+        self.requests = 1  # callers coalesced onto this job
+        self.created_at = datetime.now().isoformat()
+        self.started_at = self.finished_at = None
+        self.finished_ts = None  # monotonic
+        self.error = None
+        self.future = concurrent.futures.Future()
+        self.task = None
+
+    @property
+    def finished(self):
+        return self.future.done()
+
+    def progress(self, phase, done, total):
+        self.phase, self.done, self.total = phase, done, total
+
+    async def wait(self):
+        """Resultado de la corrida (None si falló o se saltó); se puede esperar desde cualquier loop."""
+        return await asyncio.wrap_future(self.future)
+
+    def to_dict(self):
+        return {"id": self.id, "mode": self.mode, "source": self.source, "state": self.state, "phase": self.phase,
+                "done": self.done, "total": self.total, "requests": self.requests, "created_at": self.created_at,
+                "started_at": self.started_at, "finished_at": self.finished_at, "error": self.error}
+
+
+class SyncCoordinator:
+    def __init__(self, run, manual_debounce=60):
+        """
+        `run(job)` es la corrutina que sincroniza: devuelve el resultado o None, y
+        puede dejar job.state en "error" / "skipped" con job.error.
+        """
+        self._run = run
+        self.manual_debounce = manual_debounce
+        self._lock = threading.Lock()
+        self._current = None
+        self._queued = None
+        self._last = None
+        self._history = deque(maxlen=JOB_HISTORY)
+
+    @property
+    def running(self):
+        return self._current is not None
+
+    @property
+    def current(self):
+        return self._current
+
+    @property
+    def last_finished_ts(self):
+        return self._last.finished_ts if self._last else None
+
+    def job(self, job_id):
+        with self._lock:
+            for job in (self._current, self._queued, *self._history):
+                if job is not None and job.id == job_id: return job
+        return None
+
+    def jobs(self):
+        with self._lock:
+            return [job.to_dict() for job in (self._current, self._queued, *reversed(self._history)) if job is not None]
+
+    def request(self, full=False, source="manual"):
+        """SyncJob que atiende el pedido: el que está en curso, uno encolado, el recién terminado o uno nuevo."""
+        mode = "full" if full else "incremental"
+        with self._lock:
+            current = self._current
+            if current is not None:
+                if current.mode == "full" or not full:
+                    current.requests += 1
+                    return current
+                # Full requested while an incremental runs: one full run afterwards, shared by every such request
+                if self._queued is None:
+                    self._queued = SyncJob(mode, source)
+                else:
+                    self._queued.requests += 1
+                return self._queued
+            last = self._last
+            if (source in ("manual", "cold") and last is not None and (last.state == "ok" or source == "cold") and (last.mode == "full" or not full)
+                    and time.monotonic() - last.finished_ts < self.manual_debounce):
+                logger.info(f"Sync coordinator: {source} sync debounced onto job {last.id} (finished {time.monotonic() - last.finished_ts:.0f}s ago)")
+                last.requests += 1
+                return last
+            job = self._current = SyncJob(mode, source)
+        self._start(job)
+        return job
+
+    async def run(self, full=False, source="manual"):
+        """Pide la sincronización y espera su resultado."""
+        return await self.request(full, source).wait()
+
+    def _start(self, job):
+        job.state, job.started_at = "running", datetime.now().isoformat()
+        logger.info(f"Sync coordinator: job {job.id} started ({job.mode}, {job.source})")
+        job.task = asyncio.get_running_loop().create_task(self._execute(job), name=f"sync-job-{job.id}")
+
+    async def _execute(self, job):
+        result = None
+        try:
+            result = await self._run(job)
+            # The run may have set its own outcome (error with its message, skipped)
+            if job.state == "running": job.state = "ok" if result is not None else "error"
+        except Exception as e:
+            job.state, job.error = "error", str(e)
+            logger.error(f"Sync coordinator: job {job.id} failed: {e}")
+        finally:
+            job.finished_at, job.finished_ts = datetime.now().isoformat(), time.monotonic()
+            with self._lock:
+                self._current, self._last = None, job
+                self._history.append(job)
+                queued, self._queued = self._queued, None
+                if queued is not None: self._current = queued
+            job.future.set_result(result)
+            if queued is not None: self._start(queued)
@@ -0,0 +1,93 @@
+"""
+Canal push del estado de sincronización (Server-Sent Events en /api/events).
+
+La sincronización publica eventos (inicio, avance por fase, versiones parciales
+del arranque en frío, versión nueva del snapshot, error, próxima sincronización)
+en un SyncEventBus; cada cliente conectado tiene una cola propia en el event
+loop del servidor. Al conectarse recibe primero el estado vigente ("status"),
+así sabe si su versión quedó vieja sin pedir el snapshot.
+
+publish() se puede llamar desde cualquier hilo (el ensamblado corre con
+asyncio.to_thread). Un cliente lento no frena a nadie: si su cola se llena se
+descartan sus eventos más viejos.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 64
+HEARTBEAT_SECONDS = 15
+RETRY_MS = 5000
+
+
+def format_sse(event_id, event, data):
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class SyncEventBus:
+    def __init__(self):
+        self._subscribers = {}  # queue -> event loop that owns it
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.state = {"is_syncing": False, "phase": None, "version": None, "next_sync": None}
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def status(self):
+        """(id, "status", estado vigente): primer mensaje de cada suscripción."""
+        with self._lock:
+            return next(self._ids), "status", dict(self.state)
+
+    def publish(self, event, state=None, **data):
+        """Actualiza el estado vigente con `state` y envía `event` (con estado + data) a todos los clientes."""
+        with self._lock:
+            if state: self.state.update(state)
+            message = (next(self._ids), event, dict(self.state, **data))
+            subscribers = list(self._subscribers.items())
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, message)
+            except RuntimeError:
+                # Loop closed (process shutting down or a script's asyncio.run finished)
+                self.unsubscribe(queue)
+
+    @staticmethod
+    def _offer(queue, message):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(message)
+
+    async def stream(self, request, watch=None):
+        """
+        Generador de texto SSE para una conexión. `watch()` (opcional) se llama en
+        cada latido y devuelve eventos a emitir, para cambios hechos por otro proceso.
+        """
+        queue = self.subscribe()
+        try:
+            yield f"retry: {RETRY_MS}\n" + format_sse(*self.status())
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected(): break
+                    if watch:
+                        for event, state in watch():
+                            self.publish(event, state)
+                    yield ": ping\n\n"
+                    continue
+                yield format_sse(*message)
+        finally:
+            self.unsubscribe(queue)
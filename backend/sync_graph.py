@@ -0,0 +1,93 @@
+"""
+Grafo de tareas asíncronas con dependencias explícitas para la sincronización.
+
+Cada nodo es una corrutina `fn(ctx)` que recibe el diccionario con los
+resultados de los nodos ya terminados (ctx[nombre]) y devuelve su propio
+resultado. Un nodo arranca en cuanto terminan sus dependencias, de modo que
+las fases independientes se solapan al máximo. Se registra el tiempo de cada
+nodo y la ruta crítica del ciclo; `on_progress(nombre, terminados, total)`
+se llama al terminar cada nodo.
+"""
+
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SyncGraph:
+    def __init__(self, name="sync", on_progress=None):
+        self.name = name
+        self.on_progress = on_progress
+        self.nodes = {}  # name -> (fn, deps)
+        self.timings = {}  # name -> {"start", "end", "duration"} in seconds from run start
+
+    def add(self, name, fn, deps=()):
+        if name in self.nodes:
+            raise ValueError(f"Duplicate node '{name}'")
+        self.nodes[name] = (fn, tuple(deps))
+
+    def node(self, name, deps=()):
+        """Decorador: registra la corrutina como nodo `name` con sus dependencias."""
+        def register(fn):
+            self.add(name, fn, deps)
+            return fn
+        return register
+
+    def _order(self):
+        order, state = [], {}
+        def visit(name, path):
+            if state.get(name) == "done": return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Cycle in sync graph: {' -> '.join(path + [name])}")
+            if name not in self.nodes:
+                raise ValueError(f"Unknown dependency '{name}' in sync graph")
+            state[name] = "visiting"
+            for dep in self.nodes[name][1]: visit(dep, path + [name])
+            state[name] = "done"
+            order.append(name)
+        for name in self.nodes: visit(name, [])
+        return order
+
+    async def run(self, ctx=None):
+        ctx = {} if ctx is None else ctx
+        tasks = {}
+        t0 = time.perf_counter()
+
+        async def run_node(name):
+            fn, deps = self.nodes[name]
+            if deps: await asyncio.gather(*(tasks[d] for d in deps))
+            start = time.perf_counter()
+            ctx[name] = await fn(ctx)
+            end = time.perf_counter()
+            self.timings[name] = {"start": round(start - t0, 3), "end": round(end - t0, 3), "duration": round(end - start, 3)}
+            if self.on_progress: self.on_progress(name, len(self.timings), len(self.nodes))
+
+        for name in self._order():
+            tasks[name] = asyncio.create_task(run_node(name), name=f"{self.name}:{name}")
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for t in tasks.values(): t.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return ctx
+
+    def critical_path(self):
+        """Cadena de nodos que determinó la duración total (siguiendo la dependencia que terminó última)."""
+        if not self.timings: return []
+        name = max(self.timings, key=lambda n: self.timings[n]["end"])
+        path = [name]
+        while True:
+            deps = [d for d in self.nodes[name][1] if d in self.timings]
+            if not deps: break
+            name = max(deps, key=lambda d: self.timings[d]["end"])
+            path.append(name)
+        return list(reversed(path))
+
+    def log_summary(self):
+        total = max((t["end"] for t in self.timings.values()), default=0)
+        for name, t in sorted(self.timings.items(), key=lambda kv: kv[1]["start"]):
+            logger.info(f"[{self.name}] {name}: start={t['start']:.2f}s duration={t['duration']:.2f}s")
+        logger.info(f"[{self.name}] total={total:.2f}s critical path: {' -> '.join(self.critical_path())}")
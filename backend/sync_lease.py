@@ -0,0 +1,91 @@
+"""
+Coordinación entre procesos para la sincronización (varios workers de uvicorn).
+
+Un único proceso, el líder, sincroniza contra Odoo y publica en el directorio
+de snapshots; el resto sólo sirve lo publicado (el sidecar current.json avisa
+la versión nueva). El liderazgo es un lock exclusivo de archivo (flock) sobre
+`sync.lock`: lo libera el sistema operativo si el proceso muere, así que no
+quedan leases huérfanos y un seguidor lo toma en su próximo intento.
+
+Los seguidores no sincronizan: un pedido manual (?sync=true) se deja como
+marca en `sync.request` y el líder lo atiende en su bucle.
+"""
+
+import logging
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class SyncLease:
+    def __init__(self, path):
+        self.path = path
+        self.request_path = os.path.join(os.path.dirname(path), "sync.request")
+        self._fd = None
+        self._request_seen = self._request_mtime()
+
+    @property
+    def is_leader(self):
+        return self._fd is not None
+
+    def try_acquire(self):
+        """Toma el liderazgo si está libre (no bloquea). True si este proceso es el líder."""
+        if self._fd is not None: return True
+        if fcntl is None:
+            # No flock (Windows): no cross-process coordination, run as a single process
+            self._fd = -1
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()} {time.time():.0f}\n".encode())
+        self._fd = fd
+        logger.info(f"Sync lease: process {os.getpid()} is the sync leader")
+        return True
+
+    def holder_alive(self):
+        """¿Hay algún proceso con el liderazgo? (True si es este mismo)."""
+        if self._fd is not None or fcntl is None: return self._fd is not None
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            return False
+        except OSError:
+            return True
+        finally:
+            os.close(fd)
+
+    def _request_mtime(self):
+        try:
+            return os.stat(self.request_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def request_sync(self, full=False):
+        """Pedido de sincronización de un seguidor para el líder."""
+        with open(self.request_path, "w") as f:
+            f.write("full\n" if full else "incremental\n")
+
+    def take_request(self):
+        """Pedido pendiente desde la última consulta: None, "full" o "incremental"."""
+        mtime = self._request_mtime()
+        if mtime is None or mtime == self._request_seen: return None
+        self._request_seen = mtime
+        try:
+            with open(self.request_path) as f:
+                return f.read().strip() or "incremental"
+        except OSError:
+            return None
@@ -0,0 +1,146 @@
+"""
+Métricas de sincronización y de llamadas a Odoo.
+
+- Cada llamada JSON-RPC registra modelo, método, tiempo, filas devueltas,
+  bytes de respuesta, reintentos y error (si lo hubo).
+- Las llamadas hechas durante una sincronización se asocian a ella mediante
+  un ContextVar (las tareas asyncio y asyncio.to_thread heredan el contexto).
+- Se conservan las últimas N sincronizaciones con sus fases y llamadas, y
+  contadores acumulados por modelo/método para Prometheus.
+"""
+
+import contextvars
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+SYNC_METRICS_HISTORY = 20
+
+_current = contextvars.ContextVar("sync_recorder", default=None)
+_history = deque(maxlen=SYNC_METRICS_HISTORY)
+_call_totals = {}  # (model, method) -> counters since process start
+_sync_totals = {"ok": 0, "error": 0}
+_lock = threading.Lock()
+
+
+class SyncRecorder:
+    def __init__(self, mode):
+        self.mode = mode
+        self.started_at = datetime.now().isoformat()
+        self._t0 = time.perf_counter()
+        self.calls = []
+        self.gave_up = {}  # model -> ids that could not be read
+        self._token = None
+
+    def add_call(self, call):
+        with _lock:
+            self.calls.append(call)
+
+
+def begin_sync(mode):
+    """Abre el registro de una sincronización y lo asocia al contexto actual."""
+    recorder = SyncRecorder(mode)
+    recorder._token = _current.set(recorder)
+    return recorder
+
+
+def end_sync(recorder, status, phases=None, critical_path=None, products=None):
+    duration = time.perf_counter() - recorder._t0
+    if recorder._token is not None:
+        _current.reset(recorder._token)
+        recorder._token = None
+    summary = {}
+    for c in recorder.calls:
+        s = summary.setdefault(f"{c['model']}.{c['method']}", {"count": 0, "seconds": 0.0, "rows": 0, "bytes": 0, "retries": 0, "errors": 0})
+        s["count"] += 1; s["seconds"] = round(s["seconds"] + c["seconds"], 3)
+        s["rows"] += c["rows"]; s["bytes"] += c["bytes"]; s["retries"] += c["retries"]
+        if c["error"]: s["errors"] += 1
+    record = {
+        "started_at": recorder.started_at, "finished_at": datetime.now().isoformat(),
+        "duration": round(duration, 3), "mode": recorder.mode, "status": status, "products": products,
+        "phases": phases or {}, "critical_path": critical_path or [],
+        "odoo_calls": summary, "gave_up": {m: len(ids) for m, ids in recorder.gave_up.items()}, "calls": recorder.calls
+    }
+    with _lock:
+        _history.append(record)
+        _sync_totals[status] = _sync_totals.get(status, 0) + 1
+    return record
+
+
+def record_call(model, method, seconds, rows, size, retries, error):
+    call = {"model": model, "method": method, "seconds": round(seconds, 4), "rows": rows, "bytes": size, "retries": retries, "error": error}
+    with _lock:
+        t = _call_totals.setdefault((model, method), {"count": 0, "seconds": 0.0, "rows": 0, "bytes": 0, "retries": 0, "errors": 0})
+        t["count"] += 1; t["seconds"] += seconds; t["rows"] += rows; t["bytes"] += size; t["retries"] += retries
+        if error: t["errors"] += 1
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.add_call(call)
+
+
+def record_gave_up(model, ids):
+    """Ids que una lectura masiva no pudo traer de Odoo en la sincronización actual."""
+    recorder = _current.get()
+    if recorder is not None and ids:
+        with _lock:
+            recorder.gave_up.setdefault(model, []).extend(ids)
+
+
+def history(last=None, include_calls=False):
+    with _lock:
+        items = list(_history)
+    if last: items = items[-last:]
+    if not include_calls:
+        items = [{k: v for k, v in r.items() if k != "calls"} for r in items]
+    return items
+
+
+def call_totals():
+    with _lock:
+        return {f"{m}.{meth}": {**t, "seconds": round(t["seconds"], 3)} for (m, meth), t in _call_totals.items()}
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def render_prometheus():
+    """Exposición en formato de texto de Prometheus."""
+    lines = []
+    with _lock:
+        totals = dict(_call_totals)
+        last = _history[-1] if _history else None
+        sync_totals = dict(_sync_totals)
+
+    counters = [
+        ("stockpro_odoo_calls_total", "count", "Odoo JSON-RPC calls"),
+        ("stockpro_odoo_call_seconds_total", "seconds", "Wall time spent in Odoo calls"),
+        ("stockpro_odoo_call_rows_total", "rows", "Rows returned by Odoo calls"),
+        ("stockpro_odoo_call_bytes_total", "bytes", "Response bytes received from Odoo"),
+        ("stockpro_odoo_call_retries_total", "retries", "Odoo call retries"),
+        ("stockpro_odoo_call_errors_total", "errors", "Odoo calls that failed"),
+    ]
+    for name, key, help_text in counters:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for (model, method), t in sorted(totals.items()):
+            lines.append(f'{name}{{model="{_label(model)}",method="{_label(method)}"}} {t[key]}')
+
+    lines.append("# HELP stockpro_syncs_total Finished syncs by status")
+    lines.append("# TYPE stockpro_syncs_total counter")
+    for status, n in sorted(sync_totals.items()):
+        lines.append(f'stockpro_syncs_total{{status="{_label(status)}"}} {n}')
+
+    if last:
+        lines.append("# HELP stockpro_last_sync_duration_seconds Duration of the last sync")
+        lines.append("# TYPE stockpro_last_sync_duration_seconds gauge")
+        lines.append(f'stockpro_last_sync_duration_seconds{{mode="{_label(last["mode"])}",status="{_label(last["status"])}"}} {last["duration"]}')
+        lines.append("# HELP stockpro_last_sync_phase_seconds Duration of each phase in the last sync")
+        lines.append("# TYPE stockpro_last_sync_phase_seconds gauge")
+        for phase, t in last["phases"].items():
+            lines.append(f'stockpro_last_sync_phase_seconds{{phase="{_label(phase)}"}} {t["duration"]}')
+        lines.append("# HELP stockpro_last_sync_timestamp_seconds Unix time when the last sync finished")
+        lines.append("# TYPE stockpro_last_sync_timestamp_seconds gauge")
+        lines.append(f"stockpro_last_sync_timestamp_seconds {datetime.fromisoformat(last['finished_at']).timestamp():.0f}")
+    return "\n".join(lines) + "\n"
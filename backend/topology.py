@@ -0,0 +1,177 @@
+"""
+Registro en caché de la topología de Odoo: almacenes, ubicaciones internas y
+de cliente, tipos de operación y etiquetas de producto.
+
+Estos datos cambian muy rara vez, así que se guardan en memoria y en disco con
+los índices ya calculados (ubicación -> almacén, tipo de operación -> almacén,
+ubicaciones por almacén). Se relee de Odoo cuando:
+
+- pasa TOPOLOGY_TTL_HOURS desde la última carga, o
+- el chequeo liviano (cada TOPOLOGY_CHECK_MINUTES) detecta cambios: un
+  read_group sin agrupar por modelo devuelve cantidad de registros y último
+  write_date, y se compara con la huella guardada.
+
+La sincronización, /api/movements y los endpoints de análisis comparten la
+misma instancia sin idas y vueltas extra a Odoo.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import weakref
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# (model, domain) whose count + last write_date form the change fingerprint
+FINGERPRINT_MODELS = [
+    ("stock.warehouse", []),
+    ("stock.location", [('usage', 'in', ['internal', 'customer'])]),
+    ("stock.picking.type", []),
+    ("product.tag", []),
+]
+
+
+def build_indexes(raw):
+    """Índices de la sincronización a partir de las respuestas crudas de Odoo (misma lógica que el discovery original)."""
+    warehouses, locations_int = raw["warehouses"], raw["locations_int"]
+    pts, tags_res = raw["pts"], raw["tags"]
+
+    tag_map = {t['id']: t['name'] for t in tags_res}
+    wh_map = {wh['id']: wh for wh in warehouses}
+    # Improved Keyword Map: map 'ACHUMANI' -> wh_id
+    wh_keywords = {}
+    for wh_id, wh in wh_map.items():
+        name = wh['name'].upper()
+        # Extract distinctive part (after ANDYS)
+        clean = name.replace("ANDYS", "").strip()
+        if clean:
+            wh_keywords[clean.split()[0]] = wh_id
+        wh_keywords[wh['code'].upper()] = wh_id
+
+    # Picking types explicitly linked to a warehouse (same semantics as order_id.picking_type_id.warehouse_id)
+    pt_wh_explicit = {pt['id']: pt['warehouse_id'][0] for pt in pts if pt.get('warehouse_id')}
+    pt_to_wh = {}
+    for pt in pts:
+        if pt.get('warehouse_id'):
+            pt_to_wh[pt['id']] = pt['warehouse_id'][0]
+            continue
+        pt_name = (pt.get('name') or '').upper()
+        # Try keyword matching (e.g., if 'ACHUMANI' is in 'PoS Orders Achumani'), then prefix matching
+        wh_id = next((wid for kw, wid in wh_keywords.items() if kw in pt_name), None)
+        if wh_id is None:
+            wh_id = next((wid for wid, wh in wh_map.items() if wh['code'].upper() in pt_name), None)
+        if wh_id is not None:
+            pt_to_wh[pt['id']] = wh_id
+
+    internal_loc_ids = [l['id'] for l in locations_int]
+    loc_to_wh = {}
+    for l in locations_int:
+        if l.get('warehouse_id'):
+            loc_to_wh[l['id']] = l['warehouse_id'][0]
+        else:
+            l_name = l['complete_name'].upper()
+            wh_id = next((wid for kw, wid in wh_keywords.items() if kw in l_name), None)
+            if wh_id is not None:
+                loc_to_wh[l['id']] = wh_id
+
+    wh_locations = {}
+    for lid, wh_id in loc_to_wh.items():
+        wh_locations.setdefault(wh_id, []).append(lid)
+
+    return {"warehouses": warehouses, "wh_map": wh_map, "tag_map": tag_map, "customer_loc_ids": raw["customer_loc_ids"],
+            "internal_loc_ids": internal_loc_ids, "loc_to_wh": loc_to_wh, "pt_to_wh": pt_to_wh, "pt_wh_explicit": pt_wh_explicit,
+            "wh_locations": wh_locations}
+
+
+class TopologyRegistry:
+    def __init__(self, path, ttl_hours=24, check_minutes=30):
+        self.path = path
+        self.ttl = timedelta(hours=ttl_hours)
+        self.check_every = timedelta(minutes=check_minutes)
+        self._data = None  # indexes (build_indexes)
+        self._raw = None
+        self._fingerprint = None
+        self._loaded_at = None
+        self._checked_at = None
+        self._locks = weakref.WeakKeyDictionary()  # event loop -> asyncio.Lock (the sync may run in its own loop)
+        self._load_file()
+
+    def _load_file(self):
+        if not os.path.exists(self.path): return
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+            self._raw, self._fingerprint = saved["raw"], saved["fingerprint"]
+            self._loaded_at = datetime.fromisoformat(saved["loaded_at"])
+            self._data = build_indexes(self._raw)
+            logger.info(f"Topology: loaded from {self.path} ({len(self._data['warehouses'])} warehouses, {len(self._data['loc_to_wh'])} locations)")
+        except Exception as e:
+            logger.warning(f"Topology: could not load {self.path}: {e}")
+
+    def _save_file(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"raw": self._raw, "fingerprint": self._fingerprint, "loaded_at": self._loaded_at.isoformat()}, f)
+        os.replace(tmp, self.path)
+
+    def current(self):
+        """Última topología conocida (sin consultar a Odoo), o None."""
+        return self._data
+
+    def warehouses(self):
+        return self._data["warehouses"] if self._data else []
+
+    def warehouse_name(self, wh_id):
+        wh = self._data["wh_map"].get(int(wh_id)) if self._data and str(wh_id).isdigit() else None
+        return wh['name'] if wh else None
+
+    async def _fetch_fingerprint(self, client):
+        groups = await asyncio.gather(*[client.call_kw(model, "read_group", [domain, ['write_date:max'], []], {"lazy": False})
+                                        for model, domain in FINGERPRINT_MODELS])
+        if any(g is None for g in groups): return None
+        return {model: [g[0].get('__count', 0), g[0].get('write_date')] if g else [0, None]
+                for (model, _), g in zip(FINGERPRINT_MODELS, groups)}
+
+    async def _fetch(self, client):
+        warehouses, locations_int, customer_loc_ids, pts, tags_res, fingerprint = await asyncio.gather(
+            client.call_kw("stock.warehouse", "search_read", [], {"fields": ["id", "name", "code", "lot_stock_id"]}),
+            client.call_kw("stock.location", "search_read", [[('usage', '=', 'internal')]], {"fields": ["id", "warehouse_id", "complete_name"]}),
+            client.call_kw("stock.location", "search", [[('usage', '=', 'customer')]]),
+            client.call_kw("stock.picking.type", "search_read", [], {"fields": ["id", "name", "warehouse_id"]}),
+            client.call_kw("product.tag", "search_read", [], {"fields": ["id", "name"]}),
+            self._fetch_fingerprint(client)
+        )
+        if warehouses is None or locations_int is None or customer_loc_ids is None or pts is None:
+            return False
+        self._raw = {"warehouses": warehouses, "locations_int": locations_int, "customer_loc_ids": customer_loc_ids,
+                     "pts": pts, "tags": tags_res or []}
+        self._data = build_indexes(self._raw)
+        self._fingerprint = fingerprint
+        self._loaded_at = self._checked_at = datetime.now()
+        try:
+            self._save_file()
+        except OSError as e:
+            logger.warning(f"Topology: could not save {self.path}: {e}")
+        logger.info(f"Topology: reloaded from Odoo (WH={len(warehouses)}, LocInt={len(locations_int)}, LocCust={len(customer_loc_ids)}, PTs={len(pts)})")
+        return True
+
+    async def get(self, client, force=False):
+        """
+        Topología vigente: la de caché si está dentro del TTL y el chequeo de huella
+        no detectó cambios; si no, se relee de Odoo. Si Odoo falla se sigue sirviendo la última conocida.
+        """
+        lock = self._locks.setdefault(asyncio.get_running_loop(), asyncio.Lock())
+        async with lock:
+            now = datetime.now()
+            reload = force or self._data is None or self._loaded_at is None or now - self._loaded_at > self.ttl
+            if not reload and (self._checked_at is None or now - self._checked_at > self.check_every):
+                fingerprint = await self._fetch_fingerprint(client)
+                self._checked_at = now
+                if fingerprint is not None and fingerprint != self._fingerprint:
+                    logger.info("Topology: change detected in Odoo reference data")
+                    reload = True
+            if reload and not await self._fetch(client):
+                logger.warning("Topology: reload from Odoo failed, serving the last known topology")
+            return self._data
@@ -12,6 +12,7 @@ import { motion, AnimatePresence } from 'framer-motion'
 import { clsx, type ClassValue } from 'clsx'
 import { twMerge } from 'tailwind-merge'
 import Login from './Login'
+import { COLUMNAR_MEDIA_TYPE, decodeColumnar } from './columnar'
 
 // --- Utility: cn ---
 function cn(...inputs: ClassValue[]) {
@@ -2208,6 +2209,7 @@ function App() {
   }, [])
 
   const [initialLoad, setInitialLoad] = useState(true)
+  const loadedVersionRef = useRef<string | null>(null)
   const fetchProducts = useCallback((forceSync: boolean = false) => {
     if (forceSync || initialLoad) setLoading(true)
     const url = forceSync ? '/api/products?sync=true' : '/api/products'
@@ -2218,18 +2220,22 @@ function App() {
       console.log("📦 Cargando datos de productos desde el caché...");
     }
 
-    fetch(url)
+    fetch(url, { headers: { Accept: `${COLUMNAR_MEDIA_TYPE}, application/json` } })
       .then(async r => {
         const h_next = r.headers.get("X-Next-Sync");
         const h_sync = r.headers.get("X-Is-Syncing");
         const h_last = r.headers.get("X-Last-Update");
-        const data = await r.json();
+        const h_version = r.headers.get("X-Snapshot-Version");
+        if (h_version) loadedVersionRef.current = h_version;
+        const isColumnar = (r.headers.get("Content-Type") || '').startsWith(COLUMNAR_MEDIA_TYPE);
+        const data = isColumnar ? decodeColumnar(await r.arrayBuffer()) : await r.json();
         return { data, h_next, h_sync, h_last };
       })
       .then(({ data, h_next, h_sync, h_last }) => {
-        if (data.status === 'syncing') {
-          setIsSyncing(true)
-          console.log("⏳ El servidor ya está sincronizando. Reintentando en unos segundos...");
+        if (data.status === 'syncing' || data.status === 'debounced') {
+          // Sync accepted (or just finished): progress and the new version arrive over /api/events
+          setIsSyncing(data.is_syncing)
+          console.log(`⏳ ${data.message}`);
           if (data.products) {
             setLastUpdate(data.last_update)
             setNextSync(data.next_sync)
@@ -2245,7 +2251,6 @@ function App() {
             setProducts(loaded)
           }
           setLoading(false)
-          setTimeout(() => fetchProducts(false), 20000)
           return
         }
 
@@ -2258,7 +2263,6 @@ function App() {
 
         if (serverIsSyncing) {
           console.log("⏳ El backend reporta sincronización en curso (background)...")
-          setTimeout(() => fetchProducts(false), 10000)
         }
         console.log(`✅ Datos recibidos: ${data.products?.length || 0} productos. Última sincro: ${effectiveLastUpdate}`);
         setLastUpdate(effectiveLastUpdate)
@@ -2295,6 +2299,60 @@ function App() {
     }
   }, [isAuthenticated, fetchProducts])
 
+  // New version announced: apply only what changed since the loaded one (X-Delta: partial).
+  // The full download is the fallback when the server answers X-Delta: full (version too old or unknown).
+  const fetchChanges = useCallback(() => {
+    const since = loadedVersionRef.current
+    if (!since) {
+      fetchProducts(false)
+      return
+    }
+    fetch(`/api/products/changes?since=${encodeURIComponent(since)}`)
+      .then(async r => {
+        if (!r.ok || r.headers.get("X-Delta") !== 'partial') {
+          r.body?.cancel()
+          fetchProducts(false)
+          return
+        }
+        const delta = await r.json()
+        // Another load landed meanwhile: the delta no longer applies to what is on screen
+        if (String(delta.from_version) !== loadedVersionRef.current) {
+          fetchProducts(false)
+          return
+        }
+        const toProduct = (p: any): Product => ({
+          ...p,
+          currentStock: p.total_stock,
+          currentSales: p.sales_30d,
+          currentPending: p.total_pending,
+          currentStatus: p.total_stock <= 0 ? 'Sin Stock' : 'Normal'
+        })
+        const removed = new Set<number>(delta.removed)
+        const modified = new Map<number, any>(delta.modified.map((m: any) => [m.id, m]))
+        setProducts(prev => {
+          const next: Product[] = []
+          for (const p of prev) {
+            if (removed.has(p.id)) continue
+            const m = modified.get(p.id)
+            next.push(m ? toProduct({ ...p, ...m }) : p)
+          }
+          for (const p of delta.added) next.push(toProduct(p))
+          return next
+        })
+        const fields = delta.fields || {}
+        if ('last_update' in fields) setLastUpdate(fields.last_update)
+        if ('global_stats' in fields) setGlobalStats(fields.global_stats)
+        if ('abc_summary' in fields) setAbcSummary(fields.abc_summary)
+        if ('warehouses' in fields) setWarehouses([{ id: null, name: 'VISTA GLOBAL' }, ...(fields.warehouses || [])])
+        loadedVersionRef.current = String(delta.version)
+        console.log(`✅ v${delta.from_version} → v${delta.version}: ${delta.added.length} nuevos, ${delta.modified.length} modificados, ${delta.removed.length} quitados`)
+      })
+      .catch(err => {
+        console.error("❌ Error al cargar cambios, descargando todo:", err)
+        fetchProducts(false)
+      })
+  }, [fetchProducts])
+
   // Track if user has active unsaved work to prevent interrupts
   const hasActiveWorkRef = useRef(false)
   useEffect(() => {
@@ -2303,29 +2361,48 @@ function App() {
     hasActiveWorkRef.current = ((currentView === 'transfers' || currentView === 'ml') && hasQty) || hasStaged
   }, [currentView, transferQuantities, stagedGlobalTransfers])
 
-  // Timer to refresh countdown and handle auto-polling
+  // Push channel: the server announces sync start/progress/completion; data is only re-fetched when the version changes
+  const pendingVersionRef = useRef<string | null>(null)
+  const fetchChangesRef = useRef(fetchChanges)
+  fetchChangesRef.current = fetchChanges
   useEffect(() => {
-    const interval = setInterval(() => {
-      setTimer(t => t + 1)
-
-      // Auto-poll if next sync time is reached
-      if (nextSync && !loading && !isSyncing && isAuthenticated) {
+    if (!isAuthenticated) return
+    const source = new EventSource('/api/events')
+    const onState = (e: MessageEvent) => {
+      const state = JSON.parse(e.data)
+      setIsSyncing(state.is_syncing)
+      setNextSync(state.next_sync)
+      const version = state.version == null ? null : String(state.version)
+      // On connect ('status') the initial load may still be in flight: only newer versions seen after a load count
+      if (version && version !== loadedVersionRef.current && (loadedVersionRef.current || e.type !== 'status')) {
+        pendingVersionRef.current = version
         // Prevent auto-refresh if user is actively building a transfer
         if (hasActiveWorkRef.current) {
           console.log("⏸️ Auto-sync paused due to active transfer work.")
           return
         }
+        console.log(`🔔 Nueva versión del snapshot (v${version}). Actualizando datos...`)
+        pendingVersionRef.current = null
+        fetchChangesRef.current()
+      }
+    }
+    for (const name of ['status', 'sync_start', 'sync_progress', 'snapshot', 'sync_complete', 'sync_error', 'schedule']) {
+      source.addEventListener(name, onState as EventListener)
+    }
+    return () => source.close()
+  }, [isAuthenticated])
 
-        const now = new Date();
-        const next = new Date(nextSync);
-        if (next.getTime() - now.getTime() <= -5000) { // 5s grace period
-          console.log("⏰ Sync time reached. Refreshing data...");
-          fetchProducts(false);
-        }
+  // Timer to refresh countdown; applies a version announced while the user had active work
+  useEffect(() => {
+    const interval = setInterval(() => {
+      setTimer(t => t + 1)
+      if (pendingVersionRef.current && !loading && !hasActiveWorkRef.current) {
+        pendingVersionRef.current = null
+        fetchChanges()
       }
     }, 30000) // Check every 30s
     return () => clearInterval(interval)
-  }, [nextSync, loading, isSyncing, isAuthenticated, fetchProducts])
+  }, [loading, fetchChanges])
 
   // Filters Visibility Logic
   const hasActiveFilters = useMemo(() => {
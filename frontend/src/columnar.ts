@@ -0,0 +1,88 @@
+// Decodificador del snapshot columnar binario (layout documentado en backend/columnar.py).
+// Las columnas numéricas son TypedArrays sobre el mismo ArrayBuffer de la respuesta, sin copias.
+
+export const COLUMNAR_MEDIA_TYPE = 'application/x-stockpro-columnar'
+
+type Dtype = 'f64' | 'i32' | 'u8' | 'u16' | 'u32'
+type BufferRef = { dtype: Dtype, offset: number, count: number }
+type Column = {
+  name: string
+  kind: 'f64' | 'i32' | 'dict' | 'dict_list' | 'matrix' | 'struct_matrix' | 'json'
+  [key: string]: any
+}
+
+const MAGIC = 'SPCOL1\0\0'
+const ARRAYS = { f64: Float64Array, i32: Int32Array, u8: Uint8Array, u16: Uint16Array, u32: Uint32Array }
+
+export function decodeColumnar(buffer: ArrayBuffer): any {
+  const bytes = new Uint8Array(buffer)
+  if (String.fromCharCode(...bytes.subarray(0, 8)) !== MAGIC) throw new Error('not a stockpro columnar snapshot')
+  const headerLen = new DataView(buffer).getUint32(8, true)
+  const utf8 = new TextDecoder()
+  const header = JSON.parse(utf8.decode(bytes.subarray(12, 12 + headerLen)))
+  const base = 12 + headerLen
+  const n: number = header.rows
+  const whs: string[] = header.warehouses
+  const w = whs.length
+
+  // Buffers are 8-byte aligned inside the data section, so typed views need no copy
+  const view = (ref: BufferRef): any => new ARRAYS[ref.dtype](buffer, base + ref.offset, ref.count)
+
+  const decoder = (col: Column): ((i: number) => any) => {
+    switch (col.kind) {
+      case 'f64':
+      case 'i32': {
+        const values = view(col.values)
+        const present = col.present ? view(col.present) : null
+        return i => (present && !present[i] ? null : values[i])
+      }
+      case 'dict': {
+        const codes = view(col.codes), dictionary = col.dictionary
+        return i => dictionary[codes[i]]
+      }
+      case 'dict_list': {
+        const offsets = view(col.offsets), codes = view(col.codes), dictionary = col.dictionary
+        return i => Array.from(codes.subarray(offsets[i], offsets[i + 1]), (c: number) => dictionary[c])
+      }
+      case 'matrix': {
+        const values = view(col.values)
+        // Older files have no presence buffer: there only non-zero cells were keys
+        const present = col.present ? view(col.present) : values
+        return i => {
+          const row: Record<string, number> = {}
+          for (let j = 0; j < w; j++) if (present[i * w + j]) row[whs[j]] = values[i * w + j]
+          return row
+        }
+      }
+      case 'struct_matrix': {
+        const present = view(col.present)
+        const subs = Object.entries(col.fields).map(([sub, f]: [string, any]) =>
+          [sub, f.kind === 'f64' ? view(f.values) : view(f.codes), f.kind === 'f64' ? null : f.dictionary] as const)
+        return i => {
+          const row: Record<string, any> = {}
+          for (let j = 0; j < w; j++) {
+            const cell = i * w + j
+            if (!present[cell]) continue
+            const entry: Record<string, any> = {}
+            for (const [sub, arr, dictionary] of subs) entry[sub] = dictionary ? dictionary[arr[cell]] : arr[cell]
+            row[whs[j]] = entry
+          }
+          return row
+        }
+      }
+      default: {
+        const offsets = view(col.offsets), data = view(col.data)
+        return i => JSON.parse(utf8.decode(data.subarray(offsets[i], offsets[i + 1])))
+      }
+    }
+  }
+
+  const decoders = (header.columns as Column[]).map(col => [col.name, decoder(col)] as const)
+  const products = new Array(n)
+  for (let i = 0; i < n; i++) {
+    const p: Record<string, any> = {}
+    for (const [name, decode] of decoders) p[name] = decode(i)
+    products[i] = p
+  }
+  return { ...header.fields, products }
+}